@@ -5,6 +5,8 @@ from .api import (
     ResizingMethod,
     RoomPreset,
     RoomVisibility,
+    SlidingSyncList,
+    SlidingSyncRoomSubscription,
 )
 from .client import *
 from .event_builders import *
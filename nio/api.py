@@ -27,6 +27,7 @@ import json
 import os
 from collections import defaultdict
 from collections.abc import Iterable
+from dataclasses import dataclass, field
 from enum import Enum, unique
 from typing import (
     TYPE_CHECKING,
@@ -41,6 +42,8 @@ from typing import (
 )
 from uuid import UUID
 
+from . import json_backend
+
 if TYPE_CHECKING:
     from .events.account_data import PushAction, PushCondition
 
@@ -54,6 +57,7 @@ except ImportError:
 
 MATRIX_API_PATH: str = "/_matrix/client/r0"
 MATRIX_MEDIA_API_PATH: str = "/_matrix/media/r0"
+SLIDING_SYNC_API_PATH: str = "/_matrix/client/unstable/org.matrix.simplified_msc3575"
 
 _FilterT = Union[None, str, Dict[Any, Any]]
 
@@ -131,6 +135,59 @@ class PushRuleKind(Enum):
     underride = "underride"
 
 
+@dataclass
+class SlidingSyncRoomSubscription:
+    """The data that a sliding sync should return for a room.
+
+    Attributes:
+        required_state (List[Tuple[str, str]]): The state events that should
+            be returned as pairs of event type and state key. The state key
+            can be "*" for all state keys of the type, "$ME" for our own user
+            id and "$LAZY" for the members needed to display the timeline.
+        timeline_limit (int): The maximum number of timeline events that
+            should be returned.
+    """
+
+    required_state: List[Tuple[str, str]] = field(default_factory=list)
+    timeline_limit: int = 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Convert the subscription into a dict for the request body."""
+        return {
+            "required_state": [list(pair) for pair in self.required_state],
+            "timeline_limit": self.timeline_limit,
+        }
+
+
+@dataclass
+class SlidingSyncList(SlidingSyncRoomSubscription):
+    """A window of the sorted room list that a sliding sync should return.
+
+    The rooms are sorted by their most recent activity. Only the rooms that
+    are inside one of the ranges are returned, a list can be paged through by
+    moving its ranges.
+
+    Attributes:
+        ranges (List[Tuple[int, int]]): The windows of the list that should
+            be returned, both ends are inclusive.
+        filters (Dict, optional): Filters for the rooms of the list, e.g.
+            ``{"is_dm": True}``.
+    """
+
+    ranges: List[Tuple[int, int]] = field(default_factory=lambda: [(0, 19)])
+    filters: Optional[Dict[str, Any]] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Convert the list into a dict for the request body."""
+        content = super().as_dict()
+        content["ranges"] = [list(window) for window in self.ranges]
+
+        if self.filters is not None:
+            content["filters"] = self.filters
+
+        return content
+
+
 class Api:
     """Matrix API class.
 
@@ -140,7 +197,7 @@ class Api:
     @staticmethod
     def to_json(content_dict: Dict[Any, Any]) -> str:
         """Turn a dictionary into a json string."""
-        return json.dumps(content_dict, separators=(",", ":"))
+        return json_backend.dumps(content_dict)
 
     @staticmethod
     def to_canonical_json(content_dict: Dict[Any, Any]) -> str:
@@ -547,6 +604,64 @@ class Api:
 
         return "GET", Api._build_path(["sync"], query_parameters)
 
+    @staticmethod
+    def sliding_sync(
+        access_token: str,
+        lists: Dict[str, Dict[str, Any]],
+        room_subscriptions: Optional[Dict[str, Dict[str, Any]]] = None,
+        extensions: Optional[Dict[str, Any]] = None,
+        pos: Optional[str] = None,
+        timeout: Optional[int] = None,
+        conn_id: Optional[str] = None,
+    ) -> Tuple[str, str, str]:
+        """Synchronise a window of the room list using sliding sync.
+
+        This is the simplified sliding sync of MSC4186, it returns only the
+        rooms inside the requested windows instead of all rooms.
+
+        Returns the HTTP method, HTTP path and data for the request.
+
+        Args:
+            access_token (str): The access token to be used with the request.
+            lists (Dict[str, Dict]): The room lists that should be returned,
+                see `SlidingSyncList.as_dict()`.
+            room_subscriptions (Dict[str, Dict], optional): Rooms that should
+                be returned independently of the lists, see
+                `SlidingSyncRoomSubscription.as_dict()`.
+            extensions (Dict, optional): The extensions that should be
+                enabled, e.g. to-device messages or receipts.
+            pos (str, optional): The position returned by the previous
+                request on this connection.
+            timeout (int, optional): The maximum time to wait, in
+                milliseconds, before returning this request.
+            conn_id (str, optional): The id of the connection, needed if the
+                client runs more than one sliding sync loop at a time.
+        """
+        query_parameters = {"access_token": access_token}
+
+        if pos:
+            query_parameters["pos"] = pos
+
+        if timeout is not None:
+            query_parameters["timeout"] = str(timeout)
+
+        content: Dict[str, Any] = {"lists": lists}
+
+        if room_subscriptions:
+            content["room_subscriptions"] = room_subscriptions
+
+        if extensions:
+            content["extensions"] = extensions
+
+        if conn_id:
+            content["conn_id"] = conn_id
+
+        return (
+            "POST",
+            Api._build_path(["sync"], query_parameters, SLIDING_SYNC_API_PATH),
+            Api.to_json(content),
+        )
+
     @staticmethod
     def room_send(
         access_token: str,
@@ -1293,6 +1408,41 @@ class Api:
 
         return "GET", Api._build_path(path, query_parameters)
 
+    @staticmethod
+    def room_get_members(
+        access_token: str,
+        room_id: str,
+        at: Optional[str] = None,
+        not_membership: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        """Get the membership events of a room.
+
+        Unlike joined_members() this returns the member events of the room,
+        including the ones of invited users.
+
+        Returns the HTTP method and HTTP path for the request.
+
+        Args:
+            access_token (str): The access token to be used with the request.
+            room_id (str): Room id of the room for which the members should
+                be fetched.
+            at (str, optional): A sync token, the members are returned as
+                they were at this point in time.
+            not_membership (str, optional): Exclude the members with this
+                membership, e.g. "leave".
+        """
+        query_parameters = {"access_token": access_token}
+
+        if at:
+            query_parameters["at"] = at
+
+        if not_membership:
+            query_parameters["not_membership"] = not_membership
+
+        path = ["rooms", room_id, "members"]
+
+        return "GET", Api._build_path(path, query_parameters)
+
     @staticmethod
     def joined_rooms(access_token: str) -> Tuple[str, str]:
         """Get the list of joined rooms for the logged in account.
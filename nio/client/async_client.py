@@ -14,18 +14,25 @@
 # CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 import asyncio
+import hashlib
 import io
-import json
 import logging
 import os
+import shutil
+import time
 import warnings
 from asyncio import Event as AsyncioEvent
+from collections import defaultdict
+from concurrent.futures import Executor
+from copy import deepcopy
 from dataclasses import dataclass
 from functools import partial, wraps
 from json.decoder import JSONDecodeError
 from pathlib import Path
 from typing import (
     Any,
+    AsyncIterable,
+    Awaitable,
     Callable,
     Coroutine,
     Dict,
@@ -54,7 +61,9 @@ from aiohttp import (
 from aiohttp.client_exceptions import ClientConnectionError
 from aiohttp.connector import Connection
 from aiohttp_socks import ProxyConnector
+from jsonschema.exceptions import SchemaError, ValidationError
 
+from .. import json_backend
 from ..api import (
     Api,
     EventFormat,
@@ -63,11 +72,15 @@ from ..api import (
     ResizingMethod,
     RoomPreset,
     RoomVisibility,
+    SlidingSyncList,
+    SlidingSyncRoomSubscription,
     _FilterT,
 )
 from ..crypto import (
+    ENCRYPTION_ENABLED,
     AsyncDataT,
     OlmDevice,
+    async_decrypt_attachment,
     async_encrypt_attachment,
     async_generator_from_data,
 )
@@ -83,9 +96,12 @@ from ..events import (
     ToDeviceEvent,
 )
 from ..exceptions import (
+    EncryptionError,
     LocalProtocolError,
+    OlmUnverifiedDeviceError,
     TransferCancelledError,
 )
+from ..json_stream import iter_json_items
 from ..monitors import TransferMonitor
 from ..responses import (
     ContentRepositoryConfigError,
@@ -159,12 +175,15 @@ from ..responses import (
     RoomForgetResponse,
     RoomGetEventError,
     RoomGetEventResponse,
+    RoomGetMembersError,
+    RoomGetMembersResponse,
     RoomGetStateError,
     RoomGetStateEventError,
     RoomGetStateEventResponse,
     RoomGetStateResponse,
     RoomGetVisibilityError,
     RoomGetVisibilityResponse,
+    RoomInfo,
     RoomInviteError,
     RoomInviteResponse,
     RoomKeyRequestError,
@@ -201,6 +220,8 @@ from ..responses import (
     SetPushRuleResponse,
     ShareGroupSessionError,
     ShareGroupSessionResponse,
+    SlidingSyncError,
+    SlidingSyncResponse,
     SpaceGetHierarchyError,
     SpaceGetHierarchyResponse,
     SyncError,
@@ -219,8 +240,19 @@ from ..responses import (
     WhoamiError,
     WhoamiResponse,
 )
+from ..rooms import MatrixRoom
+from ..schemas import Schemas, validate_json
 from . import Client, ClientConfig
-from .base_client import ClientCallback, logged_in_async, store_loaded
+from .base_client import (
+    CallbackList,
+    ClientCallback,
+    logged_in_async,
+    route_callbacks,
+    store_loaded,
+)
+
+if ENCRYPTION_ENABLED:
+    from ..store import AsyncMatrixStore, MatrixStore, snapshot_rooms
 
 _ShareGroupSessionT = Union[ShareGroupSessionError, ShareGroupSessionResponse]
 
@@ -293,6 +325,92 @@ def client_session(func):
     return wrapper
 
 
+class RoomCallbackDispatcher:
+    """Run the callbacks of room events in the background.
+
+    Every room gets its own queue, the callbacks of a room run one after
+    another in the order they were queued while the callbacks of different
+    rooms run concurrently.
+
+    Args:
+        concurrency (int): How many rooms can run callbacks at the same time.
+        queue_size (int): How many callbacks can be queued for a single room
+            before queueing more waits for the queue to drain.
+    """
+
+    def __init__(self, concurrency: int, queue_size: int = 0):
+        self.queue_size = queue_size
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._pending: Dict[str, int] = {}
+        self._workers: Dict[str, asyncio.Future] = {}
+        self._error: Optional[BaseException] = None
+
+    async def put(self, room_id: str, callback: Callable[[], Awaitable[None]]) -> None:
+        """Queue a callback for a room.
+
+        Waits if the queue of the room is full.
+        """
+        queue = self._queues.get(room_id)
+
+        if queue is None:
+            queue = self._queues[room_id] = asyncio.Queue(self.queue_size)
+
+        # The worker of a room keeps running as long as callbacks are pending,
+        # this includes the ones that are still waiting for a free slot.
+        self._pending[room_id] = self._pending.get(room_id, 0) + 1
+
+        if room_id not in self._workers:
+            self._workers[room_id] = asyncio.ensure_future(self._work(room_id, queue))
+
+        try:
+            await queue.put(callback)
+        except asyncio.CancelledError:
+            self._pending[room_id] -= 1
+
+            if not self._pending[room_id]:
+                self._workers[room_id].cancel()
+
+            raise
+
+    async def _work(self, room_id: str, queue: asyncio.Queue) -> None:
+        try:
+            while self._pending[room_id]:
+                callback = await queue.get()
+
+                try:
+                    async with self._semaphore:
+                        await callback()
+                except Exception as e:
+                    logger.exception(f"Error in a callback for room {room_id}")
+                    self._error = self._error or e
+                finally:
+                    queue.task_done()
+                    self._pending[room_id] -= 1
+        finally:
+            del self._workers[room_id]
+            del self._pending[room_id]
+            del self._queues[room_id]
+
+    async def drain(self) -> None:
+        """Wait until all the queued callbacks ran.
+
+        Raises the first exception a callback raised since the last drain.
+        """
+        await asyncio.gather(*(queue.join() for queue in self._queues.values()))
+
+        error, self._error = self._error, None
+
+        if error:
+            raise error
+
+    def cancel(self) -> None:
+        """Cancel all the queued callbacks."""
+        for worker in self._workers.values():
+            worker.cancel()
+
+
 @dataclass(frozen=True)
 class AsyncClientConfig(ClientConfig):
     """Async nio client configuration.
@@ -330,6 +448,120 @@ class AsyncClientConfig(ClientConfig):
         io_chunk_size (int): The size (in bytes) of the chunks to read from the IO
             streams when saving files to disk.
             Defaults to 64 KiB.
+
+        streaming_sync (bool): Parse sync responses incrementally while they
+            are being received instead of loading the whole body at once.
+            Every joined room is handled as soon as it is parsed, which
+            bounds the memory usage by the size of the largest room instead
+            of the size of the whole response. This is mostly useful for the
+            initial sync of accounts with a lot of rooms.
+            The joined rooms aren't kept in the `SyncResponse` that is
+            returned by `sync()` and passed to the response callbacks.
+            The request timeout doesn't limit how long the rooms take to be
+            handled, only how long the server may stay silent.
+            If a body turns out to be invalid or the connection breaks after
+            some rooms were handled, the event callbacks of those rooms run
+            again once the next sync returns the same events.
+            Defaults to False.
+
+        json_backend (str, optional): The JSON library that should be used to
+            encode requests and decode responses, one of "orjson", "ujson"
+            or "json". The backend is shared by the whole process, setting it
+            changes the backend of every client, not just this one. By
+            default the fastest installed one is used.
+            Canonical JSON for signatures is always produced by the standard
+            library.
+
+        decryption_executor (Executor, optional): The executor that decrypts
+            the Megolm events of the room timelines in a sync response.
+            The events are decrypted in batches, one job per group session,
+            so the event loop isn't blocked by large catch-up syncs. The
+            group sessions can't be pickled, so this needs to be a thread
+            pool. The attachments that `download_decrypted()` saves are
+            decrypted on it as well. Defaults to the default executor of the
+            event loop.
+
+        encryption_executor (Executor, optional): The executor that encrypts
+            the room key for the devices of a room when a group session is
+            shared. The to-device messages are encrypted in chunks, one job
+            per chunk, and the first chunk is sent while the others are still
+            being encrypted. Olm sessions can't be pickled, so this needs to
+            be a thread pool. Defaults to the default executor of the event
+            loop.
+
+        key_sharing_workers (int): How many chunks of to-device messages are
+            encrypted concurrently while a group session is shared.
+            Defaults to 4.
+
+        key_claim_batch_size (int): For how many devices one-time keys are
+            claimed in a single request while a group session is shared.
+            The claims run concurrently and the session is shared with the
+            devices of a batch as soon as its claim returns, while the
+            devices that already have an Olm session get it right away.
+            Defaults to 100.
+
+        max_key_sharing_requests (int): How many to-device requests that
+            share a group session can be in flight at once. The encryption
+            of further chunks waits for a request to finish once the limit
+            is reached.
+            Defaults to 8.
+
+        pre_share_group_sessions (bool): Share the next group session of
+            active encrypted rooms in the background, see
+            `pre_share_group_sessions()`, so that the first message after a
+            membership change or after the session expired doesn't need to
+            wait for the key to be shared.
+            Defaults to False.
+
+        pre_share_idle_time (float): The time in seconds after our last
+            message in a room after which the room counts as idle. Sessions
+            are only shared ahead of time for rooms that aren't idle.
+            Defaults to 3600.
+
+        pre_share_rotation_margin (float): Share a new session once the
+            current one is in this fraction of its lifetime, measured in
+            messages or age, e.g. 0.1 replaces a session that can encrypt
+            100 messages after 90 messages.
+            Defaults to 0.1.
+
+        room_callback_concurrency (int, optional): Run the event, ephemeral
+            and room account data callbacks of joined rooms in the background
+            instead of awaiting them while the sync response is handled. The
+            callbacks of a room still run in the order of the events, but the
+            callbacks of up to this many rooms run concurrently, so one slow
+            callback doesn't stall the other rooms. Note that the room state
+            is updated before the callbacks run.
+            `sync_forever()` waits for the callbacks of a sync response before
+            syncing again, `drain_room_callbacks()` can be used to do the
+            same with `sync()`.
+            Defaults to None, which awaits the callbacks one by one.
+
+        room_callback_queue_size (int): How many callbacks can be queued for
+            a single room before handling the sync response waits for the
+            callbacks to catch up. Only used if room_callback_concurrency is
+            set.
+            Defaults to 1000.
+
+        threaded_store (bool): Run the store on a dedicated database thread,
+            see `AsyncMatrixStore`. The client awaits the writes of the sync
+            token, the room state and the queued changes of the store
+            instead of blocking the event loop on them. The Olm machine
+            still blocks on its store calls, so this requires
+            `store_write_behind`, which only queues its writes until the
+            client flushes them.
+            Note that `AsyncClient.store` is a proxy for the store in this
+            mode, not a `MatrixStore` instance.
+            Defaults to False.
+
+        upload_sync_filters (bool): Upload the filter dicts that are passed
+            to `sync()` and `sync_forever()` once and send their filter id
+            instead, see `get_filter_id()`. This shrinks the URL of every
+            sync request and lets the server cache the filter. The ids are
+            remembered in the store and a filter is uploaded again if the
+            server doesn't know it anymore.
+            Defaults to False.
+
+    Raises an ImportWarning if the configured JSON backend isn't installed.
     """
 
     max_limit_exceeded: Optional[int] = None
@@ -338,6 +570,38 @@ class AsyncClientConfig(ClientConfig):
     max_timeout_retry_wait_time: float = 60
     request_timeout: float = 60
     io_chunk_size: int = 64 * 1024
+    streaming_sync: bool = False
+    json_backend: Optional[str] = None
+    decryption_executor: Optional[Executor] = None
+    encryption_executor: Optional[Executor] = None
+    key_sharing_workers: int = 4
+    key_claim_batch_size: int = 100
+    max_key_sharing_requests: int = 8
+    pre_share_group_sessions: bool = False
+    pre_share_idle_time: float = 3600
+    pre_share_rotation_margin: float = 0.1
+    room_callback_concurrency: Optional[int] = None
+    room_callback_queue_size: int = 1000
+    threaded_store: bool = False
+    upload_sync_filters: bool = False
+
+    def __post_init__(self):
+        super().__post_init__()
+
+        if self.threaded_store and not self.store_write_behind:
+            raise ValueError("threaded_store requires store_write_behind")
+
+        if self.json_backend is None:
+            return
+
+        if self.json_backend not in json_backend.BACKENDS:
+            raise ValueError(f"Unknown JSON backend {self.json_backend}")
+
+        if self.json_backend not in json_backend.available_json_backends():
+            raise ImportWarning(
+                f"The JSON backend {self.json_backend} is configured but "
+                "it isn't installed."
+            )
 
 
 class AsyncClient(Client):
@@ -364,7 +628,10 @@ class AsyncClient(Client):
     Attributes:
         synced (Event): An asyncio event that is fired every time the client
             successfully syncs with the server. Note, this event will only be
-            fired if the `sync_forever()` method is used.
+            fired if the `sync_forever()` or `sliding_sync_forever()` method
+            is used.
+        sliding_sync_pos (str): The position of the sliding sync connection,
+            empty if no sliding sync request was made yet.
 
     A simple example can be found bellow.
 
@@ -399,6 +666,19 @@ class AsyncClient(Client):
             >>> )
             >>> asyncio.run(client.sync_forever(30000, full_state=True))
 
+    If the room state is stored as well, the rooms are restored from the store
+    and the full state doesn't need to be requested after a restart.
+
+    Example:
+            >>> config = AsyncClientConfig(store_sync_tokens=True,
+            >>>                            store_room_state=True)
+            >>> client = AsyncClient("https://example.org", "example",
+            >>>                      store_path="/home/example",
+            >>>                      config=config)
+            >>> client.restore_login("@example:example.org", "DEVICEID",
+            >>>                      "access_token")
+            >>> asyncio.run(client.sync_forever(30000))
+
     """
 
     def __init__(
@@ -420,9 +700,16 @@ class AsyncClient(Client):
         self._presence: Optional[str] = None
 
         self.synced = AsyncioEvent()
+        self.sliding_sync_pos = ""
+        self._sliding_sync_to_device_since: Optional[str] = None
+        self._filter_ids: Optional[Dict[str, str]] = None
         self.response_callbacks: List[ClientCallback] = []
 
         self.sharing_session: Dict[str, AsyncioEvent] = {}
+        self._last_room_send: Dict[str, float] = {}
+        self._pre_share_task: Optional[asyncio.Future] = None
+        self._room_callbacks: Optional[RoomCallbackDispatcher] = None
+        self.async_store: Optional["AsyncMatrixStore"] = None
 
         is_config = isinstance(config, ClientConfig)
         is_async_config = isinstance(config, AsyncClientConfig)
@@ -436,6 +723,10 @@ class AsyncClient(Client):
 
         self.config: AsyncClientConfig = config or AsyncClientConfig()
 
+        # This is a process wide setting, it applies to every client.
+        if self.config.json_backend:
+            json_backend.use_json_backend(self.config.json_backend)
+
         super().__init__(user, device_id, store_path, self.config)
 
     def add_response_callback(
@@ -465,6 +756,29 @@ class AsyncClient(Client):
         cb = ClientCallback(func, cb_filter)
         self.response_callbacks.append(cb)
 
+    def _open_store(self, store_factory: Callable[[], "MatrixStore"]) -> "MatrixStore":
+        if not self.config.threaded_store:
+            return super()._open_store(store_factory)
+
+        self.async_store = AsyncMatrixStore(store_factory)
+        return self.async_store.blocking
+
+    async def _run_store(self, func: Callable[..., Any], *args) -> Any:
+        """Run a store function on the database thread if there is one."""
+        if self.async_store:
+            return await self.async_store.run(func, *args)
+
+        return func(*args)
+
+    async def _save_message_indices(self) -> None:
+        if not self.olm:
+            return
+
+        changes = self.olm.message_index_store.pop_changes()
+
+        if changes:
+            await self._run_store(self.store.save_message_indices, changes)
+
     async def parse_body(self, transport_response: ClientResponse) -> Dict[Any, Any]:
         """Parse the body of the response.
 
@@ -478,12 +792,12 @@ class AsyncClient(Client):
         Returns a dictionary representing the response.
         """
         try:
-            return await transport_response.json()
+            return await transport_response.json(loads=json_backend.loads)
         except (JSONDecodeError, ContentTypeError):
             try:
                 # matrix.org return an incorrect content-type for .well-known
                 # API requests, which leads to .text() working but not .json()
-                return json.loads(await transport_response.text())
+                return json_backend.loads(await transport_response.text())
             except (JSONDecodeError, ContentTypeError):
                 pass
 
@@ -495,6 +809,7 @@ class AsyncClient(Client):
         transport_response: ClientResponse,
         data: Optional[Tuple[Any, ...]] = None,
         save_to: Optional[os.PathLike] = None,
+        decryption_info: Optional[Tuple[str, str, str]] = None,
     ) -> Response:
         """Transform a transport response into a nio matrix response.
 
@@ -508,6 +823,9 @@ class AsyncClient(Client):
             data (Tuple, optional): Extra data that is required to instantiate
                 the response class.
             save_to (PathLike, optional): If set, the ``FileResponse`` body will be saved to this file.
+            decryption_info (Tuple[str, str, str], optional): The key, hash
+                and IV of an encrypted ``FileResponse`` body, if set the body
+                will be decrypted before it is saved.
         Returns a subclass of `Response` depending on the type of the
         response_class argument.
         """
@@ -524,6 +842,23 @@ class AsyncClient(Client):
             parsed_dict = await self.parse_body(transport_response)
             resp = response_class.from_data(parsed_dict, content_type, name)
 
+        elif issubclass(response_class, FileResponse) and decryption_info:
+            save_to = Path(save_to)
+            if save_to.is_dir():
+                save_to = save_to / name
+
+            try:
+                await self._save_decrypted(
+                    transport_response.content.iter_chunked(self.config.io_chunk_size),
+                    save_to,
+                    *decryption_info,
+                    executor=self.config.decryption_executor,
+                )
+            except EncryptionError as e:
+                resp = DownloadError(str(e))
+            else:
+                resp = response_class.from_data(save_to, content_type, name)
+
         elif issubclass(response_class, FileResponse):
             if not save_to:
                 body = await transport_response.read()
@@ -546,6 +881,14 @@ class AsyncClient(Client):
             parsed_dict = await self.parse_body(transport_response)
             resp = response_class.create_error(parsed_dict, data[-1])
 
+        elif (
+            issubclass(response_class, SyncResponse)
+            and self.config.streaming_sync
+            and transport_response.status == 200
+            and is_json
+        ):
+            resp = await self._handle_sync_stream(transport_response)
+
         elif (
             transport_response.status == 401 and response_class == DeleteDevicesResponse
         ):
@@ -559,18 +902,50 @@ class AsyncClient(Client):
         resp.transport_response = transport_response
         return resp
 
+    @staticmethod
+    async def _save_decrypted(
+        ciphertext: AsyncIterable[bytes],
+        path: Path,
+        key: str,
+        hash: str,
+        iv: str,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        # The plaintext goes to a temporary file next to the destination, it
+        # only replaces the destination once the hash of the whole ciphertext
+        # has been checked. Unlike a file from mkstemp() it gets the same
+        # permissions as the files that download() saves.
+        temp_path = path.parent / f".{path.name}.{uuid4().hex}.part"
+
+        try:
+            async with aiofiles.open(temp_path, "xb") as f:
+                async for chunk in async_decrypt_attachment(
+                    ciphertext, key, hash, iv, executor
+                ):
+                    await f.write(chunk)
+
+            if path.exists():
+                shutil.copymode(path, temp_path)
+
+            os.replace(temp_path, path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
     async def _run_to_device_callbacks(self, event: Union[ToDeviceEvent]):
-        for cb in self.to_device_callbacks:
-            await cb.execute(event)
+        for cb in route_callbacks(self.to_device_callbacks, event):
+            await cb.run(event)
 
     async def _handle_to_device(self, response: SyncResponse):
-        decrypted_to_device = []
+        await self._handle_to_device_events(response.to_device_events)
 
-        for index, to_device_event in enumerate(response.to_device_events):
+    async def _handle_to_device_events(self, events: List[ToDeviceEvent]):
+        for index, to_device_event in enumerate(events):
             decrypted_event = self._handle_decrypt_to_device(to_device_event)
 
             if decrypted_event:
-                decrypted_to_device.append((index, decrypted_event))
+                # Replace the encrypted to_device event with the decrypted one
+                events[index] = decrypted_event
                 to_device_event = decrypted_event
 
             # Do not pass room key request events to our user here. We don't
@@ -583,62 +958,201 @@ class AsyncClient(Client):
 
             await self._run_to_device_callbacks(to_device_event)
 
-        self._replace_decrypted_to_device(decrypted_to_device, response)
-
     async def _handle_invited_rooms(self, response: SyncResponse):
         for room_id, info in response.rooms.invite.items():
             room = self._get_invited_room(room_id)
 
             for event in info.invite_state:
                 room.handle_event(event)
+                self._drop_event_source(event)
+
+                for cb in route_callbacks(self.event_callbacks, event, room_id):
+                    await cb.run(event, room)
+
+    async def _handle_joined_room(
+        self, room_id: str, join_info: RoomInfo, encrypted_rooms: Set[str]
+    ) -> None:
+        self._handle_joined_state(room_id, join_info, encrypted_rooms)
+
+        room = self.rooms[room_id]
+
+        # Replace the Megolm events with decrypted ones
+        await self._decrypt_timeline(room_id, join_info.timeline.events)
+
+        for event in join_info.timeline.events:
+            self._handle_timeline_event(
+                event, room_id, room, encrypted_rooms, decrypt=False
+            )
+            await self._run_room_callbacks(self.event_callbacks, event, room)
+
+        for event in join_info.ephemeral:
+            room.handle_ephemeral_event(event)
+            await self._run_room_callbacks(self.ephemeral_callbacks, event, room)
+
+        for event in join_info.account_data:
+            room.handle_account_data(event)
+            await self._run_room_callbacks(
+                self.room_account_data_callbacks, event, room
+            )
+
+        if room.encrypted and self.olm is not None:
+            self.olm.update_tracked_users(room)
+
+    async def _run_room_callbacks(
+        self, callbacks: CallbackList, event: Any, room: MatrixRoom
+    ) -> None:
+        routed = route_callbacks(callbacks, event, room.room_id)
+
+        if not routed:
+            return
+
+        async def run():
+            for cb in routed:
+                await cb.run(event, room)
+
+        if not self.config.room_callback_concurrency:
+            await run()
+            return
+
+        if not self._room_callbacks:
+            self._room_callbacks = RoomCallbackDispatcher(
+                self.config.room_callback_concurrency,
+                self.config.room_callback_queue_size,
+            )
+
+        await self._room_callbacks.put(room.room_id, run)
+
+    async def drain_room_callbacks(self) -> None:
+        """Wait until the queued callbacks of room events ran.
+
+        Only needed if `AsyncClientConfig.room_callback_concurrency` is set,
+        `sync_forever()` calls this automatically after every sync.
+
+        Raises the first exception that a callback raised since the last
+        call.
+        """
+        if self._room_callbacks:
+            await self._room_callbacks.drain()
+
+    async def _decrypt_timeline(
+        self, room_id: str, events: List[Union[Event, BadEventType]]
+    ) -> None:
+        if not self.olm:
+            return
+
+        indices = [
+            i for i, event in enumerate(events) if isinstance(event, MegolmEvent)
+        ]
 
-                for cb in self.event_callbacks:
-                    await cb.execute(event, room)
+        if not indices:
+            return
+
+        megolm_events = [events[i] for i in indices]
+
+        for event in megolm_events:
+            event.room_id = room_id
+
+        decrypted_events = await self.olm.decrypt_megolm_events(
+            megolm_events, room_id, self.config.decryption_executor
+        )
+
+        for index, decrypted_event in zip(indices, decrypted_events):
+            if decrypted_event:
+                events[index] = decrypted_event
 
     async def _handle_joined_rooms(self, response: SyncResponse) -> None:
         encrypted_rooms: Set[str] = set()
 
         for room_id, join_info in response.rooms.join.items():
-            self._handle_joined_state(room_id, join_info, encrypted_rooms)
+            await self._handle_joined_room(room_id, join_info, encrypted_rooms)
 
-            room = self.rooms[room_id]
-            decrypted_events: List[Tuple[int, Union[Event, BadEventType]]] = []
+        await self._joined_rooms_handled(encrypted_rooms)
 
-            for index, event in enumerate(join_info.timeline.events):
-                decrypted_event = self._handle_timeline_event(
-                    event, room_id, room, encrypted_rooms
-                )
+    async def _joined_rooms_handled(self, encrypted_rooms: Set[str]) -> None:
+        self.encrypted_rooms.update(encrypted_rooms)
+        rooms, changed_members = self._pop_changed_room_state()
 
-                if decrypted_event:
-                    event = decrypted_event
-                    decrypted_events.append((index, decrypted_event))
+        if not self.store:
+            return
 
-                for cb in self.event_callbacks:
-                    await cb.execute(event, room)
+        await self._run_store(self.store.save_encrypted_rooms, encrypted_rooms)
 
-            # Replace the Megolm events with decrypted ones
-            for index, event in decrypted_events:
-                join_info.timeline.events[index] = event
+        if self.config.store_room_state:
+            # The rooms keep changing while the database thread saves them,
+            # so their state is serialized here.
+            snapshots = snapshot_rooms(rooms, changed_members)
+            await self._run_store(self.store.save_room_snapshots, snapshots)
 
-            for event in join_info.ephemeral:
-                room.handle_ephemeral_event(event)
+    async def _handle_sync_stream(
+        self, transport_response: ClientResponse
+    ) -> Union[SyncResponse, SyncError]:
+        """Parse and handle a sync response while it's being received.
+
+        The joined rooms are handled one at a time as soon as they are parsed
+        and aren't kept in the returned response. If the server sends the
+        to-device events before the rooms they are handled first, so the
+        room keys they contain can be used to decrypt the room events.
+        The rest of the response is handled once the body is fully received.
+
+        If the body turns out to be invalid, the rooms that were handled
+        before the error stay applied and their callbacks already ran, but
+        the sync token isn't advanced. The next sync returns those events
+        again and their callbacks run a second time. The room state is only
+        saved in the store once a response was handled completely.
+        """
+        parsed_dict: Dict[str, Any] = {}
+        to_device_events: Optional[List[ToDeviceEvent]] = None
+        encrypted_rooms: Set[str] = set()
+
+        chunks = transport_response.content.iter_chunked(self.config.io_chunk_size)
+        items = iter_json_items(chunks, [("rooms",), ("rooms", "join")])
 
-                for cb in self.ephemeral_callbacks:
-                    await cb.execute(event, room)
+        try:
+            async for path, value in items:
+                if len(path) != 3 or path[:2] != ("rooms", "join"):
+                    target = parsed_dict
 
-            for event in join_info.account_data:
-                room.handle_account_data(event)
+                    for key in path[:-1]:
+                        target = target.setdefault(key, {})
 
-                for cb in self.room_account_data_callbacks:
-                    await cb.execute(event, room)
+                    target[path[-1]] = value
+                    continue
 
-            if room.encrypted and self.olm is not None:
-                self.olm.update_tracked_users(room)
+                if to_device_events is None and "to_device" in parsed_dict:
+                    to_device = parsed_dict.pop("to_device")
+                    validate_json(to_device, Schemas.sync_to_device)
 
-        self.encrypted_rooms.update(encrypted_rooms)
+                    to_device_events = SyncResponse._get_to_device(to_device)
+                    await self._handle_to_device_events(to_device_events)
 
-        if self.store:
-            self.store.save_encrypted_rooms(encrypted_rooms)
+                room_id = path[2]
+                join_info = SyncResponse.joined_room_from_dict(room_id, value)
+                await self._handle_joined_room(room_id, join_info, encrypted_rooms)
+
+        except JSONDecodeError as e:
+            logger.warning(f"Error parsing sync response: {e}")
+            return SyncError("unknown error")
+
+        except (SchemaError, ValidationError) as e:
+            logger.warning("Error validating response: " + str(e.message))
+            return SyncError("unknown error")
+
+        finally:
+            self.encrypted_rooms.update(encrypted_rooms)
+
+        response = SyncResponse.from_dict(parsed_dict)
+
+        if isinstance(response, SyncResponse):
+            await self._joined_rooms_handled(encrypted_rooms)
+
+            # Handle the rest of the response, setting the sync token here
+            # also makes `receive_response()` skip the response later on.
+            await self._handle_sync(response)
+
+            if to_device_events:
+                response.to_device_events[:0] = to_device_events
+
+        return response
 
     async def _handle_presence_events(self, response: SyncResponse):
         for event in response.presence_events:
@@ -655,23 +1169,23 @@ class AsyncClient(Client):
                 ].currently_active = event.currently_active
                 self.rooms[room_id].users[event.user_id].status_msg = event.status_msg
 
-            for cb in self.presence_callbacks:
-                await cb.execute(event)
+            for cb in route_callbacks(self.presence_callbacks, event):
+                await cb.run(event)
 
     async def _handle_global_account_data_events(  # type: ignore
         self,
         response: SyncResponse,
     ) -> None:
         for event in response.account_data_events:
-            for cb in self.global_account_data_callbacks:
-                await cb.execute(event)
+            for cb in route_callbacks(self.global_account_data_callbacks, event):
+                await cb.run(event)
 
     async def _handle_expired_verifications(self):
         expired_verifications = self.olm.clear_verifications()
 
         for event in expired_verifications:
-            for cb in self.to_device_callbacks:
-                await cb.execute(event)
+            for cb in route_callbacks(self.to_device_callbacks, event):
+                await cb.run(event)
 
     async def _handle_sync(self, response: SyncResponse) -> None:
         # We already received such a sync response, do nothing in that case.
@@ -680,9 +1194,25 @@ class AsyncClient(Client):
 
         self.next_batch = response.next_batch
 
+        await self._handle_sync_events(response)
+
+        # The token is saved once the room state is, so a sync that failed
+        # halfway is fetched again instead of leaving the stored room state
+        # behind the token.
         if self.config.store_sync_tokens and self.store:
-            self.store.save_sync_token(self.next_batch)
+            await self._run_store(self.store.save_sync_token, self.next_batch)
+
+    async def _handle_sliding_sync(self, response: SlidingSyncResponse) -> None:
+        self.sliding_sync_pos = response.pos
+
+        if response.to_device_since is not None:
+            self._sliding_sync_to_device_since = response.to_device_since
 
+        await self._handle_sync_events(response)
+
+    async def _handle_sync_events(
+        self, response: Union[SyncResponse, SlidingSyncResponse]
+    ) -> None:
         await self._handle_to_device(response)
 
         await self._handle_invited_rooms(response)
@@ -721,8 +1251,21 @@ class AsyncClient(Client):
 
         if isinstance(response, SyncResponse):
             await self._handle_sync(response)
+        elif isinstance(response, SlidingSyncResponse):
+            await self._handle_sliding_sync(response)
         else:
-            super().receive_response(response)
+            self._handle_response(response)
+
+        await self._save_message_indices()
+
+        if self.store:
+            await self._run_store(self.store.flush)
+
+        # Membership changes and new devices invalidate group sessions.
+        if self.config.pre_share_group_sessions and isinstance(
+            response, (SyncResponse, SlidingSyncResponse, KeysQueryResponse)
+        ):
+            self._start_pre_sharing()
 
     async def get_timeout_retry_wait_time(self, got_timeouts: int) -> float:
         if got_timeouts < 2:
@@ -743,9 +1286,10 @@ class AsyncClient(Client):
         content_type: Optional[str] = None,
         trace_context: Optional[Any] = None,
         data_provider: Optional[DataProvider] = None,
-        timeout: Optional[float] = None,
+        timeout: Union[None, float, ClientTimeout] = None,
         content_length: Optional[int] = None,
         save_to: Optional[os.PathLike] = None,
+        decryption_info: Optional[Tuple[str, str, str]] = None,
     ):
         headers = (
             {"Content-Type": content_type}
@@ -788,6 +1332,7 @@ class AsyncClient(Client):
                     transport_response=transport_resp,
                     data=response_data,
                     save_to=save_to,
+                    decryption_info=decryption_info,
                 )
 
                 if transport_resp.status == 429 or (
@@ -831,7 +1376,7 @@ class AsyncClient(Client):
         data: Union[None, str, AsyncDataT] = None,
         headers: Optional[Dict[str, str]] = None,
         trace_context: Optional[Any] = None,
-        timeout: Optional[float] = None,
+        timeout: Union[None, float, ClientTimeout] = None,
     ) -> ClientResponse:
         """Send a request to the homeserver.
 
@@ -846,8 +1391,9 @@ class AsyncClient(Client):
                 should be used with the request.
             trace_context (Any, optional): An object to use for the
                 ClientSession TraceConfig context
-            timeout (int, optional): How many seconds the request has before
-                raising `asyncio.TimeoutError`.
+            timeout (int, ClientTimeout, optional): How many seconds the
+                request has before raising `asyncio.TimeoutError`, or the
+                aiohttp timeouts of the request.
                 Overrides `AsyncClient.config.request_timeout` if not `None`.
         """
         assert self.client_session
@@ -1119,6 +1665,7 @@ class AsyncClient(Client):
         since: Optional[str] = None,
         full_state: Optional[bool] = None,
         set_presence: Optional[str] = None,
+        lazy_load_members: bool = False,
     ) -> Union[SyncResponse, SyncError]:
         """Synchronise the client's state with the latest state on the server.
 
@@ -1150,11 +1697,25 @@ class AsyncClient(Client):
                 received from the server using this API call.
             set_presence (str, optional): The presence state.
                 One of: ["online", "offline", "unavailable"]
+            lazy_load_members (bool): Only request the members that are needed
+                to display the timeline instead of the full member lists. The
+                full member list of an encrypted room is loaded once a group
+                session needs to be shared. Filter IDs are sent unchanged, the
+                uploaded filter needs to enable lazy loading itself.
 
         Returns either a `SyncResponse` if the request was successful or
         a `SyncError` if there was an error with the request.
         """
 
+        if lazy_load_members:
+            sync_filter = self._lazy_load_members_filter(sync_filter)
+
+        filter_dict = None
+
+        if self.config.upload_sync_filters and isinstance(sync_filter, dict):
+            filter_dict = sync_filter
+            sync_filter = await self.get_filter_id(filter_dict) or filter_dict
+
         sync_token = since or self.next_batch
         presence = set_presence or self._presence
         method, path = Api.sync(
@@ -1170,17 +1731,119 @@ class AsyncClient(Client):
             set_presence=presence,
         )
 
-        response = await self._send(
-            SyncResponse,
-            method,
-            path,
-            # 0 if full_state: server doesn't respect timeout if full_state
-            # + 15: give server a chance to naturally return before we timeout
-            timeout=0 if full_state else timeout / 1000 + 15 if timeout else timeout,
+        # 0 if full_state: server doesn't respect timeout if full_state
+        # + 15: give server a chance to naturally return before we timeout
+        request_timeout: Union[None, float, ClientTimeout] = (
+            0 if full_state else timeout / 1000 + 15 if timeout else timeout
         )
 
+        if self.config.streaming_sync:
+            # The rooms of a streamed sync are handled while the body is
+            # received, slow callbacks mustn't time the request out and make
+            # it resend the whole sync. Only limit how long the server may
+            # stay silent.
+            limit = (
+                self.config.request_timeout
+                if request_timeout is None
+                else request_timeout
+            )
+
+            if limit:
+                request_timeout = ClientTimeout(
+                    total=None, connect=limit, sock_read=limit
+                )
+
+        response = await self._send(SyncResponse, method, path, timeout=request_timeout)
+
+        # The server forgot the uploaded filter, upload it again and retry.
+        if (
+            filter_dict is not None
+            and isinstance(sync_filter, str)
+            and isinstance(response, SyncError)
+            and response.status_code in ("M_NOT_FOUND", "M_INVALID_PARAM")
+        ):
+            await self._forget_filter_id(filter_dict)
+            return await self.sync(
+                timeout,
+                await self.get_filter_id(filter_dict) or filter_dict,
+                since,
+                full_state,
+                set_presence,
+            )
+
         return response
 
+    def _filter_hash(self, filter_dict: Dict[str, Any]) -> str:
+        # Filter ids belong to a user.
+        content = f"{self.user_id}\n{Api.to_canonical_json(filter_dict)}"
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    async def _load_filter_ids(self) -> Dict[str, str]:
+        if self._filter_ids is None:
+            if self.store:
+                self._filter_ids = await self._run_store(self.store.load_filter_ids)
+            else:
+                self._filter_ids = {}
+
+        return self._filter_ids
+
+    async def _forget_filter_id(self, filter_dict: Dict[str, Any]) -> None:
+        filter_hash = self._filter_hash(filter_dict)
+        filter_ids = await self._load_filter_ids()
+
+        if filter_ids.pop(filter_hash, None) and self.store:
+            await self._run_store(self.store.delete_filter_id, filter_hash)
+
+    @logged_in_async
+    async def get_filter_id(self, filter_dict: Dict[str, Any]) -> Optional[str]:
+        """Get the id of a filter, uploading the filter if needed.
+
+        Every distinct filter is uploaded only once, the ids are remembered
+        in the store if the client has one.
+
+        Args:
+            filter_dict (Dict[str, Any]): The filter definition, see
+                https://spec.matrix.org/latest/client-server-api/#filtering
+
+        Returns the filter id or None if the filter couldn't be uploaded.
+        """
+        filter_hash = self._filter_hash(filter_dict)
+        filter_ids = await self._load_filter_ids()
+
+        if filter_hash in filter_ids:
+            return filter_ids[filter_hash]
+
+        response = await self.upload_filter(
+            event_fields=filter_dict.get("event_fields"),
+            event_format=EventFormat(filter_dict.get("event_format", "client")),
+            presence=filter_dict.get("presence"),
+            account_data=filter_dict.get("account_data"),
+            room=filter_dict.get("room"),
+        )
+
+        if isinstance(response, UploadFilterError):
+            return None
+
+        filter_ids[filter_hash] = response.filter_id
+
+        if self.store:
+            await self._run_store(
+                self.store.save_filter_id, filter_hash, response.filter_id
+            )
+
+        return response.filter_id
+
+    @staticmethod
+    def _lazy_load_members_filter(sync_filter: Optional[_FilterT]) -> _FilterT:
+        if isinstance(sync_filter, str):
+            return sync_filter
+
+        sync_filter = deepcopy(sync_filter) if sync_filter else {}
+        state_filter = sync_filter.setdefault("room", {}).setdefault("state", {})
+        state_filter.setdefault("lazy_load_members", True)
+
+        return sync_filter
+
     @logged_in_async
     async def send_to_device_messages(
         self,
@@ -1223,6 +1886,7 @@ class AsyncClient(Client):
         loop_sleep_time: Optional[int] = None,
         first_sync_filter: Optional[_FilterT] = None,
         set_presence: Optional[str] = None,
+        lazy_load_members: bool = False,
     ):
         """Continuously sync with the configured homeserver.
 
@@ -1277,6 +1941,10 @@ class AsyncClient(Client):
 
             set_presence (str, optional): The presence state.
                 One of: ["online", "offline", "unavailable"]
+
+            lazy_load_members (bool): Enable lazy loading of room members for
+                all sync requests, see `sync()`. This reduces the size of the
+                first sync for accounts in large rooms considerably.
         """
 
         first_sync = True
@@ -1298,7 +1966,12 @@ class AsyncClient(Client):
                 if first_sync:
                     presence = set_presence or self._presence
                     sync_response = await self.sync(
-                        use_timeout, use_filter, since, full_state, presence
+                        use_timeout,
+                        use_filter,
+                        since,
+                        full_state,
+                        presence,
+                        lazy_load_members,
                     )
                     await self.run_response_callbacks([sync_response])
                 else:
@@ -1307,31 +1980,232 @@ class AsyncClient(Client):
                         asyncio.ensure_future(coro)
                         for coro in (
                             self.sync(
-                                use_timeout, use_filter, since, full_state, presence
+                                use_timeout,
+                                use_filter,
+                                since,
+                                full_state,
+                                presence,
+                                lazy_load_members,
                             ),
                             self.send_to_device_messages(),
                         )
                     ]
 
-                if self.should_upload_keys:
-                    tasks.append(asyncio.ensure_future(self.keys_upload()))
+                tasks += self._key_tasks()
+
+                for response in asyncio.as_completed(tasks):
+                    await self.run_response_callbacks([await response])
 
-                if self.should_query_keys:
-                    tasks.append(asyncio.ensure_future(self.keys_query()))
+                await self.drain_room_callbacks()
 
-                if self.should_claim_keys:
-                    tasks.append(
-                        asyncio.ensure_future(
-                            self.keys_claim(self.get_users_for_key_claiming()),
-                        )
+                first_sync = False
+                full_state = None
+                since = None
+
+                self.synced.set()
+                self.synced.clear()
+
+                if loop_sleep_time:
+                    await asyncio.sleep(loop_sleep_time / 1000)
+
+            except asyncio.CancelledError:  # noqa: PERF203
+                for task in tasks:
+                    task.cancel()
+
+                raise
+
+    def _key_tasks(self) -> List[asyncio.Future]:
+        """Start the key uploads, queries and claims that are needed."""
+        tasks = []
+
+        if self.should_upload_keys:
+            tasks.append(asyncio.ensure_future(self.keys_upload()))
+
+        if self.should_query_keys:
+            tasks.append(asyncio.ensure_future(self.keys_query()))
+
+        if self.should_claim_keys:
+            tasks.append(
+                asyncio.ensure_future(
+                    self.keys_claim(self.get_users_for_key_claiming()),
+                )
+            )
+
+        return tasks
+
+    @logged_in_async
+    async def sliding_sync(
+        self,
+        lists: Dict[str, SlidingSyncList],
+        room_subscriptions: Optional[Dict[str, SlidingSyncRoomSubscription]] = None,
+        timeout: Optional[int] = 0,
+        pos: Optional[str] = None,
+        conn_id: Optional[str] = None,
+    ) -> Union[SlidingSyncResponse, SlidingSyncError]:
+        """Synchronise a window of the room list with the server.
+
+        Sliding sync returns only the rooms inside the requested ranges of
+        the room lists, sorted by their latest activity, instead of every
+        joined room. The first request of an account in thousands of rooms is
+        as cheap as the request of an account in a few rooms.
+
+        The returned rooms update the client state the same way the rooms of
+        a sync response do and the same event callbacks are called. The
+        to-device, end-to-end encryption, account data, receipt and typing
+        extensions are always enabled. The encryption state of the rooms is
+        always requested, so sending to an encrypted room keeps working.
+
+        The lists are sent with every request, changing their ranges between
+        requests moves the window. If the server forgot the position of the
+        connection the position is reset and the next request starts a new
+        connection.
+
+        Calls receive_response() to update the client state if necessary.
+
+        Args:
+            lists (Dict[str, SlidingSyncList]): The room lists that should be
+                returned, the counts in the response use the same names.
+            room_subscriptions (Dict[str, SlidingSyncRoomSubscription],
+                optional): Rooms that should be returned no matter if they
+                are part of a list window.
+            timeout(int, optional): The maximum time that the server should
+                wait for new events before it should return the request
+                anyways, in milliseconds.
+                If ``0``, no timeout is applied.
+                If ``None``, use ``AsyncClient.config.request_timeout``.
+            pos (str, optional): The position to continue from. Defaults to
+                the position of the last sliding sync response.
+            conn_id (str, optional): The id of the connection, needed if more
+                than one sliding sync loop runs at a time.
+
+        Returns either a `SlidingSyncResponse` if the request was successful
+        or a `SlidingSyncError` if there was an error with the request.
+        """
+        encryption_state = ("m.room.encryption", "")
+
+        def request_dict(subscription: SlidingSyncRoomSubscription):
+            content = subscription.as_dict()
+
+            if encryption_state not in subscription.required_state:
+                content["required_state"].append(list(encryption_state))
+
+            return content
+
+        extensions: Dict[str, Any] = {
+            "to_device": {"enabled": True},
+            "account_data": {"enabled": True},
+            "receipts": {"enabled": True},
+            "typing": {"enabled": True},
+        }
+
+        if self._sliding_sync_to_device_since:
+            extensions["to_device"]["since"] = self._sliding_sync_to_device_since
+
+        if self.olm:
+            extensions["e2ee"] = {"enabled": True}
+
+        if timeout is None:
+            timeout = int(self.config.request_timeout) * 1000
+
+        method, path, data = Api.sliding_sync(
+            self.access_token,
+            {name: request_dict(room_list) for name, room_list in lists.items()},
+            {
+                room_id: request_dict(subscription)
+                for room_id, subscription in (room_subscriptions or {}).items()
+            },
+            extensions,
+            pos=self.sliding_sync_pos if pos is None else pos,
+            timeout=timeout,
+            conn_id=conn_id,
+        )
+
+        response = await self._send(
+            SlidingSyncResponse,
+            method,
+            path,
+            data,
+            response_data=(self.user_id,),
+            # + 15: give server a chance to naturally return before we timeout
+            timeout=timeout / 1000 + 15 if timeout else timeout,
+        )
+
+        # The server expired the connection, the next request starts a new one.
+        if (
+            isinstance(response, SlidingSyncError)
+            and response.status_code == "M_UNKNOWN_POS"
+        ):
+            self.sliding_sync_pos = ""
+
+        return response
+
+    @logged_in_async
+    async def sliding_sync_forever(
+        self,
+        lists: Dict[str, SlidingSyncList],
+        room_subscriptions: Optional[Dict[str, SlidingSyncRoomSubscription]] = None,
+        timeout: Optional[int] = None,
+        loop_sleep_time: Optional[int] = None,
+        conn_id: Optional[str] = None,
+    ):
+        """Continuously sync a window of the room list with the server.
+
+        This is the sliding sync counterpart of `sync_forever()`, it calls
+        `sliding_sync()` in a loop and handles the to-device messages and
+        encryption keys between the requests.
+
+        The lists and room subscriptions are sent with every request, they
+        can be changed while the loop runs, e.g. to page through a list by
+        moving its ranges.
+
+        Args:
+            lists (Dict[str, SlidingSyncList]): The room lists that should be
+                returned.
+            room_subscriptions (Dict[str, SlidingSyncRoomSubscription],
+                optional): Rooms that should be returned no matter if they
+                are part of a list window.
+            timeout (int, optional): The maximum time that the server should
+                wait for new events, in milliseconds. If ``None``,
+                ``AsyncClient.config.request_timeout`` is used. ``0`` is
+                always used for the first request.
+            loop_sleep_time (int, optional): The sleep time, if any, between
+                successful sync loop iterations in milliseconds.
+            conn_id (str, optional): The id of the connection, needed if more
+                than one sliding sync loop runs at a time.
+        """
+
+        first_sync = True
+
+        while True:
+            try:
+                tasks = []
+
+                # Like in sync_forever(), the first request happens before
+                # the other requests.
+                if first_sync:
+                    response = await self.sliding_sync(
+                        lists, room_subscriptions, 0, conn_id=conn_id
                     )
+                    await self.run_response_callbacks([response])
+                else:
+                    tasks = [
+                        asyncio.ensure_future(coro)
+                        for coro in (
+                            self.sliding_sync(
+                                lists, room_subscriptions, timeout, conn_id=conn_id
+                            ),
+                            self.send_to_device_messages(),
+                        )
+                    ]
+
+                tasks += self._key_tasks()
 
                 for response in asyncio.as_completed(tasks):
                     await self.run_response_callbacks([await response])
 
+                await self.drain_room_callbacks()
+
                 first_sync = False
-                full_state = None
-                since = None
 
                 self.synced.set()
                 self.synced.clear()
@@ -1656,6 +2530,49 @@ class AsyncClient(Client):
             JoinedMembersResponse, method, path, response_data=(room_id,)
         )
 
+    @logged_in_async
+    async def room_get_members(
+        self, room_id: str
+    ) -> Union[RoomGetMembersResponse, RoomGetMembersError]:
+        """Fetch the full member list of a room.
+
+        Loads the joined and invited members of the room. This is needed
+        before encrypting for the room if the members are lazy loaded,
+        `room_send()` does it automatically.
+
+        Calls receive_response() to update the client state if necessary.
+
+        Returns either a `RoomGetMembersResponse` if the request was
+        successful or a `RoomGetMembersError` if there was an error with the
+        request.
+
+        Args:
+            room_id(str): The room id of the room for which we want to
+                request the members.
+        """
+        method, path = Api.room_get_members(
+            self.access_token,
+            room_id,
+            at=self.next_batch or None,
+            not_membership="leave",
+        )
+
+        # Syncs keep running while the members are requested, remember whose
+        # membership they change so the older member list doesn't undo it.
+        synced: Set[str] = set()
+        requests = self._member_requests.setdefault(room_id, [])
+        requests.append(synced)
+
+        try:
+            return await self._send(
+                RoomGetMembersResponse, method, path, response_data=(room_id,)
+            )
+        finally:
+            requests[:] = [changed for changed in requests if changed is not synced]
+
+            if not requests:
+                self._member_requests.pop(room_id, None)
+
     @logged_in_async
     async def joined_rooms(
         self,
@@ -1718,25 +2635,31 @@ class AsyncClient(Client):
 
             if room.encrypted:
                 # Check if the members are synced, otherwise users might not get
-                # the megolm seession.
-                if not room.members_synced:
-                    responses = []
-                    responses.append(await self.joined_members(room_id))
+                # the megolm seession. The member list isn't needed as long as
+                # the current session doesn't need to be shared.
+                if not room.members_synced and self.olm.should_share_group_session(
+                    room_id
+                ):
+                    await self.room_get_members(room_id)
 
                     if self.should_query_keys:
-                        responses.append(await self.keys_query())
+                        await self.keys_query()
 
                 # Check if we need to share a group session, it might have been
-                # invalidated or expired.
-                if self.olm.should_share_group_session(room_id):
-                    try:
-                        event = self.sharing_session[room_id]
-                        await event.wait()
-                    except KeyError:
+                # invalidated or expired. A share that is already running, e.g.
+                # one started ahead of time, might fail because of our
+                # unverified devices setting, so check again once it's done.
+                while self.olm.should_share_group_session(room_id):
+                    event = self.sharing_session.get(room_id)
+
+                    if event is None:
                         await self.share_group_session(
                             room_id,
                             ignore_unverified_devices=ignore_unverified_devices,
                         )
+                        break
+
+                    await event.wait()
 
                 # Reactions as of yet don't support encryption.
                 # Relevant spec proposal https://github.com/matrix-org/matrix-doc/pull/1849
@@ -1744,6 +2667,11 @@ class AsyncClient(Client):
                     # Encrypt our content and change the message type.
                     message_type, content = self.encrypt(room_id, message_type, content)
 
+                self._last_room_send[room_id] = time.monotonic()
+
+                if self.config.pre_share_group_sessions:
+                    self._start_pre_sharing()
+
         method, path, data = Api.room_send(
             self.access_token, room_id, message_type, content, uuid
         )
@@ -2096,26 +3024,52 @@ class AsyncClient(Client):
 
         self.sharing_session[room_id] = AsyncioEvent()
 
-        missing_sessions = self.get_missing_sessions(room_id)
+        users = list(room.users.keys())
+        missing = [
+            (user_id, device_id)
+            for user_id, device_ids in self.get_missing_sessions(room_id).items()
+            for device_id in device_ids
+        ]
+        batch_size = max(self.config.key_claim_batch_size, 1)
+
+        # Devices that are waiting for their one-time keys to be claimed and
+        # devices that the session was already sent to by an earlier round.
+        unclaimed = set(missing)
+        queued: Set[Tuple[str, str]] = set()
+
+        claims: List[asyncio.Future] = []
+        requests: List[asyncio.Future] = []
+        in_flight = asyncio.Semaphore(max(self.config.max_key_sharing_requests, 1))
+        shared_with = set()
 
-        if missing_sessions:
-            await self.keys_claim(missing_sessions)
+        async def claim(batch):
+            user_set: Dict[str, List[str]] = defaultdict(list)
 
-        shared_with = set()
+            for user_id, device_id in batch:
+                user_set[user_id].append(device_id)
 
-        try:
-            requests = []
+            await self.keys_claim(user_set)
+            return batch
 
-            for sharing_with, to_device_dict in self.olm.share_group_session_parallel(
+        async def share(rotate):
+            async for sharing_with, to_device_dict in self.olm.share_group_session_chunks(
                 room_id,
-                list(room.users.keys()),
+                users,
                 ignore_unverified_devices=ignore_unverified_devices,
+                executor=self.config.encryption_executor,
+                max_workers=self.config.key_sharing_workers,
+                skip=unclaimed | queued,
+                rotate=rotate,
             ):
+                queued.update(sharing_with)
                 method, path, data = Api.to_device(
                     self.access_token, "m.room.encrypted", to_device_dict, uuid4()
                 )
 
-                requests.append(
+                # Start sending the chunk while the next ones are encrypted,
+                # but stop encrypting once too many requests are in flight.
+                await in_flight.acquire()
+                request = asyncio.ensure_future(
                     self._send(
                         ShareGroupSessionResponse,
                         method,
@@ -2124,6 +3078,30 @@ class AsyncClient(Client):
                         response_data=(room_id, sharing_with),
                     )
                 )
+                request.add_done_callback(lambda _: in_flight.release())
+                requests.append(request)
+
+        try:
+            # The later rounds can't abort the sharing once the first one was
+            # sent, so every device needs to pass the trust check up front.
+            self.olm.check_group_session_recipients(
+                users, ignore_unverified_devices, pending=unclaimed
+            )
+
+            # The one-time keys are claimed in concurrent batches while the
+            # devices that already have an Olm session get the room key, the
+            # devices of a batch get it as soon as its claim returns.
+            claims = [
+                asyncio.ensure_future(claim(missing[i : i + batch_size]))
+                for i in range(0, len(missing), batch_size)
+            ]
+
+            await share(rotate=True)
+
+            for claimed in asyncio.as_completed(claims):
+                unclaimed.difference_update(await claimed)
+                # Every round needs to share the same group session.
+                await share(rotate=False)
 
             for response in await asyncio.gather(*requests, return_exceptions=True):
                 if isinstance(response, ShareGroupSessionResponse):
@@ -2137,11 +3115,100 @@ class AsyncClient(Client):
         except ClientConnectionError:
             raise
         finally:
+            for future in claims + requests:
+                future.cancel()
+
             event = self.sharing_session.pop(room_id)
             event.set()
 
         return ShareGroupSessionResponse(room_id, shared_with)
 
+    def _rooms_to_pre_share(self) -> List[str]:
+        assert self.olm
+
+        now = time.monotonic()
+        margin = self.config.pre_share_rotation_margin
+        room_ids = []
+
+        for room_id, last_send in list(self._last_room_send.items()):
+            room = self.rooms.get(room_id)
+
+            if (
+                not room
+                or not room.encrypted
+                or now - last_send > self.config.pre_share_idle_time
+            ):
+                # Forget idle rooms until we send a message to them again.
+                del self._last_room_send[room_id]
+                continue
+
+            if room_id in self.sharing_session or not room.members_synced:
+                continue
+
+            session = self.olm.outbound_group_sessions.get(room_id)
+
+            # A membership change removes the session of the room, see
+            # `_invalidate_session_for_member_event()`.
+            if not session or not session.shared or session.should_rotate_soon(margin):
+                room_ids.append(room_id)
+
+        return room_ids
+
+    def _start_pre_sharing(self) -> None:
+        if not self.olm or (self._pre_share_task and not self._pre_share_task.done()):
+            return
+
+        if self._rooms_to_pre_share():
+            self._pre_share_task = asyncio.ensure_future(
+                self._pre_share_in_background()
+            )
+
+    async def _pre_share_in_background(self) -> None:
+        try:
+            await self.pre_share_group_sessions()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The next message will share the session itself.
+            logger.exception("Error while sharing group sessions ahead of time")
+
+    @logged_in_async
+    @store_loaded
+    async def pre_share_group_sessions(
+        self,
+    ) -> List[Union[ShareGroupSessionResponse, ShareGroupSessionError]]:
+        """Share the next group session of active encrypted rooms.
+
+        A room is active if we sent a message to it in the last
+        `pre_share_idle_time` seconds. Its group session is shared ahead of
+        time if the members of the room changed, if the session expired or
+        if it's close to its rotation, so that the next `room_send()` can
+        encrypt the message right away.
+
+        Automatically called in the background after syncs and sent messages
+        if `pre_share_group_sessions` is enabled in the config.
+
+        Rooms with unverified devices are skipped until we send a message to
+        them again, since `room_send()` decides how they are handled.
+
+        Returns the responses of the rooms that a session was shared with.
+        """
+        responses = []
+
+        for room_id in self._rooms_to_pre_share():
+            if room_id in self.sharing_session:
+                continue
+
+            logger.info(f"Sharing the next group session for {room_id} ahead of time")
+
+            try:
+                responses.append(await self.share_group_session(room_id))
+            except OlmUnverifiedDeviceError as e:
+                logger.info(f"Not sharing a group session for {room_id}: {e}")
+                self._last_room_send.pop(room_id, None)
+
+        return responses
+
     @logged_in_async
     @store_loaded
     async def request_room_key(
@@ -2195,7 +3262,26 @@ class AsyncClient(Client):
         )
 
     async def close(self):
-        """Close the underlying http session."""
+        """Close the underlying http session.
+
+        Changes that the store queued are written to the database as well,
+        if the store runs on a database thread the thread is stopped.
+        """
+        if self._room_callbacks:
+            self._room_callbacks.cancel()
+
+        if self._pre_share_task:
+            self._pre_share_task.cancel()
+
+        await self._save_message_indices()
+
+        if self.async_store:
+            await self.async_store.close()
+            self.async_store = None
+            self.store = None
+        elif self.store:
+            self.store.flush()
+
         if self.client_session:
             await self.client_session.close()
             self.client_session = None
@@ -2221,7 +3307,9 @@ class AsyncClient(Client):
 
         loop = asyncio.get_event_loop()
 
-        inbound_group_store = self.store.load_inbound_group_sessions()
+        inbound_group_store = await self._run_store(
+            self.store.load_inbound_group_sessions
+        )
         export_keys = partial(
             self.olm.export_keys_static,
             inbound_group_store,
@@ -2256,12 +3344,14 @@ class AsyncClient(Client):
         import_keys = partial(self.olm.import_keys_static, infile, passphrase)
         sessions = await loop.run_in_executor(None, import_keys)
 
-        for session in sessions:
-            # This could be improved by writing everything to db at once at
-            # the end
-            if self.olm.inbound_group_store.add(session):
+        sessions = [s for s in sessions if self.olm.inbound_group_store.add(s)]
+
+        def save_sessions():
+            for session in sessions:
                 self.store.save_inbound_group_session(session)
 
+        await self._run_store(save_sessions)
+
     @logged_in_async
     async def room_create(
         self,
@@ -3099,6 +4189,68 @@ class AsyncClient(Client):
             save_to=save_to,
         )
 
+    @client_session
+    async def download_decrypted(
+        self,
+        mxc: str,
+        key: str,
+        hash: str,
+        iv: str,
+        save_to: os.PathLike,
+        filename: Optional[str] = None,
+        allow_remote: bool = True,
+    ) -> Union[DiskDownloadResponse, DownloadError]:
+        """Download an encrypted file from the content repository and save
+        the decrypted content.
+
+        The file is decrypted while it is downloaded, the content is never
+        fully loaded into memory. The plaintext is written to a temporary file
+        in the destination directory which is moved to the destination only
+        if the SHA-256 hash of the encrypted content matches.
+
+        This method ignores `AsyncClient.config.request_timeout` and uses `0`.
+
+        Calls receive_response() to update the client state if necessary.
+
+        Returns either a `DiskDownloadResponse` if the request was successful
+        or a `DownloadError` if there was an error with the request or the
+        file couldn't be decrypted.
+
+        Args:
+            mxc (str): The mxc:// URI.
+            key (str): AES_CTR JWK key object, the "k" value of the "key" of
+                the encrypted file.
+            hash (str): Base64 encoded SHA-256 hash of the encrypted content.
+            iv (str): Base64 encoded 16 byte AES-CTR IV.
+            save_to (PathLike): The path the decrypted file will be saved to.
+                If it's a directory the filename returned by the server is
+                used.
+            filename (str, optional): A filename to be returned in the response
+                by the server. If None (default), the original name of the
+                file will be returned instead, if there is one.
+            allow_remote (bool): Indicates to the server that it should not
+                attempt to fetch the media if it is deemed remote.
+                This is to prevent routing loops where the server contacts
+                itself.
+        """
+        url = urlparse(mxc)
+
+        http_method, path = Api.download(
+            url.netloc,
+            url.path.replace("/", ""),
+            filename,
+            allow_remote,
+        )
+
+        return await self._send(
+            DiskDownloadResponse,
+            http_method,
+            path,
+            timeout=0,
+            save_to=save_to,
+            decryption_info=(key, hash, iv),
+        )
+
     @client_session
     async def thumbnail(
         self,
@@ -25,7 +25,10 @@ from typing import (
     Awaitable,
     Callable,
     Coroutine,
+    DefaultDict,
     Dict,
+    FrozenSet,
+    Iterable,
     List,
     Optional,
     Set,
@@ -65,6 +68,7 @@ from ..responses import (
     RoomContextResponse,
     RoomForgetResponse,
     RoomGetEventResponse,
+    RoomGetMembersResponse,
     RoomInfo,
     RoomKeyRequestResponse,
     RoomMessagesResponse,
@@ -77,7 +81,7 @@ from ..rooms import MatrixInvitedRoom, MatrixRoom
 
 if ENCRYPTION_ENABLED:
     from ..crypto import Olm
-    from ..store import DefaultStore, MatrixStore, SqliteMemoryStore
+    from ..store import DatabaseProfile, DefaultStore, MatrixStore, SqliteMemoryStore
 if TYPE_CHECKING:
     from ..crypto import OlmDevice, Sas
 
@@ -117,18 +121,140 @@ def store_loaded(fn):
     return inner
 
 
+def _id_filter(ids: Union[str, Iterable[str], None]) -> Optional[FrozenSet[str]]:
+    if ids is None:
+        return None
+
+    if isinstance(ids, str):
+        return frozenset((ids,))
+
+    return frozenset(ids)
+
+
 @dataclass
 class ClientCallback:
     """nio internal callback class."""
 
     func: Union[Callable[..., None], Callable[..., Awaitable[None]]] = field()
     filter: Union[Tuple[Type, ...], Type, None] = None
+    room_ids: Optional[FrozenSet[str]] = None
+    senders: Optional[FrozenSet[str]] = None
+
+    def matches(self, event_class: Type, room_id: Optional[str] = None) -> bool:
+        """Check if the callback should be called for events of a class."""
+        if self.filter is not None and not issubclass(event_class, self.filter):
+            return False
+
+        return self.room_ids is None or room_id in self.room_ids
+
+    async def run(self, event, room: Optional[MatrixRoom] = None) -> None:
+        result = self.func(room, event) if room else self.func(event)
+        if inspect.isawaitable(result):
+            await result
 
     async def execute(self, event, room: Optional[MatrixRoom] = None) -> None:
-        if self.filter is None or isinstance(event, self.filter):
-            result = self.func(room, event) if room else self.func(event)
-            if inspect.isawaitable(result):
-                await result
+        room_id = room.room_id if room else None
+
+        if self.matches(type(event), room_id) and (
+            self.senders is None or getattr(event, "sender", None) in self.senders
+        ):
+            await self.run(event, room)
+
+
+def _invalidating(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self._invalidate()
+        return result
+
+    return wrapper
+
+
+class CallbackList(List[ClientCallback]):
+    """A list of callbacks that routes events to the matching callbacks.
+
+    The callbacks that match an event class are looked up once and cached,
+    the cache is cleared every time the list is modified. The room and sender
+    filters of the callbacks are applied on every lookup, so the cache only
+    grows with the number of event classes.
+    """
+
+    def __init__(self, callbacks: Iterable[ClientCallback] = ()):
+        super().__init__(callbacks)
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        self._routes: Dict[Type, Tuple[ClientCallback, ...]] = {}
+        self._room_filtered = any(cb.room_ids is not None for cb in self)
+        self._sender_filtered = any(cb.senders is not None for cb in self)
+
+    append = _invalidating(list.append)
+    extend = _invalidating(list.extend)
+    insert = _invalidating(list.insert)
+    remove = _invalidating(list.remove)
+    pop = _invalidating(list.pop)
+    clear = _invalidating(list.clear)
+    sort = _invalidating(list.sort)
+    reverse = _invalidating(list.reverse)
+    __setitem__ = _invalidating(list.__setitem__)
+    __delitem__ = _invalidating(list.__delitem__)
+    __iadd__ = _invalidating(list.__iadd__)
+    __imul__ = _invalidating(list.__imul__)
+
+    def route(
+        self, event: Any, room_id: Optional[str] = None
+    ) -> Tuple[ClientCallback, ...]:
+        """Get the callbacks that should be called for an event.
+
+        Args:
+            event (Any): The event that the callbacks are for.
+            room_id (str, optional): The id of the room the event belongs to.
+        """
+        event_class = type(event)
+
+        try:
+            callbacks = self._routes[event_class]
+        except KeyError:
+            callbacks = self._routes[event_class] = tuple(
+                cb
+                for cb in self
+                if cb.filter is None or issubclass(event_class, cb.filter)
+            )
+
+        if self._room_filtered:
+            callbacks = tuple(
+                cb for cb in callbacks if cb.room_ids is None or room_id in cb.room_ids
+            )
+
+        if self._sender_filtered:
+            sender = getattr(event, "sender", None)
+            callbacks = tuple(
+                cb for cb in callbacks if cb.senders is None or sender in cb.senders
+            )
+
+        return callbacks
+
+
+def route_callbacks(
+    callbacks: Iterable[ClientCallback], event: Any, room_id: Optional[str] = None
+) -> Tuple[ClientCallback, ...]:
+    """Get the callbacks of a list that should be called for an event.
+
+    The callback lists of the client can be replaced by plain lists, those
+    are searched on every call instead of using the cache of a CallbackList.
+    """
+    if isinstance(callbacks, CallbackList):
+        return callbacks.route(event, room_id)
+
+    sender = getattr(event, "sender", None)
+
+    return tuple(
+        cb
+        for cb in callbacks
+        if cb.matches(type(event), room_id)
+        and (cb.senders is None or sender in cb.senders)
+    )
 
 
 @dataclass(frozen=True)
@@ -146,7 +272,39 @@ class ClientConfig:
             end to end encryption keys.
         store_sync_tokens (bool, optional): Should the client store and restore
             sync tokens.
+        store_room_state (bool, optional): Should the client store and restore
+            the state of joined rooms, e.g. members, names, power levels and
+            receipts. Together with store_sync_tokens this allows the client
+            to resume syncing after a restart without requesting the full
+            state.
         custom_headers (Dict[str, str]): A dictionary of custom http headers.
+        session_cache_size (int, optional): If set, Olm and Megolm sessions
+            are loaded from the store the first time they are needed instead
+            of all at once when the client starts. At most this many Megolm
+            sessions are kept in memory. Useful for accounts with a large
+            number of sessions.
+        store_write_behind (bool, optional): Should the store queue changes
+            to the account, sessions, device keys and sync token and write
+            them in a single transaction after every response, e.g. once per
+            sync, instead of writing every change right away.
+        store_max_queued_writes (int, optional): The number of queued changes
+            after which the store writes them without waiting for the end of
+            the response.
+        store_flush_interval (float, optional): The number of seconds after
+            which queued changes are written without waiting for the end of
+            the response.
+        store_profile (DatabaseProfile, optional): The SQLite settings of the
+            store's database, e.g. ``DatabaseProfile.performance()`` to use
+            WAL journaling. Passed to the store class if set.
+        intern_member_strings (bool, optional): Should the user ids and
+            display names of room members be interned. Members that share
+            many rooms are then stored once instead of once per room.
+        drop_event_source (Tuple[Type, ...], optional): Event classes whose
+            source dictionary isn't needed. The source of room events of these
+            classes is replaced with an empty dictionary once the room handled
+            them, before the callbacks run, which saves the memory of the raw
+            JSON if the events are kept around. Don't use it for events whose
+            source is used later on, e.g. for push rules or replies.
 
     Raises an ImportWarning if encryption_enabled is true but the dependencies
     for encryption aren't installed.
@@ -160,7 +318,15 @@ class ClientConfig:
     store_name: str = ""
     pickle_key: str = "DEFAULT_KEY"
     store_sync_tokens: bool = False
+    store_room_state: bool = False
     custom_headers: Optional[Dict[str, str]] = None
+    session_cache_size: Optional[int] = None
+    store_write_behind: bool = False
+    store_max_queued_writes: int = 1000
+    store_flush_interval: float = 5.0
+    store_profile: Optional[DatabaseProfile] = None
+    intern_member_strings: bool = False
+    drop_event_source: Tuple[Type, ...] = ()
 
     def __post_init__(self):
         if not ENCRYPTION_ENABLED and self.encryption_enabled:
@@ -222,12 +388,21 @@ class Client:
         self.invited_rooms: Dict[str, MatrixInvitedRoom] = {}
         self.encrypted_rooms: Set[str] = set()
 
-        self.event_callbacks: List[ClientCallback] = []
-        self.ephemeral_callbacks: List[ClientCallback] = []
-        self.to_device_callbacks: List[ClientCallback] = []
-        self.presence_callbacks: List[ClientCallback] = []
-        self.global_account_data_callbacks: List[ClientCallback] = []
-        self.room_account_data_callbacks: List[ClientCallback] = []
+        # Rooms and room members whose state changed since the room state was
+        # last saved in the store.
+        self._changed_rooms: Set[str] = set()
+        self._changed_room_members: DefaultDict[str, Set[str]] = defaultdict(set)
+
+        # The users whose membership a sync changed while the member list of
+        # a room was requested, one set for every request in flight.
+        self._member_requests: Dict[str, List[Set[str]]] = {}
+
+        self.event_callbacks = CallbackList()
+        self.ephemeral_callbacks = CallbackList()
+        self.to_device_callbacks = CallbackList()
+        self.presence_callbacks = CallbackList()
+        self.global_account_data_callbacks = CallbackList()
+        self.room_account_data_callbacks = CallbackList()
 
     @property
     def logged_in(self) -> bool:
@@ -363,31 +538,68 @@ class Client:
             raise LocalProtocolError("No store class was provided in the config.")
 
         if self.config.encryption_enabled:
-            if self.config.store is SqliteMemoryStore:
-                self.store = self.config.store(
-                    self.user_id,
-                    self.device_id,
-                    self.config.pickle_key,
-                )
-            else:
-                if not self.store_path:
-                    return
-
-                self.store = self.config.store(
-                    self.user_id,
-                    self.device_id,
-                    self.store_path,
-                    self.config.pickle_key,
-                    self.config.store_name,
-                )
-            assert self.store
+            if self.config.store is not SqliteMemoryStore and not self.store_path:
+                return
+
+            self.store = self._open_store(self._create_store)
 
-            self.olm = Olm(self.user_id, self.device_id, self.store)
+            self.olm = Olm(
+                self.user_id,
+                self.device_id,
+                self.store,
+                self.config.session_cache_size,
+            )
             self.encrypted_rooms = self.store.load_encrypted_rooms()
 
             if self.config.store_sync_tokens:
                 self.loaded_sync_token = self.store.load_sync_token()
 
+            if self.config.store_room_state:
+                rooms = self.store.load_rooms(self.config.intern_member_strings)
+
+                for room_id, room in rooms.items():
+                    self.rooms.setdefault(room_id, room)
+
+    def _create_store(self) -> MatrixStore:
+        assert self.config.store
+
+        if self.config.store is SqliteMemoryStore:
+            store = self.config.store(
+                self.user_id,
+                self.device_id,
+                self.config.pickle_key,
+            )
+        else:
+            kwargs = {}
+            if self.config.store_profile is not None:
+                kwargs["profile"] = self.config.store_profile
+
+            store = self.config.store(
+                self.user_id,
+                self.device_id,
+                self.store_path,
+                self.config.pickle_key,
+                self.config.store_name,
+                **kwargs,
+            )
+
+        store.write_behind = self.config.store_write_behind
+        store.max_queued_writes = self.config.store_max_queued_writes
+        store.flush_interval = self.config.store_flush_interval
+
+        return store
+
+    def _open_store(self, store_factory: Callable[[], MatrixStore]) -> MatrixStore:
+        """Create the store that the client and the Olm machine use.
+
+        Subclasses can override this to change how the store is accessed.
+
+        Args:
+            store_factory (Callable[[], MatrixStore]): Creates the store
+                configured in the client config.
+        """
+        return store_factory()
+
     def restore_login(
         self,
         user_id: str,
@@ -429,15 +641,14 @@ class Client:
         if not self.olm:
             return False
 
-        for user in room.users:
-            if not self.olm.user_fully_verified(user):
-                return True
-
-        return False
+        return not self.olm.room_fully_verified(room_id, room.users)
 
-    def _invalidate_session_for_member_event(self, room_id: str):
+    def _invalidate_session_for_member_event(self, room_id: str, user_id: str):
         if not self.olm:
             return
+
+        member = user_id in self.rooms[room_id].users
+        self.olm.room_member_changed(room_id, user_id, member)
         self.invalidate_outbound_session(room_id)
 
     @store_loaded
@@ -648,9 +859,8 @@ class Client:
             response.to_device_events[index] = event
 
     def _run_to_device_callbacks(self, event: ToDeviceEvent):
-        for cb in self.to_device_callbacks:
-            if cb.filter is None or isinstance(event, cb.filter):
-                cb.func(event)
+        for cb in route_callbacks(self.to_device_callbacks, event):
+            cb.func(event)
 
     def _handle_to_device(self, response: SyncResponse):
         decrypted_to_device = []
@@ -677,7 +887,9 @@ class Client:
     def _get_invited_room(self, room_id: str) -> MatrixInvitedRoom:
         if room_id not in self.invited_rooms:
             logger.info(f"New invited room {room_id}")
-            self.invited_rooms[room_id] = MatrixInvitedRoom(room_id, self.user_id)
+            self.invited_rooms[room_id] = MatrixInvitedRoom(
+                room_id, self.user_id, self.config.intern_member_strings
+            )
 
         return self.invited_rooms[room_id]
 
@@ -687,10 +899,10 @@ class Client:
 
             for event in info.invite_state:
                 room.handle_event(event)
+                self._drop_event_source(event)
 
-                for cb in self.event_callbacks:
-                    if cb.filter is None or isinstance(event, cb.filter):
-                        cb.func(room, event)
+                for cb in route_callbacks(self.event_callbacks, event, room_id):
+                    cb.func(room, event)
 
     def _handle_joined_state(
         self, room_id: str, join_info: RoomInfo, encrypted_rooms: Set[str]
@@ -701,21 +913,30 @@ class Client:
         if room_id not in self.rooms:
             logger.info(f"New joined room {room_id}")
             self.rooms[room_id] = MatrixRoom(
-                room_id, self.user_id, room_id in self.encrypted_rooms
+                room_id,
+                self.user_id,
+                room_id in self.encrypted_rooms,
+                self.config.intern_member_strings,
             )
 
         room = self.rooms[room_id]
+        self._room_state_changed(room_id)
 
         for event in join_info.state:
             if isinstance(event, RoomEncryptionEvent):
                 encrypted_rooms.add(room_id)
 
             if isinstance(event, RoomMemberEvent):
+                self._room_state_changed(room_id, event.state_key)
+                self._room_member_synced(room_id, event.state_key)
+
                 if room.handle_membership(event):
-                    self._invalidate_session_for_member_event(room_id)
+                    self._invalidate_session_for_member_event(room_id, event.state_key)
             else:
                 room.handle_event(event)
 
+            self._drop_event_source(event)
+
         if join_info.summary:
             room.update_summary(join_info.summary)
 
@@ -728,10 +949,11 @@ class Client:
         room_id: str,
         room: MatrixRoom,
         encrypted_rooms: Set[str],
+        decrypt: bool = True,
     ) -> Optional[Union[Event, BadEventType]]:
         decrypted_event = None
 
-        if isinstance(event, MegolmEvent) and self.olm:
+        if isinstance(event, MegolmEvent) and self.olm and decrypt:
             event.room_id = room_id
             decrypted_event = self.olm._decrypt_megolm_no_error(event)
 
@@ -742,8 +964,11 @@ class Client:
             encrypted_rooms.add(room_id)
 
         if isinstance(event, RoomMemberEvent):
+            self._room_state_changed(room_id, event.state_key)
+            self._room_member_synced(room_id, event.state_key)
+
             if room.handle_membership(event):
-                self._invalidate_session_for_member_event(room_id)
+                self._invalidate_session_for_member_event(room_id, event.state_key)
 
         elif isinstance(event, (UnknownBadEvent, BadEvent)):
             pass
@@ -751,8 +976,16 @@ class Client:
         else:
             room.handle_event(event)
 
+        self._drop_event_source(event)
+
         return decrypted_event
 
+    def _drop_event_source(self, event: Any) -> None:
+        if self.config.drop_event_source and isinstance(
+            event, self.config.drop_event_source
+        ):
+            event.source = {}
+
     def _handle_joined_rooms(self, response: SyncResponse):
         encrypted_rooms: Set[str] = set()
 
@@ -771,9 +1004,8 @@ class Client:
                     event = decrypted_event
                     decrypted_events.append((index, decrypted_event))
 
-                for cb in self.event_callbacks:
-                    if cb.filter is None or isinstance(event, cb.filter):
-                        cb.func(room, event)
+                for cb in route_callbacks(self.event_callbacks, event, room_id):
+                    cb.func(room, event)
 
             # Replace the Megolm events with decrypted ones
             for index, event in decrypted_events:
@@ -782,16 +1014,16 @@ class Client:
             for event in join_info.ephemeral:
                 room.handle_ephemeral_event(event)
 
-                for cb in self.ephemeral_callbacks:
-                    if cb.filter is None or isinstance(event, cb.filter):
-                        cb.func(room, event)
+                for cb in route_callbacks(self.ephemeral_callbacks, event, room_id):
+                    cb.func(room, event)
 
             for event in join_info.account_data:
                 room.handle_account_data(event)
 
-                for cb in self.room_account_data_callbacks:
-                    if cb.filter is None or isinstance(event, cb.filter):
-                        cb.func(room, event)
+                for cb in route_callbacks(
+                    self.room_account_data_callbacks, event, room_id
+                ):
+                    cb.func(room, event)
 
             if room.encrypted and self.olm is not None:
                 self.olm.update_tracked_users(room)
@@ -801,6 +1033,60 @@ class Client:
         if self.store:
             self.store.save_encrypted_rooms(encrypted_rooms)
 
+        self._save_room_state()
+
+    def _room_state_changed(self, room_id: str, user_id: Optional[str] = None):
+        """Remember that the state of a room needs to be saved in the store.
+
+        Args:
+            room_id (str): The id of the room that changed.
+            user_id (str, optional): The id of a room member whose membership
+                or profile changed.
+        """
+        if not self.config.store_room_state:
+            return
+
+        self._changed_rooms.add(room_id)
+
+        if user_id:
+            self._changed_room_members[room_id].add(user_id)
+
+    def _room_member_synced(self, room_id: str, user_id: str):
+        """Remember that a sync changed the membership of a user.
+
+        The member lists that are being requested for the room are older than
+        this change and mustn't undo it.
+
+        Args:
+            room_id (str): The id of the room.
+            user_id (str): The id of the user whose membership changed.
+        """
+        for changed in self._member_requests.get(room_id, ()):
+            changed.add(user_id)
+
+    def _pop_changed_room_state(
+        self,
+    ) -> Tuple[List[MatrixRoom], Dict[str, Set[str]]]:
+        """Take the rooms and members that changed since the last save."""
+        rooms = [
+            self.rooms[room_id]
+            for room_id in self._changed_rooms
+            if room_id in self.rooms
+        ]
+        changed_members = dict(self._changed_room_members)
+
+        self._changed_rooms.clear()
+        self._changed_room_members.clear()
+
+        return rooms, changed_members
+
+    def _save_room_state(self) -> None:
+        """Save the state of the rooms that changed since the last save."""
+        rooms, changed_members = self._pop_changed_room_state()
+
+        if self.store and self.config.store_room_state:
+            self.store.save_rooms(rooms, changed_members)
+
     def _handle_presence_events(self, response: SyncResponse):
         for event in response.presence_events:
             for room_id in self.rooms.keys():
@@ -816,26 +1102,23 @@ class Client:
                 ].currently_active = event.currently_active
                 self.rooms[room_id].users[event.user_id].status_msg = event.status_msg
 
-            for cb in self.presence_callbacks:
-                if cb.filter is None or isinstance(event, cb.filter):
-                    cb.func(event)
+            for cb in route_callbacks(self.presence_callbacks, event):
+                cb.func(event)
 
     def _handle_global_account_data_events(
         self,
         response: SyncResponse,
     ) -> None:
         for event in response.account_data_events:
-            for cb in self.global_account_data_callbacks:
-                if cb.filter is None or isinstance(event, cb.filter):
-                    cb.func(event)
+            for cb in route_callbacks(self.global_account_data_callbacks, event):
+                cb.func(event)
 
     def _handle_expired_verifications(self):
         expired_verifications = self.olm.clear_verifications()
 
         for event in expired_verifications:
-            for cb in self.to_device_callbacks:
-                if cb.filter is None or isinstance(event, cb.filter):
-                    cb.func(event)
+            for cb in route_callbacks(self.to_device_callbacks, event):
+                cb.func(event)
 
     def _handle_olm_events(self, response: SyncResponse):
         assert self.olm
@@ -871,9 +1154,6 @@ class Client:
 
         self.next_batch = response.next_batch
 
-        if self.config.store_sync_tokens and self.store:
-            self.store.save_sync_token(self.next_batch)
-
         self._handle_to_device(response)
 
         self._handle_invited_rooms(response)
@@ -889,6 +1169,11 @@ class Client:
             self._handle_olm_events(response)
             self._collect_key_requests()
 
+        # The token is saved last, so a sync that failed halfway is fetched
+        # again instead of leaving the stored room state behind the token.
+        if self.config.store_sync_tokens and self.store:
+            self.store.save_sync_token(self.next_batch)
+
         return None
 
     def _collect_key_requests(self):
@@ -986,29 +1271,92 @@ class Client:
 
         joined_user_ids = {m.user_id for m in response.members}
 
+        for user_id in joined_user_ids.union(room.users):
+            self._room_state_changed(room.room_id, user_id)
+
+        changed = set()
+
         for user_id in tuple(room.users):
             invited = room.users[user_id].invited
 
             if not invited and user_id not in joined_user_ids:
                 room.remove_member(user_id)
+                changed.add(user_id)
 
         for member in response.members:
-            room.add_member(member.user_id, member.display_name, member.avatar_url)
+            if room.add_member(member.user_id, member.display_name, member.avatar_url):
+                changed.add(member.user_id)
+
+        self._room_members_loaded(room, changed)
+
+    def _handle_room_get_members(self, response: RoomGetMembersResponse):
+        if response.room_id not in self.rooms:
+            return
+
+        room = self.rooms[response.room_id]
+
+        # The member list is a snapshot from the time of the request, the
+        # users whose membership a sync changed since then are kept as is.
+        synced = set().union(*self._member_requests.get(room.room_id, ()))
+
+        members = {
+            event.state_key: event
+            for event in response.members
+            if event.membership in ("join", "invite") and event.state_key not in synced
+        }
+
+        for user_id in members.keys() | room.users.keys():
+            self._room_state_changed(room.room_id, user_id)
+
+        changed = set()
+
+        for user_id in tuple(room.users):
+            if user_id not in members and user_id not in synced:
+                room.remove_member(user_id)
+                changed.add(user_id)
+
+        for user_id, event in members.items():
+            if room.handle_membership(event):
+                changed.add(user_id)
+
+        self._room_members_loaded(room, changed)
+
+    def _room_members_loaded(self, room: MatrixRoom, changed: Set[str]):
+        """Finish loading the full member list of a room.
+
+        Args:
+            room (MatrixRoom): The room whose members were loaded.
+            changed (Set[str]): The users that joined or left the room
+                compared to the members we knew about before.
+        """
+        if self.olm is not None:
+            for user_id in changed:
+                self.olm.room_member_changed(
+                    room.room_id, user_id, user_id in room.users
+                )
 
         room.members_synced = True
 
         if room.encrypted and self.olm is not None:
             self.olm.update_tracked_users(room)
 
+        self._save_room_state()
+
     def _handle_room_forget_response(self, response: RoomForgetResponse):
         self.encrypted_rooms.discard(response.room_id)
 
+        if self.olm is not None:
+            self.olm.forget_room(response.room_id)
+
         if response.room_id in self.rooms:
             room = self.rooms.pop(response.room_id)
 
             if room.encrypted and self.store:
                 self.store.delete_encrypted_room(room.room_id)
 
+            if self.store and self.config.store_room_state:
+                self.store.delete_room(room.room_id)
+
         elif response.room_id in self.invited_rooms:
             del self.invited_rooms[response.room_id]
 
@@ -1046,6 +1394,17 @@ class Client:
         if not isinstance(response, Response):
             raise ValueError("Invalid response received")
 
+        self._handle_response(response)
+
+        if self.olm:
+            self.olm.save_message_indices()
+
+        if self.store:
+            self.store.flush()
+
+        return None
+
+    def _handle_response(self, response: Response) -> None:
         if isinstance(response, LoginResponse):
             self._handle_login(response)
         elif isinstance(response, LogoutResponse):
@@ -1068,6 +1427,8 @@ class Client:
             self._handle_olm_response(response)
         elif isinstance(response, JoinedMembersResponse):
             self._handle_joined_members(response)
+        elif isinstance(response, RoomGetMembersResponse):
+            self._handle_room_get_members(response)
         elif isinstance(response, RoomKeyRequestResponse):
             self._handle_olm_response(response)
         elif isinstance(response, RoomForgetResponse):
@@ -1088,8 +1449,6 @@ class Client:
             if response.soft_logout:
                 self.access_token = ""
 
-        return None
-
     @store_loaded
     def export_keys(self, outfile: str, passphrase: str, count: int = 10000):
         """Export all the Megolm decryption keys of this device.
@@ -1178,8 +1537,9 @@ class Client:
         Raises `GroupEncryptionError` if the group session for the provided
         room isn't shared yet.
 
-        Raises `MembersSyncError` if the room is encrypted but the room members
-        aren't fully loaded due to member lazy loading.
+        Raises `MembersSyncError` if the room is encrypted, the group session
+        needs to be shared and the room members aren't fully loaded due to
+        member lazy loading.
 
         Returns a tuple containing the new message type and the new encrypted
         content.
@@ -1194,7 +1554,7 @@ class Client:
         if not room.encrypted:
             raise LocalProtocolError(f"Room {room_id} is not encrypted")
 
-        if not room.members_synced:
+        if not room.members_synced and self.olm.should_share_group_session(room_id):
             raise MembersSyncError(
                 "The room is encrypted and the members " "aren't fully synced."
             )
@@ -1217,6 +1577,8 @@ class Client:
         self,
         callback: Callable[[MatrixRoom, Event], Optional[Awaitable[None]]],
         filter: Union[Type[Event], Tuple[Type[Event], None]],
+        room_id: Union[str, Iterable[str], None] = None,
+        sender: Union[str, Iterable[str], None] = None,
     ) -> None:
         """Add a callback that will be executed on room events.
 
@@ -1234,14 +1596,23 @@ class Client:
                 containing multiple types for which the function will be
                 called.
 
+            room_id (Union[str, Iterable[str]], optional): A room id or
+                multiple room ids, if given the function will only be called
+                for events of those rooms.
+
+            sender (Union[str, Iterable[str]], optional): A user id or
+                multiple user ids, if given the function will only be called
+                for events sent by those users.
+
         """
-        cb = ClientCallback(callback, filter)
+        cb = ClientCallback(callback, filter, _id_filter(room_id), _id_filter(sender))
         self.event_callbacks.append(cb)
 
     def add_ephemeral_callback(
         self,
         callback: Callable[[MatrixRoom, EphemeralEvent], None],
         filter: Union[Type[EphemeralEvent], Tuple[Type[EphemeralEvent], ...]],
+        room_id: Union[str, Iterable[str], None] = None,
     ) -> None:
         """Add a callback that will be executed on ephemeral room events.
 
@@ -1256,8 +1627,12 @@ class Client:
                 The event type or a tuple containing
                 multiple types for which the function will be called.
 
+            room_id (Union[str, Iterable[str]], optional): A room id or
+                multiple room ids, if given the function will only be called
+                for events of those rooms.
+
         """
-        cb = ClientCallback(callback, filter)
+        cb = ClientCallback(callback, filter, _id_filter(room_id))
         self.ephemeral_callbacks.append(cb)
 
     def add_global_account_data_callback(
@@ -1293,6 +1668,7 @@ class Client:
             Type[AccountDataEvent],
             Tuple[Type[AccountDataEvent], ...],
         ],
+        room_id: Union[str, Iterable[str], None] = None,
     ) -> None:
         """Add a callback that will be executed on room account data events.
 
@@ -1308,14 +1684,19 @@ class Client:
                 containing multiple types for which the function
                 will be called.
 
+            room_id (Union[str, Iterable[str]], optional): A room id or
+                multiple room ids, if given the function will only be called
+                for events of those rooms.
+
         """
-        cb = ClientCallback(callback, filter)
+        cb = ClientCallback(callback, filter, _id_filter(room_id))
         self.room_account_data_callbacks.append(cb)
 
     def add_to_device_callback(
         self,
         callback: Callable[[ToDeviceEvent], None],
         filter: Union[Type[ToDeviceEvent], Tuple[Type[ToDeviceEvent], ...]],
+        sender: Union[str, Iterable[str], None] = None,
     ) -> None:
         """Add a callback that will be executed on to-device events.
 
@@ -1330,8 +1711,12 @@ class Client:
                 containing multiple types for which the function
                 will be called.
 
+            sender (Union[str, Iterable[str]], optional): A user id or
+                multiple user ids, if given the function will only be called
+                for events sent by those users.
+
         """
-        cb = ClientCallback(callback, filter)
+        cb = ClientCallback(callback, filter, senders=_id_filter(sender))
         self.to_device_callbacks.append(cb)
 
     def add_presence_callback(
@@ -1402,7 +1787,9 @@ class Client:
                 collect all the devices.
 
         Returns a dictionary holding the user as the key and a dictionary of
-        the device id as the key and OlmDevice as the value.
+        the device id as the key and OlmDevice as the value. The dictionary is
+        cached and updated as the members and their devices change, it
+        shouldn't be modified.
 
         Raises LocalProtocolError if no room is found with the given room_id.
         """
@@ -1419,13 +1806,7 @@ class Client:
         if not room.encrypted:
             return devices
 
-        users = room.users.keys()
-
-        for user in users:
-            user_devices = self.device_store.active_user_devices(user)
-            devices[user] = {d.id: d for d in user_devices}
-
-        return devices
+        return self.olm.room_devices(room_id, room.users)
 
     @store_loaded
     def get_active_key_requests(
@@ -14,7 +14,6 @@
 
 from __future__ import annotations
 
-import json
 import logging
 import pprint
 from collections import deque
@@ -29,6 +28,7 @@ from uuid import UUID, uuid4
 import h2
 import h11
 
+from .. import json_backend
 from ..api import Api, MessageDirection, ResizingMethod, RoomPreset, RoomVisibility
 from ..crypto import OlmDevice
 from ..event_builders import ToDeviceMessage
@@ -1092,7 +1092,7 @@ class HttpClient(Client):
         Returns a dictionary representing the response.
         """
         try:
-            return json.loads(transport_response.text)
+            return json_backend.loads(transport_response.text)
         except JSONDecodeError:
             return {}
 
@@ -17,6 +17,7 @@ from .attachments import decrypt_attachment, encrypt_attachment
 
 from .async_attachments import (
     AsyncDataT,
+    async_decrypt_attachment,
     async_encrypt_attachment,
     async_generator_from_data,
 )
@@ -33,7 +34,13 @@ if package_installed("olm"):
     from .device import DeviceStore, OlmDevice, TrustState
     from .key_request import OutgoingKeyRequest
     from .log import logger
-    from .memorystores import GroupSessionStore, SessionStore
+    from .memorystores import (
+        GroupSessionStore,
+        LazyGroupSessionStore,
+        LazySessionStore,
+        MessageIndexStore,
+        SessionStore,
+    )
     from .olm_machine import Olm
     from .sas import Sas, SasState
 
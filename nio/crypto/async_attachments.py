@@ -17,18 +17,28 @@
 
 import asyncio
 import io
-from functools import partial
+from concurrent.futures import Executor
 from pathlib import Path
-from typing import Any, AsyncGenerator, AsyncIterable, Dict, Iterable, Union
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Dict,
+    Iterable,
+    Optional,
+    Union,
+)
 
 import aiofiles
+import unpaddedbase64
 from aiofiles.threadpool.binary import AsyncBufferedReader
 from Crypto import Random  # nosec
 from Crypto.Cipher import AES  # nosec
 from Crypto.Hash import SHA256  # nosec
 from Crypto.Util import Counter  # nosec
 
-from .attachments import _get_decryption_info_dict
+from ..exceptions import EncryptionError
+from .attachments import _get_decryption_cipher, _get_decryption_info_dict
 
 AsyncDataT = Union[
     str,
@@ -40,10 +50,25 @@ AsyncDataT = Union[
     AsyncBufferedReader,
 ]
 
+Buffer = Union[bytes, bytearray, memoryview]
+
 _EncryptedReturnT = AsyncGenerator[Union[bytes, Dict[str, Any]], None]
 
 
-async def async_encrypt_attachment(data: AsyncDataT) -> _EncryptedReturnT:
+# Chunks are encrypted in the thread pool, each round trip costs a couple of
+# context switches so the chunks need to be big enough to amortize them.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Chunks smaller than this are cheaper to encrypt on the event loop than to
+# hand off to the thread pool.
+_INLINE_SIZE = 64 * 1024
+
+
+async def async_encrypt_attachment(
+    data: AsyncDataT,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    executor: Optional[Executor] = None,
+) -> _EncryptedReturnT:
     """Async generator to encrypt data in order to send it as an encrypted
     attachment.
 
@@ -62,6 +87,14 @@ async def async_encrypt_attachment(data: AsyncDataT) -> _EncryptedReturnT:
             object will still allow the data to be read lazily, but
             not asynchronously.
 
+        chunk_size (int): The size of the chunks that are encrypted, smaller
+            chunks coming from iterables are merged until they reach this
+            size. Defaults to 1 MiB.
+
+        executor (Executor, optional): The executor that should encrypt the
+            chunks, the default executor of the event loop is used if none is
+            given.
+
     Yields:
         The encrypted bytes for each chunk of data.
         The last yielded value will be a dict containing the info needed to
@@ -82,18 +115,99 @@ async def async_encrypt_attachment(data: AsyncDataT) -> _EncryptedReturnT:
 
     loop = asyncio.get_event_loop()
 
-    async for chunk in async_generator_from_data(data):
-        update_crypt = partial(cipher.encrypt, chunk)
-        crypt_chunk = await loop.run_in_executor(None, update_crypt)
+    def encrypt(chunk: Buffer) -> bytes:
+        crypt_chunk = cipher.encrypt(chunk)
+        sha256.update(crypt_chunk)
+        return crypt_chunk
 
-        update_hash = partial(sha256.update, crypt_chunk)
-        await loop.run_in_executor(None, update_hash)
-
-        yield crypt_chunk
+    async for chunk in _chunked(data, chunk_size):
+        if len(chunk) < _INLINE_SIZE:
+            yield encrypt(chunk)
+        else:
+            yield await loop.run_in_executor(executor, encrypt, chunk)
 
     yield _get_decryption_info_dict(key, iv, sha256)
 
 
+async def async_decrypt_attachment(
+    ciphertext: AsyncIterable[bytes],
+    key: str,
+    hash: str,
+    iv: str,
+    executor: Optional[Executor] = None,
+) -> AsyncGenerator[bytes, None]:
+    """Async generator to decrypt an encrypted attachment chunk by chunk.
+
+    Unlike ``decrypt_attachment()``, the integrity of the data can only be
+    checked once all of it has been decrypted. Plaintext chunks are yielded
+    before the check, so they must not be used until the generator finished
+    without an exception.
+
+    Args:
+        ciphertext (AsyncIterable[bytes]): The data to decrypt.
+        key (str): AES_CTR JWK key object.
+        hash (str): Base64 encoded SHA-256 hash of the ciphertext.
+        iv (str): Base64 encoded 16 byte AES-CTR IV.
+        executor (Executor, optional): The executor that should decrypt the
+            chunks, the default executor of the event loop is used if none is
+            given.
+
+    Yields:
+        The decrypted bytes for each chunk of data.
+
+    Raises:
+        EncryptionError if the key or IV are invalid or if the integrity check
+        fails after the last chunk.
+    """
+    expected_hash = unpaddedbase64.decode_base64(hash)
+    cipher = _get_decryption_cipher(key, iv)
+    sha256 = SHA256.new()
+
+    loop = asyncio.get_event_loop()
+
+    def decrypt(chunk: Buffer) -> bytes:
+        sha256.update(chunk)
+        return cipher.decrypt(chunk)
+
+    async for chunk in ciphertext:
+        if len(chunk) < _INLINE_SIZE:
+            yield decrypt(chunk)
+        else:
+            yield await loop.run_in_executor(executor, decrypt, chunk)
+
+    if sha256.digest() != expected_hash:
+        raise EncryptionError("Mismatched SHA-256 digest.")
+
+
+async def _chunked(data: AsyncDataT, chunk_size: int) -> AsyncGenerator[Buffer, None]:
+    """Split data into chunks of at least chunk_size bytes, except the last.
+
+    The yielded buffers are only valid until the next chunk is requested.
+    """
+    if isinstance(data, bytes):
+        view = memoryview(data)
+        for i in range(0, len(view), chunk_size):
+            yield view[i : i + chunk_size]
+        return
+
+    buffer = bytearray()
+
+    async for chunk in async_generator_from_data(data, chunk_size):
+        if not buffer and len(chunk) >= chunk_size:
+            yield chunk
+            continue
+
+        buffer += chunk
+
+        if len(buffer) >= chunk_size:
+            yield buffer
+            # The consumer is done with the buffer, reuse its memory.
+            del buffer[:]
+
+    if buffer:
+        yield buffer
+
+
 async def async_generator_from_data(
     data: AsyncDataT,
     chunk_size: int = 4 * 1024,
@@ -52,6 +52,12 @@ def decrypt_attachment(ciphertext: bytes, key: str, hash: str, iv: str):
     if h.digest() != expected_hash:
         raise EncryptionError("Mismatched SHA-256 digest.")
 
+    cipher = _get_decryption_cipher(key, iv)
+
+    return cipher.decrypt(ciphertext)
+
+
+def _get_decryption_cipher(key: str, iv: str):
     try:
         byte_key: bytes = unpaddedbase64.decode_base64(key)
     except (BinAsciiError, TypeError):
@@ -71,7 +77,7 @@ def decrypt_attachment(ciphertext: bytes, key: str, hash: str, iv: str):
     except ValueError as e:
         raise EncryptionError(e)
 
-    return cipher.decrypt(ciphertext)
+    return cipher
 
 
 def encrypt_attachment(plaintext: bytes) -> Tuple[bytes, Dict[str, Any]]:
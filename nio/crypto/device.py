@@ -16,7 +16,7 @@
 from collections import defaultdict
 from dataclasses import asdict, dataclass, field
 from enum import Enum
-from typing import DefaultDict, Dict, Iterator, KeysView, Optional
+from typing import Callable, DefaultDict, Dict, Iterator, KeysView, Optional, Tuple
 
 
 # TODO document the values better.
@@ -131,15 +131,38 @@ class DeviceStore:
     >>> for device in device_store.active_user_devices("@bob:example.org"):
     ...    print(device.user_id, device.device_id)
 
+    Devices can be looked up by their keys in constant time, the keys of a
+    device that is in the store need to be changed using the update_keys
+    method so the lookups stay correct. Similarly devices should be marked as
+    deleted using the mark_deleted method.
+
+    Attributes:
+        user_changed_callback (Callable[[str], None], optional): Called with
+            the user id every time a device of a user is added, deleted or
+            has its keys changed.
+
     """
 
     def __init__(self):
         self._entries: DefaultDict[str, Dict[str, OlmDevice]] = defaultdict(dict)
+        self._key_index: Dict[str, Dict[Tuple[str, str], OlmDevice]] = {
+            "curve25519": {},
+            "ed25519": {},
+        }
+        self._active_devices: Dict[str, Dict[str, OlmDevice]] = {}
+        self.user_changed_callback: Optional[Callable[[str], None]] = None
 
     def __iter__(self) -> Iterator[OlmDevice]:
         for user_devices in self._entries.values():
             yield from user_devices.values()
 
+    def __contains__(self, device: object) -> bool:
+        if not isinstance(device, OlmDevice):
+            return False
+
+        user_devices = self._entries.get(device.user_id, {})
+        return user_devices.get(device.id) == device
+
     def __getitem__(self, user_id: str) -> Dict[str, OlmDevice]:
         return self._entries[user_id]
 
@@ -166,6 +189,33 @@ class DeviceStore:
             if not device.deleted:
                 yield device
 
+    def active_devices(self, user_id: str) -> Dict[str, OlmDevice]:
+        """Get the non-deleted devices of a user.
+
+        Args:
+            user_id (str): The user for which we would like to get the devices
+                for.
+
+        Returns a dictionary mapping the device id to the device. The
+        dictionary is cached until the devices of the user change, it
+        shouldn't be modified.
+        """
+        devices = self._active_devices.get(user_id)
+
+        if devices is None:
+            devices = {
+                device.id: device for device in self.active_user_devices(user_id)
+            }
+            self._active_devices[user_id] = devices
+
+        return devices
+
+    def _user_changed(self, user_id: str) -> None:
+        self._active_devices.pop(user_id, None)
+
+        if self.user_changed_callback:
+            self.user_changed_callback(user_id)
+
     def device_from_sender_key(
         self, user_id: str, sender_key: str
     ) -> Optional[OlmDevice]:
@@ -176,12 +226,72 @@ class DeviceStore:
             sender_key (str): The encryption key that is owned by the device,
             usually a curve25519 public key.
         """
-        for device in self.active_user_devices(user_id):
-            if device.curve25519 == sender_key:
-                return device
+        return self._device_from_key("curve25519", user_id, sender_key)
+
+    def device_from_ed25519_key(
+        self, user_id: str, ed25519_key: str
+    ) -> Optional[OlmDevice]:
+        """Get a non-deleted device of a user with the matching fingerprint key.
+
+        Args:
+            user_id (str): The user id of the device owner.
+            ed25519_key (str): The ed25519 fingerprint key of the device.
+        """
+        return self._device_from_key("ed25519", user_id, ed25519_key)
+
+    def _device_from_key(
+        self, key_type: str, user_id: str, key: str
+    ) -> Optional[OlmDevice]:
+        device = self._key_index[key_type].get((user_id, key))
+
+        # The keys of the device might have been changed behind our back.
+        if device and not device.deleted and device.keys.get(key_type) == key:
+            return device
 
         return None
 
+    def _index(self, device: OlmDevice) -> None:
+        for key_type, index in self._key_index.items():
+            key = device.keys.get(key_type)
+
+            if key is None:
+                continue
+
+            # Keys are only unique per user, another user could claim the
+            # keys of our devices. Prefer active devices over deleted ones.
+            indexed = index.get((device.user_id, key))
+
+            if indexed is None or indexed.deleted or not device.deleted:
+                index[(device.user_id, key)] = device
+
+    def _unindex(self, device: OlmDevice) -> None:
+        for key_type, index in self._key_index.items():
+            key = (device.user_id, device.keys.get(key_type))
+
+            if index.get(key) is device:
+                del index[key]
+
+    def update_keys(self, device: OlmDevice, keys: Dict[str, str]) -> None:
+        """Change the keys of a device that is in the store.
+
+        Args:
+            device (OlmDevice): The device whose keys changed.
+            keys (Dict[str, str]): The key types and the new public keys.
+        """
+        self._unindex(device)
+        device.keys.update(keys)
+        self._index(device)
+        self._user_changed(device.user_id)
+
+    def mark_deleted(self, device: OlmDevice) -> None:
+        """Mark a device that is in the store as deleted.
+
+        Args:
+            device (OlmDevice): The device that was deleted by its owner.
+        """
+        device.deleted = True
+        self._user_changed(device.user_id)
+
     @property
     def users(self) -> KeysView[str]:
         """Get the list of users that the device store knows about."""
@@ -202,5 +312,13 @@ class DeviceStore:
         if device in self:
             return False
 
+        existing = self._entries[device.user_id].get(device.id)
+
+        if existing:
+            self._unindex(existing)
+
         self._entries[device.user_id][device.id] = device
+        self._index(device)
+        self._user_changed(device.user_id)
+
         return True
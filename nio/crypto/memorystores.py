@@ -12,8 +12,22 @@
 # CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN
 # CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
-from collections import defaultdict
-from typing import DefaultDict, Dict, Iterator, List, Optional
+import struct
+import sys
+from array import array
+from collections import OrderedDict, defaultdict
+from hashlib import blake2b
+from typing import (
+    Callable,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from .sessions import InboundGroupSession, Session
 
@@ -50,6 +64,72 @@ class SessionStore:
         return self._entries[sender_key]
 
 
+class LazySessionStore(SessionStore):
+    """A SessionStore that loads the sessions of a sender key on first use.
+
+    Args:
+        load_sessions (Callable): Function returning the sessions of a sender
+            key.
+        load_all_sessions (Callable): Function returning a SessionStore with
+            all the sessions, used when the store is iterated over.
+    """
+
+    def __init__(
+        self,
+        load_sessions: Callable[[str], Iterable[Session]],
+        load_all_sessions: Callable[[], SessionStore],
+    ):
+        super().__init__()
+        self._load_sessions = load_sessions
+        self._load_all_sessions = load_all_sessions
+        self._loaded: Set[str] = set()
+        self._all_loaded = False
+
+    def _ensure_loaded(self, sender_key: str) -> None:
+        if self._all_loaded or sender_key in self._loaded:
+            return
+
+        self._loaded.add(sender_key)
+
+        for session in self._load_sessions(sender_key):
+            super().add(sender_key, session)
+
+    def _ensure_all_loaded(self) -> None:
+        if self._all_loaded:
+            return
+
+        for sender_key, sessions in self._load_all_sessions().items():
+            if sender_key not in self._loaded:
+                for session in sessions:
+                    super().add(sender_key, session)
+
+        self._all_loaded = True
+
+    def add(self, sender_key: str, session: Session) -> bool:
+        self._ensure_loaded(sender_key)
+        return super().add(sender_key, session)
+
+    def __iter__(self) -> Iterator[Session]:
+        self._ensure_all_loaded()
+        return super().__iter__()
+
+    def values(self):
+        self._ensure_all_loaded()
+        return super().values()
+
+    def items(self):
+        self._ensure_all_loaded()
+        return super().items()
+
+    def get(self, sender_key: str) -> Optional[Session]:
+        self._ensure_loaded(sender_key)
+        return super().get(sender_key)
+
+    def __getitem__(self, sender_key: str) -> List[Session]:
+        self._ensure_loaded(sender_key)
+        return super().__getitem__(sender_key)
+
+
 class GroupSessionStore:
     def __init__(self):
         self._entries = defaultdict(lambda: defaultdict(dict))
@@ -80,3 +160,303 @@ class GroupSessionStore:
         self, room_id: str
     ) -> DefaultDict[str, Dict[str, InboundGroupSession]]:
         return self._entries[room_id]
+
+
+class LazyGroupSessionStore(GroupSessionStore):
+    """A GroupSessionStore that loads sessions on first use.
+
+    The most recently used sessions are kept in memory, the least recently
+    used ones are dropped once there are more than max_sessions of them and
+    loaded again when needed. Sessions therefore need to be saved to the
+    database after they are added to the store.
+
+    Args:
+        load_session (Callable): Function returning the session with the
+            given room id, sender key and session id or None if there is no
+            such session.
+        load_all_sessions (Callable): Function returning all the sessions,
+            used when the store is iterated over.
+        max_sessions (int): The maximum number of sessions kept in memory.
+    """
+
+    def __init__(
+        self,
+        load_session: Callable[[str, str, str], Optional[InboundGroupSession]],
+        load_all_sessions: Callable[[], Iterable[InboundGroupSession]],
+        max_sessions: int = 1000,
+    ):
+        super().__init__()
+        self._load_session = load_session
+        self._load_all_sessions = load_all_sessions
+        self.max_sessions = max_sessions
+        self._cache: "OrderedDict[Tuple[str, str, str], InboundGroupSession]" = (
+            OrderedDict()
+        )
+
+    def _cache_session(
+        self, key: Tuple[str, str, str], session: InboundGroupSession
+    ) -> None:
+        self._cache[key] = session
+        self._cache.move_to_end(key)
+
+        while len(self._cache) > self.max_sessions:
+            self._cache.popitem(last=False)
+
+    def __iter__(self) -> Iterator[InboundGroupSession]:
+        for session in self._load_all_sessions():
+            key = (session.room_id, session.sender_key, session.id)
+            yield self._cache.get(key, session)
+
+    def add(self, session: InboundGroupSession) -> bool:
+        key = (session.room_id, session.sender_key, session.id)
+
+        if self._cache.get(key) is session:
+            return False
+
+        self._cache_session(key, session)
+        return True
+
+    def get(
+        self, room_id: str, sender_key: str, session_id: str
+    ) -> Optional[InboundGroupSession]:
+        key = (room_id, sender_key, session_id)
+        session = self._cache.get(key)
+
+        if session is not None:
+            self._cache.move_to_end(key)
+            return session
+
+        session = self._load_session(room_id, sender_key, session_id)
+
+        if session is not None:
+            self._cache_session(key, session)
+
+        return session
+
+    def __getitem__(
+        self, room_id: str
+    ) -> DefaultDict[str, Dict[str, InboundGroupSession]]:
+        sessions: DefaultDict[str, Dict[str, InboundGroupSession]] = defaultdict(dict)
+
+        for session in self:
+            if session.room_id == room_id:
+                sessions[session.sender_key][session.id] = session
+
+        return sessions
+
+
+def _event_digest(event_id: str, timestamp: int) -> int:
+    digest = blake2b(f"{event_id}|{timestamp}".encode(), digest_size=8).digest()
+    # Zero marks an unknown message index.
+    return int.from_bytes(digest, "little") or 1
+
+
+class _SessionIndices:
+    """The message indices of a single Megolm session.
+
+    Message indices of a session mostly arrive in order, so the event digests
+    are kept in an array indexed by the message index minus the first known
+    index. Indices that are far away from the others are kept in a dict
+    instead, a single odd index can't make the array grow without bounds.
+    """
+
+    __slots__ = ("first", "digests", "sparse")
+
+    max_gap = 1024
+
+    def __init__(self) -> None:
+        self.first = 0
+        self.digests = array("Q")
+        self.sparse: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.digests) + len(self.sparse)
+
+    def get(self, index: int) -> int:
+        offset = index - self.first
+
+        if 0 <= offset < len(self.digests):
+            return self.digests[offset]
+
+        return self.sparse.get(index, 0)
+
+    def set(self, index: int, digest: int) -> None:
+        if not self.digests:
+            self.first = index
+
+        offset = index - self.first
+        size = len(self.digests)
+
+        if 0 <= offset < size:
+            self.digests[offset] = digest
+            return
+
+        if size <= offset <= size + self.max_gap:
+            self.digests.extend(array("Q", bytes(8 * (offset - size))))
+            self.digests.append(digest)
+        elif -self.max_gap <= offset < 0:
+            self.digests[0:0] = array("Q", bytes(8 * -offset))
+            self.digests[0] = digest
+            self.first = index
+        else:
+            self.sparse[index] = digest
+            return
+
+        # The array might now cover indices that were stored sparsely.
+        for sparse_index in [i for i in self.sparse if self.get(i) == 0]:
+            self.digests[sparse_index - self.first] = self.sparse.pop(sparse_index)
+
+    def pack(self) -> bytes:
+        digests = array("Q", self.digests)
+
+        if sys.byteorder == "big":
+            digests.byteswap()
+
+        return b"".join(
+            [
+                struct.pack("<II", self.first, len(self.sparse)),
+                *(struct.pack("<IQ", *item) for item in self.sparse.items()),
+                digests.tobytes(),
+            ]
+        )
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "_SessionIndices":
+        indices = cls()
+        indices.first, sparse_count = struct.unpack_from("<II", data)
+        offset = struct.calcsize("<II")
+
+        for index, digest in struct.iter_unpack(
+            "<IQ", data[offset : offset + sparse_count * struct.calcsize("<IQ")]
+        ):
+            indices.sparse[index] = digest
+
+        indices.digests.frombytes(
+            data[offset + sparse_count * struct.calcsize("<IQ") :]
+        )
+
+        if sys.byteorder == "big":
+            indices.digests.byteswap()
+
+        return indices
+
+
+class MessageIndexStore:
+    """Replay protection for Megolm encrypted messages.
+
+    Remembers which event was decrypted with every message index of a Megolm
+    session. An event that uses a known message index is only accepted if
+    it's the same event, otherwise the message was replayed.
+
+    Instead of the event id and timestamp only an 8 byte digest of them is
+    kept, the digests of a session are packed into an array. The most
+    recently used sessions are kept in memory, the least recently used ones
+    are dropped once the store holds more than max_indices message indices.
+    If the store is backed by a database the dropped sessions are saved and
+    loaded again when needed, so the protection survives restarts and isn't
+    weakened by the memory limit.
+
+    Args:
+        load_indices (Callable, optional): Function returning the packed
+            indices of the session with the given sender key and session id,
+            or None if there are none.
+        save_indices (Callable, optional): Function saving a dict of packed
+            indices, keyed by the sender key and session id of the session.
+        max_indices (int): The maximum number of message indices kept in
+            memory.
+    """
+
+    def __init__(
+        self,
+        load_indices: Optional[Callable[[str, str], Optional[bytes]]] = None,
+        save_indices: Optional[Callable[[Dict[Tuple[str, str], bytes]], None]] = None,
+        max_indices: int = 100000,
+    ):
+        self._load_indices = load_indices
+        self._save_indices = save_indices
+        self.max_indices = max_indices
+        self._sessions: "OrderedDict[Tuple[str, str], _SessionIndices]" = OrderedDict()
+        self._changed: Set[Tuple[str, str]] = set()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _get_session(self, key: Tuple[str, str]) -> _SessionIndices:
+        indices = self._sessions.get(key)
+
+        if indices is not None:
+            self._sessions.move_to_end(key)
+            return indices
+
+        data = self._load_indices(*key) if self._load_indices else None
+        indices = _SessionIndices.unpack(data) if data else _SessionIndices()
+
+        self._sessions[key] = indices
+        self._size += len(indices)
+
+        return indices
+
+    def _evict(self) -> None:
+        evicted = {}
+
+        # The most recently used session stays even if it's too large.
+        while self._size > self.max_indices and len(self._sessions) > 1:
+            key, indices = self._sessions.popitem(last=False)
+            self._size -= len(indices)
+
+            if key in self._changed:
+                self._changed.remove(key)
+                evicted[key] = indices.pack()
+
+        if evicted and self._save_indices:
+            self._save_indices(evicted)
+
+    def check(
+        self,
+        sender_key: str,
+        session_id: str,
+        message_index: int,
+        event_id: str,
+        timestamp: int,
+    ) -> bool:
+        """Check that a message index belongs to the given event.
+
+        Unknown message indices are remembered for later checks.
+
+        Args:
+            sender_key (str): The curve25519 key of the session's sender.
+            session_id (str): The id of the Megolm session.
+            message_index (int): The message index of the decrypted message.
+            event_id (str): The id of the event.
+            timestamp (int): The origin server timestamp of the event.
+
+        Returns True if the message index is unknown or belongs to the same
+        event, False if another event used it.
+        """
+        key = (sender_key, session_id)
+        indices = self._get_session(key)
+        digest = _event_digest(event_id, timestamp)
+        known = indices.get(message_index)
+
+        if known:
+            return known == digest
+
+        size = len(indices)
+        indices.set(message_index, digest)
+        self._size += len(indices) - size
+        self._changed.add(key)
+
+        self._evict()
+
+        return True
+
+    def pop_changes(self) -> Dict[Tuple[str, str], bytes]:
+        """Get the packed indices of the sessions that changed.
+
+        The sessions are considered saved afterwards.
+        """
+        changes = {key: self._sessions[key].pack() for key in self._changed}
+        self._changed.clear()
+
+        return changes
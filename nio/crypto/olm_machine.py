@@ -14,17 +14,34 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
+from functools import partial
 from json.decoder import JSONDecodeError
-from typing import Any, DefaultDict, Dict, Iterator, List, Optional, Set, Tuple, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Collection,
+    DefaultDict,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 import olm
-from cachetools import LRUCache
 from jsonschema import SchemaError, ValidationError
 from olm import OlmGroupSessionError, OlmMessage, OlmPreKeyMessage, OlmSessionError
 
+from .. import json_backend
 from ..api import Api
 from ..crypto.sessions import Session
 from ..event_builders import DummyMessage, RoomKeyRequestMessage, ToDeviceMessage
@@ -71,6 +88,7 @@ from . import (
     GroupSessionStore,
     InboundGroupSession,
     InboundSession,
+    MessageIndexStore,
     OlmAccount,
     OlmDevice,
     OutboundGroupSession,
@@ -103,21 +121,12 @@ class Olm:
     _max_sas_life = timedelta(minutes=20)
     _unwedging_interval = timedelta(minutes=60)
 
-    # To protect against replay attacks we store a bunch of data, as the dict
-    # keys we store:
-    #   - sender key: a curve25519 public key, 43 bytes
-    #   - session id: this is the id of the megolm group session that was
-    #       used to encrypt the message, 43 bytes
-    #   - message index: an integer representing the current ratchet state, 8
-    #       bytes
-    # The values of the dict hold:
-    #   - event id: for v4/v5 rooms this is a sha256 hash encoded as
-    #       base64 + a $ sign as the prefix, 44 bytes total
-    #   - server timestamp: the origin server timestamp of the message, an
-    #       integer, 8 bytes
-    #
-    # This totals in 146 bytes per message. The cache has a limit of 100000
-    # which results in around 14 MiB of memory in total.
+    # To protect against replay attacks we remember which event used every
+    # message index of a Megolm session. Only an 8 byte digest of the event
+    # id and the server timestamp is kept for every index, packed into an
+    # array per session, see MessageIndexStore. The least recently used
+    # sessions are written to the store once more than this many indices are
+    # in memory, this limits the memory to well under 1 MiB.
     _message_index_store_size = 100000
 
     def __init__(
@@ -125,12 +134,17 @@ class Olm:
         user_id: str,
         device_id: str,
         store: MatrixStore,
+        session_cache_size: Optional[int] = None,
     ) -> None:
         # Our own user id and device id. A tuple of user_id/device_id is
         # guaranteed to be unique.
         self.user_id = user_id
         self.device_id = device_id
 
+        # If set, sessions are loaded from the store on demand and at most
+        # this many Megolm sessions are kept in memory.
+        self.session_cache_size = session_cache_size
+
         # The number of one-time keys we have uploaded on the server. If this
         # is None no action will be taken. After a sync request the client will
         # set this for us and depending on the count we will suggest the client
@@ -143,6 +157,15 @@ class Olm:
         # A store holding all the Olm devices of differing users we know about.
         self.device_store = DeviceStore()
 
+        # The active devices of the members of rooms, the rooms a user is a
+        # member of and whether all the devices of a room or a user are
+        # verified. Kept up to date as memberships, devices and the trust of
+        # devices change.
+        self._room_devices: Dict[str, Dict[str, Dict[str, OlmDevice]]] = {}
+        self._user_rooms: DefaultDict[str, Set[str]] = defaultdict(set)
+        self._room_verified: Dict[str, bool] = {}
+        self._user_verified: Dict[str, bool] = {}
+
         # A store holding all our 1on1 Olm sessions. These sessions are used to
         # exchange encrypted messages between two devices (e.g. encryption keys
         # for room message encryption are shared this way).
@@ -219,11 +242,13 @@ class Olm:
         # unwedging.
         self.outgoing_to_device_messages: List[ToDeviceMessage] = []
 
-        # A least recently used cache for replay attack protection for Megolm
-        # encrypted messages. This is a dict holding a tuple of the
-        # sender_key, the session id and message index as the key and a tuple
-        # of the event_id and origin server timestamp as the dict values.
-        self.message_index_store = LRUCache(self._message_index_store_size)
+        # Replay attack protection for Megolm encrypted messages, backed by
+        # the store.
+        self.message_index_store = MessageIndexStore(
+            store.load_message_indices,
+            store.save_message_indices,
+            self._message_index_store_size,
+        )
 
         self.store = store
 
@@ -277,14 +302,113 @@ class Olm:
         return key_count > 0
 
     def user_fully_verified(self, user_id: str) -> bool:
-        devices = self.device_store.active_user_devices(user_id)
-        for device in devices:
-            if not self.is_device_verified(device) and not self.is_device_blacklisted(
-                device
-            ):
-                return False
+        verified = self._user_verified.get(user_id)
 
-        return True
+        if verified is None:
+            verified = all(
+                self.is_device_verified(device) or self.is_device_blacklisted(device)
+                for device in self.device_store.active_devices(user_id).values()
+            )
+            self._user_verified[user_id] = verified
+
+        return verified
+
+    def room_devices(
+        self, room_id: str, members: Iterable[str]
+    ) -> Dict[str, Dict[str, OlmDevice]]:
+        """Get the active devices of the members of a room.
+
+        The devices are cached per room, changes to the members of the room
+        need to be passed to `room_member_changed()`.
+
+        Args:
+            room_id (str): The id of the room.
+            members (Iterable[str]): The user ids of the members of the room,
+                only used if the room isn't cached yet.
+
+        Returns a dictionary mapping the user id to a dictionary mapping the
+        device id to the device. It shouldn't be modified.
+        """
+        devices = self._room_devices.get(room_id)
+
+        if devices is None:
+            devices = {}
+
+            for user_id in members:
+                devices[user_id] = self.device_store.active_devices(user_id)
+                self._user_rooms[user_id].add(room_id)
+
+            self._room_devices[room_id] = devices
+
+        return devices
+
+    def room_fully_verified(self, room_id: str, members: Iterable[str]) -> bool:
+        """Check if all the devices of the members of a room are verified.
+
+        Blacklisted devices count as verified, the result is cached until a
+        member of the room, or the devices or trust of one of them change.
+
+        Args:
+            room_id (str): The id of the room.
+            members (Iterable[str]): The user ids of the members of the room,
+                only used if the room isn't cached yet.
+        """
+        verified = self._room_verified.get(room_id)
+
+        if verified is None:
+            verified = all(
+                self.user_fully_verified(user_id)
+                for user_id in self.room_devices(room_id, members)
+            )
+            self._room_verified[room_id] = verified
+
+        return verified
+
+    def room_member_changed(self, room_id: str, user_id: str, member: bool) -> None:
+        """Update the cached devices of a room after a membership change.
+
+        Args:
+            room_id (str): The id of the room.
+            user_id (str): The id of the user whose membership changed.
+            member (bool): Is the user a member of the room now.
+        """
+        devices = self._room_devices.get(room_id)
+
+        if devices is None:
+            return
+
+        if member:
+            devices[user_id] = self.device_store.active_devices(user_id)
+            self._user_rooms[user_id].add(room_id)
+        else:
+            devices.pop(user_id, None)
+            self._user_rooms[user_id].discard(room_id)
+
+        self._room_verified.pop(room_id, None)
+
+    def forget_room(self, room_id: str) -> None:
+        """Drop the cached devices of a room."""
+        for user_id in self._room_devices.pop(room_id, {}):
+            self._user_rooms[user_id].discard(room_id)
+
+        self._room_verified.pop(room_id, None)
+
+    def _user_devices_changed(self, user_id: str) -> None:
+        self._user_trust_changed(user_id)
+
+        rooms = self._user_rooms.get(user_id)
+
+        if rooms:
+            devices = self.device_store.active_devices(user_id)
+
+            for room_id in rooms:
+                self._room_devices[room_id][user_id] = devices
+
+    def _user_trust_changed(self, user_id: str) -> None:
+        self._user_verified.pop(user_id, None)
+
+        for room_id in self._user_rooms.get(user_id, ()):
+            self._room_verified.pop(room_id, None)
 
     def share_keys(self) -> Dict[str, Any]:
         def generate_one_time_keys(current_key_count: int) -> None:
@@ -356,10 +480,36 @@ class Olm:
         return content
 
     def _olm_encrypt(self, session, recipient_device, message_type, content):
+        olm_dict = self._olm_encrypt_payload(
+            self.user_id,
+            self.device_id,
+            self.account.identity_keys,
+            session,
+            recipient_device,
+            message_type,
+            content,
+        )
+        self.store.save_session(recipient_device.curve25519, session)
+
+        return olm_dict
+
+    @classmethod
+    def _olm_encrypt_payload(
+        cls,
+        user_id: str,
+        device_id: str,
+        identity_keys: Dict[str, str],
+        session: Session,
+        recipient_device: OlmDevice,
+        message_type: str,
+        content: Dict[Any, Any],
+    ) -> Dict[str, Any]:
+        # This doesn't touch the account, so it can run on a worker thread,
+        # the session serializes its own use with a lock.
         payload = {
-            "sender": self.user_id,
-            "sender_device": self.device_id,
-            "keys": {"ed25519": self.account.identity_keys["ed25519"]},
+            "sender": user_id,
+            "sender_device": device_id,
+            "keys": {"ed25519": identity_keys["ed25519"]},
             "recipient": recipient_device.user_id,
             "recipient_keys": {
                 "ed25519": recipient_device.ed25519,
@@ -369,11 +519,10 @@ class Olm:
         }
 
         olm_message = session.encrypt(Api.to_json(payload))
-        self.store.save_session(recipient_device.curve25519, session)
 
         return {
-            "algorithm": self._olm_algorithm,
-            "sender_key": self.account.identity_keys["curve25519"],
+            "algorithm": cls._olm_algorithm,
+            "sender_key": identity_keys["curve25519"],
             "ciphertext": {
                 recipient_device.curve25519: {
                     "type": olm_message.message_type,
@@ -777,7 +926,7 @@ class Olm:
                         continue
 
                     if device.curve25519 != curve_key:
-                        device.curve25519 = curve_key
+                        self.device_store.update_keys(device, {"curve25519": curve_key})
                         logger.info(
                             "Updating curve key in the device store "
                             f"for user {user_id} with device id {device_id}"
@@ -800,7 +949,7 @@ class Olm:
 
             for device_id in deleted_devices:
                 device = self.device_store[user_id][device_id]
-                device.deleted = True
+                self.device_store.mark_deleted(device)
                 logger.info(f"Marking device {user_id} of user {device_id} as deleted")
                 changed[user_id][device_id] = device
 
@@ -891,13 +1040,19 @@ class Olm:
         return session
 
     def blacklist_device(self, device: OlmDevice) -> bool:
-        return self.store.blacklist_device(device)
+        changed = self.store.blacklist_device(device)
+        self._user_trust_changed(device.user_id)
+        return changed
 
     def unblacklist_device(self, device: OlmDevice) -> bool:
-        return self.store.unblacklist_device(device)
+        changed = self.store.unblacklist_device(device)
+        self._user_trust_changed(device.user_id)
+        return changed
 
     def verify_device(self, device: OlmDevice) -> bool:
-        return self.store.verify_device(device)
+        changed = self.store.verify_device(device)
+        self._user_trust_changed(device.user_id)
+        return changed
 
     def is_device_verified(self, device: OlmDevice) -> bool:
         return self.store.is_device_verified(device)
@@ -906,13 +1061,19 @@ class Olm:
         return self.store.is_device_blacklisted(device)
 
     def unverify_device(self, device: OlmDevice) -> bool:
-        return self.store.unverify_device(device)
+        changed = self.store.unverify_device(device)
+        self._user_trust_changed(device.user_id)
+        return changed
 
     def ignore_device(self, device: OlmDevice) -> bool:
-        return self.store.ignore_device(device)
+        changed = self.store.ignore_device(device)
+        self._user_trust_changed(device.user_id)
+        return changed
 
     def unignore_device(self, device: OlmDevice) -> bool:
-        return self.store.unignore_device(device)
+        changed = self.store.unignore_device(device)
+        self._user_trust_changed(device.user_id)
+        return changed
 
     def is_device_ignored(self, device: OlmDevice) -> bool:
         return self.store.is_device_ignored(device)
@@ -1272,21 +1433,13 @@ class Olm:
         Returns True if the message is ok, False if we found conflicting event
         info indicating a replay attack.
         """
-        store_key = (event.sender_key, event.session_id, message_index)
-
-        try:
-            event_id, timestamp = self.message_index_store[store_key]
-        except KeyError:
-            self.message_index_store[store_key] = (
-                event.event_id,
-                event.server_timestamp,
-            )
-            return True
-
-        if event_id != event.event_id or timestamp != event.server_timestamp:
-            return False
-
-        return True
+        return self.message_index_store.check(
+            event.sender_key,
+            event.session_id,
+            message_index,
+            event.event_id,
+            event.server_timestamp,
+        )
 
     def check_if_wedged(self, event: MegolmEvent):
         """Check if a Megolm event failed decryption because they keys got lost
@@ -1357,8 +1510,116 @@ class Olm:
         if not room_id:
             raise EncryptionError("Event doesn't contain a room id")
 
-        verified = False
+        session = self._get_megolm_session(event, room_id)
+
+        try:
+            plaintext, message_index = session.decrypt(event.ciphertext)
+        except OlmGroupSessionError as e:
+            message = f"Error decrypting megolm event: {str(e)}"
+            logger.warning(message)
+            raise EncryptionError(message)
+
+        return self._megolm_plaintext_to_event(
+            event, room_id, session, plaintext, message_index
+        )
+
+    async def decrypt_megolm_events(
+        self,
+        events: List[MegolmEvent],
+        room_id: Optional[str] = None,
+        executor: Optional[Executor] = None,
+    ) -> List[Optional[Union[Event, BadEvent]]]:
+        """Decrypt a batch of Megolm events without blocking the event loop.
+
+        The events are grouped by their group session and the ciphertexts of
+        every group are decrypted by libolm in a single job on the executor.
+        The decrypted payloads are then checked and turned into events on the
+        event loop in the order of the given events, so the message index
+        replay protection behaves exactly as with `decrypt_megolm_event()`.
+
+        Args:
+            events (List[MegolmEvent]): The events that should be decrypted.
+            room_id (str, optional): The room id of the events, if not given
+                the room id of the events themselves is used.
+            executor (Executor, optional): The executor that should run the
+                libolm work, the default executor of the loop if not given.
+
+        Returns a list with the decrypted event for every given event, or None
+        if the event couldn't be decrypted.
+        """
+        results: List[Optional[Union[Event, BadEvent]]] = [None] * len(events)
+        batches: Dict[Tuple[str, str, str], List[int]] = defaultdict(list)
+
+        for index, event in enumerate(events):
+            event_room_id = room_id or event.room_id
+
+            if not event_room_id:
+                logger.warning("Event doesn't contain a room id")
+                continue
+
+            batches[(event_room_id, event.sender_key, event.session_id)].append(index)
+
+        loop = asyncio.get_running_loop()
+        batch_sessions = []
+        jobs = []
+
+        for (event_room_id, _, _), indices in batches.items():
+            try:
+                session = self._get_megolm_session(events[indices[0]], event_room_id)
+            except EncryptionError:
+                for index in indices[1:]:
+                    self.check_if_wedged(events[index])
+                continue
+
+            decrypt = partial(
+                self._decrypt_megolm_batch,
+                session,
+                [events[index].ciphertext for index in indices],
+            )
+            batch_sessions.append((event_room_id, session, indices))
+            jobs.append(loop.run_in_executor(executor, decrypt))
+
+        decrypted = {}
+
+        for (event_room_id, session, indices), batch in zip(
+            batch_sessions, await asyncio.gather(*jobs)
+        ):
+            for index, result in zip(indices, batch):
+                decrypted[index] = (event_room_id, session, result)
+
+        for index in sorted(decrypted):
+            event_room_id, session, result = decrypted[index]
+
+            if isinstance(result, OlmGroupSessionError):
+                logger.warning(f"Error decrypting megolm event: {str(result)}")
+                continue
+
+            try:
+                results[index] = self._megolm_plaintext_to_event(
+                    events[index], event_room_id, session, *result
+                )
+            except EncryptionError:
+                pass
+
+        return results
+
+    @staticmethod
+    def _decrypt_megolm_batch(
+        session: InboundGroupSession, ciphertexts: List[str]
+    ) -> List[Union[Tuple[str, int], OlmGroupSessionError]]:
+        results: List[Union[Tuple[str, int], OlmGroupSessionError]] = []
+
+        for ciphertext in ciphertexts:
+            try:
+                results.append(session.decrypt(ciphertext))
+            except OlmGroupSessionError as e:  # noqa: PERF203
+                results.append(e)
 
+        return results
+
+    def _get_megolm_session(
+        self, event: MegolmEvent, room_id: str
+    ) -> InboundGroupSession:
         session = self.inbound_group_store.get(
             room_id, event.sender_key, event.session_id
         )
@@ -1372,12 +1633,17 @@ class Olm:
             logger.warning(message)
             raise EncryptionError(message)
 
-        try:
-            plaintext, message_index = session.decrypt(event.ciphertext)
-        except OlmGroupSessionError as e:
-            message = f"Error decrypting megolm event: {str(e)}"
-            logger.warning(message)
-            raise EncryptionError(message)
+        return session
+
+    def _megolm_plaintext_to_event(
+        self,
+        event: MegolmEvent,
+        room_id: str,
+        session: InboundGroupSession,
+        plaintext: str,
+        message_index: int,
+    ) -> Union[Event, BadEvent]:
+        verified = False
 
         if not self.message_index_ok(message_index, event):
             raise EncryptionError(
@@ -1420,7 +1686,7 @@ class Olm:
                     verified = True
 
         try:
-            parsed_dict: Dict[Any, Any] = json.loads(plaintext)
+            parsed_dict: Dict[Any, Any] = json_backend.loads(plaintext)
         except JSONDecodeError as e:
             raise EncryptionError(f"Error parsing payload: {str(e)}")
 
@@ -1541,7 +1807,7 @@ class Olm:
 
         # The plaintext should be valid json, let's parse it and verify it.
         try:
-            parsed_payload = json.loads(plaintext)
+            parsed_payload = json_backend.loads(plaintext)
         except JSONDecodeError as e:
             # Failed parsing the payload, return early.
             logger.error(f"Failed to parse Olm message payload: {str(e)}")
@@ -1624,9 +1890,14 @@ class Olm:
 
         return payload_dict
 
-    def share_group_session_parallel(
-        self, room_id: str, users: List[str], ignore_unverified_devices: bool = False
-    ) -> Iterator[Tuple[Set[Tuple[str, str]], Dict[str, Any]]]:
+    def _group_session_recipients(
+        self,
+        room_id: str,
+        users: List[str],
+        ignore_unverified_devices: bool,
+        skip: Collection[Tuple[str, str]] = (),
+        rotate: bool = True,
+    ) -> Tuple[Dict[str, Any], List[Tuple[str, OlmDevice, Session]]]:
         logger.info(f"Sharing group session for room {room_id}")
 
         if room_id not in self.outbound_group_sessions:
@@ -1634,7 +1905,7 @@ class Olm:
 
         group_session = self.outbound_group_sessions[room_id]
 
-        if group_session.shared:
+        if group_session.shared and rotate:
             self.create_outbound_group_session(room_id)
             group_session = self.outbound_group_sessions[room_id]
 
@@ -1652,7 +1923,7 @@ class Olm:
         mark_as_ignored = []
 
         for user_id in users:
-            for device in self.device_store.active_user_devices(user_id):
+            for device in self.device_store.active_devices(user_id).values():
                 # No need to share the session with our own device
                 if device.id == self.device_id:
                     ignored_set.add((user_id, device.id))
@@ -1662,10 +1933,11 @@ class Olm:
                     ignored_set.add((user_id, device.id))
                     continue
 
-                if (user_id, device.id) in already_shared_set or (
-                    user_id,
-                    device.id,
-                ) in ignored_set:
+                if (
+                    (user_id, device.id) in already_shared_set
+                    or (user_id, device.id) in ignored_set
+                    or (user_id, device.id) in skip
+                ):
                     continue
 
                 session = self.session_store.get(device.curve25519)
@@ -1694,6 +1966,68 @@ class Olm:
         if mark_as_ignored:
             self.store.ignore_devices(mark_as_ignored)
 
+        return key_content, user_map
+
+    def check_group_session_recipients(
+        self,
+        users: List[str],
+        ignore_unverified_devices: bool = False,
+        pending: Collection[Tuple[str, str]] = (),
+    ) -> None:
+        """Check the trust of the devices a group session will be shared with.
+
+        Sharing a group session in multiple rounds needs to check every
+        recipient before the first round is sent, otherwise an unverified
+        device that only gets an Olm session later on would abort the sharing
+        after the room key was already sent to the other devices.
+
+        Args:
+            users (List[str]): The members of the room.
+            ignore_unverified_devices (bool): Mark unverified devices as
+                ignored instead of raising an OlmUnverifiedDeviceError.
+            pending (Collection[Tuple[str, str]]): (user id, device id) pairs
+                of devices that don't have an Olm session yet but will get
+                one before the session is shared with them.
+
+        Raises OlmUnverifiedDeviceError if an unverified device would receive
+        the session and unverified devices shouldn't be ignored.
+        """
+        mark_as_ignored = []
+
+        for user_id in users:
+            for device in self.device_store.active_devices(user_id).values():
+                if device.id == self.device_id or self.is_device_blacklisted(device):
+                    continue
+
+                # Devices without a session that aren't about to get one
+                # won't receive the session.
+                if (user_id, device.id) not in pending and not self.session_store.get(
+                    device.curve25519
+                ):
+                    continue
+
+                if self.is_device_verified(device) or self.is_device_ignored(device):
+                    continue
+
+                if not ignore_unverified_devices:
+                    raise OlmUnverifiedDeviceError(
+                        device,
+                        f"Device {device.id} for user {device.user_id} is not "
+                        f"verified or blacklisted.",
+                    )
+
+                mark_as_ignored.append(device)
+
+        if mark_as_ignored:
+            self.store.ignore_devices(mark_as_ignored)
+
+    def share_group_session_parallel(
+        self, room_id: str, users: List[str], ignore_unverified_devices: bool = False
+    ) -> Iterator[Tuple[Set[Tuple[str, str]], Dict[str, Any]]]:
+        key_content, user_map = self._group_session_recipients(
+            room_id, users, ignore_unverified_devices
+        )
+
         for user_map_chunk in chunks(user_map, self._maxToDeviceMessagesPerRequest):
             to_device_dict: Dict[str, Any] = {"messages": {}}
             sharing_with = set()
@@ -1709,6 +2043,120 @@ class Olm:
 
             yield (sharing_with, to_device_dict)
 
+    async def share_group_session_chunks(
+        self,
+        room_id: str,
+        users: List[str],
+        ignore_unverified_devices: bool = False,
+        executor: Optional[Executor] = None,
+        max_workers: int = 4,
+        skip: Collection[Tuple[str, str]] = (),
+        rotate: bool = True,
+    ) -> AsyncIterator[Tuple[Set[Tuple[str, str]], Dict[str, Any]]]:
+        """Encrypt the group session of a room without blocking the event loop.
+
+        This shares the session with the same devices as
+        `share_group_session_parallel()`, but the to-device chunks are
+        encrypted on the executor, up to `max_workers` chunks at a time. The
+        chunks are yielded in order as soon as they are encrypted, so the
+        first one can be sent while the later ones are still being
+        encrypted. Olm sessions take a lock while they encrypt, so the event
+        loop can keep using them while the chunks are encrypted.
+
+        Args:
+            room_id (str): The id of the room whose group session should be
+                shared.
+            users (List[str]): The members of the room.
+            ignore_unverified_devices (bool): Mark unverified devices as
+                ignored instead of raising an OlmUnverifiedDeviceError.
+            executor (Executor, optional): The executor that should run the
+                libolm work, the default executor of the loop if not given.
+                Olm sessions can't be pickled, so this needs to be a thread
+                pool.
+            max_workers (int): How many chunks can be encrypted concurrently.
+            skip (Collection[Tuple[str, str]]): (user id, device id) pairs
+                of devices that shouldn't receive the session, e.g. because
+                it's already on its way to them.
+            rotate (bool): Create a new group session if the current one was
+                already shared. Sharing a session in multiple rounds needs to
+                disable this for every round after the first one.
+
+        Yields a tuple of the set of (user id, device id) pairs and the
+        to-device message content of every chunk.
+        """
+        key_content, user_map = self._group_session_recipients(
+            room_id, users, ignore_unverified_devices, skip, rotate
+        )
+
+        loop = asyncio.get_running_loop()
+        encrypt = partial(
+            self._olm_encrypt_chunk,
+            self.user_id,
+            self.device_id,
+            dict(self.account.identity_keys),
+            key_content,
+        )
+
+        pending: Deque[
+            Tuple[List[Tuple[str, OlmDevice, Session]], asyncio.Future]
+        ] = deque()
+
+        def submit(chunk):
+            job = loop.run_in_executor(executor, encrypt, chunk)
+            pending.append((chunk, job))
+
+        async def finish():
+            chunk, job = pending.popleft()
+            olm_dicts = await job
+
+            to_device_dict: Dict[str, Any] = {"messages": {}}
+            sharing_with = set()
+
+            for (user_id, device, session), olm_dict in zip(chunk, olm_dicts):
+                self.store.save_session(device.curve25519, session)
+                sharing_with.add((user_id, device.id))
+                to_device_dict["messages"].setdefault(user_id, {})[device.id] = olm_dict
+
+            return sharing_with, to_device_dict
+
+        try:
+            for chunk in chunks(user_map, self._maxToDeviceMessagesPerRequest):
+                submit(chunk)
+
+                if len(pending) >= max(max_workers, 1):
+                    yield await finish()
+
+            while pending:
+                yield await finish()
+
+        finally:
+            # Jobs that already started can't be stopped, they only advance
+            # the ratchet of their sessions which is saved with the next use.
+            for _, job in pending:
+                job.cancel()
+
+    @classmethod
+    def _olm_encrypt_chunk(
+        cls,
+        user_id: str,
+        device_id: str,
+        identity_keys: Dict[str, str],
+        key_content: Dict[str, Any],
+        chunk: List[Tuple[str, OlmDevice, Session]],
+    ) -> List[Dict[str, Any]]:
+        return [
+            cls._olm_encrypt_payload(
+                user_id,
+                device_id,
+                identity_keys,
+                session,
+                device,
+                "m.room_key",
+                key_content,
+            )
+            for _, device, session in chunk
+        ]
+
     def share_group_session(
         self,
         room_id: str,
@@ -1741,7 +2189,7 @@ class Olm:
         mark_as_ignored = []
 
         for user_id in users:
-            for device in self.device_store.active_user_devices(user_id):
+            for device in self.device_store.active_devices(user_id).values():
                 # No need to share the session with our own device
                 if device.id == self.device_id:
                     ignored_set.add((user_id, device.id))
@@ -1804,9 +2252,21 @@ class Olm:
         return sharing_with, to_device_dict
 
     def load(self) -> None:
-        self.session_store = self.store.load_sessions()
-        self.inbound_group_store = self.store.load_inbound_group_sessions()
+        if self.session_cache_size is None:
+            self.session_store = self.store.load_sessions()
+            self.inbound_group_store = self.store.load_inbound_group_sessions()
+        else:
+            self.session_store = self.store.load_sessions(lazy=True)
+            self.inbound_group_store = self.store.load_inbound_group_sessions(
+                lazy=True, max_sessions=self.session_cache_size
+            )
         self.device_store = self.store.load_device_keys()
+        self.device_store.user_changed_callback = self._user_devices_changed
+
+        self._room_devices.clear()
+        self._user_rooms.clear()
+        self._room_verified.clear()
+        self._user_verified.clear()
         self.outgoing_key_requests = self.store.load_outgoing_key_requests()
 
     def save_session(self, curve_key: str, session: Session) -> None:
@@ -1815,6 +2275,13 @@ class Olm:
     def save_inbound_group_session(self, session: InboundGroupSession) -> None:
         self.store.save_inbound_group_session(session)
 
+    def save_message_indices(self) -> None:
+        """Write the replay protection indices that changed to the store."""
+        changes = self.message_index_store.pop_changes()
+
+        if changes:
+            self.store.save_message_indices(changes)
+
     def save_account(self, account: Optional[OlmAccount] = None) -> None:
         if account:
             self.store.save_account(account)
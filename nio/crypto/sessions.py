@@ -16,6 +16,7 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
+from threading import Lock
 from typing import List, Optional, Set, Tuple
 
 import olm
@@ -49,7 +50,33 @@ class _SessionExpirationMixin:
         return False
 
 
-class Session(olm.Session, _SessionExpirationMixin):
+class _SessionLockMixin:
+    """Serialize the use of an Olm session across threads.
+
+    libolm sessions aren't thread safe. Room keys are encrypted on worker
+    threads while the event loop may decrypt, encrypt or store a message with
+    the same session, so every use of the session takes its lock.
+    """
+
+    def __new__(cls, *args):
+        session = super().__new__(cls, *args)
+        session.lock = Lock()
+        return session
+
+    def decrypt(self, ciphertext, unicode_errors="replace"):
+        with self.lock:
+            return super().decrypt(ciphertext, unicode_errors)
+
+    def encrypt(self, plaintext):
+        with self.lock:
+            return super().encrypt(plaintext)
+
+    def pickle(self, passphrase=""):
+        with self.lock:
+            return super().pickle(passphrase)
+
+
+class Session(_SessionLockMixin, olm.Session, _SessionExpirationMixin):
     def __init__(self):
         super().__init__()
         self.creation_time = datetime.now()
@@ -80,7 +107,7 @@ class Session(olm.Session, _SessionExpirationMixin):
         return super().encrypt(plaintext)
 
 
-class InboundSession(olm.InboundSession, _SessionExpirationMixin):
+class InboundSession(_SessionLockMixin, olm.InboundSession, _SessionExpirationMixin):
     def __new__(cls, *args):
         return super().__new__(cls, *args)
 
@@ -98,7 +125,7 @@ class InboundSession(olm.InboundSession, _SessionExpirationMixin):
         return super().encrypt(plaintext)
 
 
-class OutboundSession(olm.OutboundSession, _SessionExpirationMixin):
+class OutboundSession(_SessionLockMixin, olm.OutboundSession, _SessionExpirationMixin):
     def __new__(cls, *args):
         return super().__new__(cls, *args)
 
@@ -212,6 +239,21 @@ class OutboundGroupSession(olm.OutboundGroupSession):
             return True
         return False
 
+    def should_rotate_soon(self, margin: float) -> bool:
+        """Will the session need to be rotated soon?
+
+        Args:
+            margin (float): The fraction of the maximum age and of the
+                maximum message count that counts as soon, e.g. 0.1 if the
+                session is in the last 10% of its lifetime.
+
+        Returns:
+            True if it will, False if not.
+        """
+        return self.message_count >= self.max_messages * (
+            1 - margin
+        ) or datetime.now() - self.creation_time >= self.max_age * (1 - margin)
+
     def encrypt(self, plaintext):
         if not self.shared:
             raise EncryptionError("Error, session is not shared")
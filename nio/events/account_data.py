@@ -23,14 +23,27 @@ across installations on a particular device.
 
 from __future__ import annotations
 
+import operator
 import re
 from dataclasses import dataclass, field
-from fnmatch import fnmatchcase
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+from fnmatch import translate
+from functools import lru_cache
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
 
 from ..api import PushRuleKind
 from ..schemas import Schemas
-from .misc import verify, verify_or_none
+from .misc import EventRegistry, verify, verify_or_none
 from .room_events import Event
 
 if TYPE_CHECKING:
@@ -41,18 +54,32 @@ if TYPE_CHECKING:
 class AccountDataEvent:
     """Abstract class for account data events."""
 
+    _event_types: ClassVar[EventRegistry]
+
+    @staticmethod
+    def register_event_type(event_type: str, parser: Callable) -> None:
+        """Register a parser for an account data event type.
+
+        Registered parsers are used by parse_event() and replace the built-in
+        parser for the same event type, if there is one.
+
+        Args:
+            event_type (str): The type of the event.
+            parser (Callable): An AccountDataEvent subclass or a callable that takes
+                the event dictionary and returns an event.
+        """
+        AccountDataEvent._event_types.register(event_type, parser)
+
     @classmethod
     @verify(Schemas.account_data)
     def parse_event(
         cls,
         event_dict: Dict[Any, Any],
     ):
-        if event_dict["type"] == "m.fully_read":
-            return FullyReadEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.tag":
-            return TagEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.push_rules":
-            return PushRulesEvent.from_dict(event_dict)
+        parser = AccountDataEvent._event_types.get(event_dict["type"])
+
+        if parser is not None:
+            return parser(event_dict)
 
         return UnknownAccountDataEvent.from_dict(event_dict)
 
@@ -110,6 +137,21 @@ class TagEvent(AccountDataEvent):
         return cls(content["tags"])
 
 
+@lru_cache(maxsize=4096)
+def _compile_glob(pattern: str, words: bool = False) -> Pattern[str]:
+    # If words is set the pattern needs to match whole words, the value that
+    # is matched needs to be surrounded by spaces.
+    if words:
+        pattern = f"*[!a-z0-9]{pattern}[!a-z0-9]*"
+
+    return re.compile(translate(pattern))
+
+
+@lru_cache(maxsize=1024)
+def _compile_display_name(display_name: str) -> Pattern[str]:
+    return re.compile(rf"(^|\W){re.escape(display_name)}(\W|$)", re.IGNORECASE)
+
+
 @dataclass
 class PushCondition:
     """A condition for a push rule to match an event."""
@@ -183,7 +225,7 @@ class PushEventMatch(PushCondition):
         display_name: str,
     ) -> bool:
         if self.key == "room_id":
-            return fnmatchcase(room.room_id, self.pattern)
+            return _compile_glob(self.pattern).match(room.room_id) is not None
 
         value = event.flattened().get(self.key)
 
@@ -191,10 +233,10 @@ class PushEventMatch(PushCondition):
             return False
 
         if self.key == "content.body":
-            pattern = f"*[!a-z0-9]{self.pattern.lower()}[!a-z0-9]*"
-            return fnmatchcase(f" {value.lower()} ", pattern)
+            regex = _compile_glob(self.pattern.lower(), words=True)
+            return regex.match(f" {value.lower()} ") is not None
 
-        return fnmatchcase(value.lower(), self.pattern.lower())
+        return _compile_glob(self.pattern.lower()).match(value.lower()) is not None
 
 
 @dataclass
@@ -219,8 +261,7 @@ class PushContainsDisplayName(PushCondition):
         if not isinstance(body, str):
             return False
 
-        pattern = rf"(^|\W){re.escape(display_name)}(\W|$)"
-        return bool(re.match(pattern, body, re.IGNORECASE))
+        return _compile_display_name(display_name).match(body) is not None
 
 
 @dataclass
@@ -254,16 +295,17 @@ class PushRoomMemberCount(PushCondition):
         room: MatrixRoom,
         display_name: str,
     ) -> bool:
-        if self.operator == "==":
-            return room.joined_count == self.count
-        elif self.operator == "<":
-            return room.joined_count < self.count
-        elif self.operator == ">":
-            return room.joined_count > self.count
-        elif self.operator == "<=":
-            return room.joined_count <= self.count
-        else:
-            return room.joined_count >= self.count
+        compare = _MEMBER_COUNT_OPERATORS.get(self.operator, operator.ge)
+        return compare(room.joined_count, self.count)
+
+
+_MEMBER_COUNT_OPERATORS: Dict[str, Callable[[int, int], bool]] = {
+    "==": operator.eq,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+}
 
 
 @dataclass
@@ -539,6 +581,8 @@ class PushRuleset:
     ) -> Optional[PushRule]:
         """Return the push rule in this set that matches a room event, if any.
 
+        Use `compile()` to match many events against the same ruleset.
+
         Args:
             event (Event): The room event to match.
             room (MatrixRoom): The room that this event is part of.
@@ -567,12 +611,228 @@ class PushRuleset:
 
         return cls(**kwargs)
 
+    def compile(self) -> PushRuleEvaluator:
+        """Compile the ruleset for matching many events.
+
+        The returned evaluator doesn't follow later changes to the ruleset,
+        it needs to be compiled again after the rules changed.
+        """
+        return PushRuleEvaluator(self)
+
     def __bool__(self) -> bool:
         return bool(
             self.override or self.content or self.room or self.sender or self.underride,
         )
 
 
+class _PushContext:
+    __slots__ = ("event", "room", "display_name", "_flat")
+
+    def __init__(self, event: Event, room: MatrixRoom, display_name: str) -> None:
+        self.event = event
+        self.room = room
+        self.display_name = display_name
+        self._flat: Optional[Dict[str, Any]] = None
+
+    @property
+    def flat(self) -> Dict[str, Any]:
+        if self._flat is None:
+            self._flat = self.event.flattened()
+
+        return self._flat
+
+
+_PushCheck = Callable[[_PushContext], bool]
+_CompiledRule = Tuple[PushRule, Tuple[_PushCheck, ...]]
+
+
+class PushRuleEvaluator:
+    """A PushRuleset compiled for matching many events.
+
+    Matches events exactly like `PushRuleset.matching_rule()`, but the glob
+    patterns of the rules are compiled to regular expressions up front, room
+    and sender rules are looked up by their id, every event is flattened at
+    most once and the display name regex is cached per room.
+
+    The evaluator is created by `PushRuleset.compile()` and is a snapshot of
+    the ruleset, changes to the ruleset need a new evaluator.
+
+    Args:
+        ruleset (PushRuleset): The ruleset to compile.
+
+    Example:
+        >>> evaluator = push_rules.global_rules.compile()
+        >>> for event in response.timeline.events:
+        ...     rule = evaluator.matching_rule(event, room, display_name)
+    """
+
+    def __init__(self, ruleset: PushRuleset) -> None:
+        self._display_names: Dict[str, Tuple[str, Pattern[str]]] = {}
+
+        self._override = self._compile_rules(ruleset.override)
+        self._content = self._compile_rules(ruleset.content)
+        self._underride = self._compile_rules(ruleset.underride)
+
+        # Room and sender rules match their id exactly unless it contains
+        # glob characters, those need to be matched one by one.
+        self._rooms = self._index_rules(ruleset.room, lambda rule_id: rule_id)
+        self._senders = self._index_rules(ruleset.sender, str.lower)
+        self._room = (
+            [] if self._rooms is not None else self._compile_rules(ruleset.room)
+        )
+        self._sender = (
+            [] if self._senders is not None else self._compile_rules(ruleset.sender)
+        )
+
+    @staticmethod
+    def _index_rules(
+        rules: List[PushRule], key: Callable[[str], str]
+    ) -> Optional[Dict[str, PushRule]]:
+        index: Dict[str, PushRule] = {}
+
+        for rule in rules:
+            if not rule.enabled:
+                continue
+
+            if any(char in rule.id for char in "*?["):
+                return None
+
+            index.setdefault(key(rule.id), rule)
+
+        return index
+
+    def _compile_rules(self, rules: List[PushRule]) -> List[_CompiledRule]:
+        compiled = []
+
+        for rule in rules:
+            if not rule.enabled:
+                continue
+
+            conditions = rule.conditions
+
+            if rule.kind == PushRuleKind.content:
+                conditions = [PushEventMatch("content.body", rule.pattern)]
+            elif rule.kind == PushRuleKind.room:
+                conditions = [PushEventMatch("room_id", rule.id)]
+            elif rule.kind == PushRuleKind.sender:
+                conditions = [PushEventMatch("sender", rule.id)]
+
+            compiled.append(
+                (rule, tuple(self._compile_condition(c) for c in conditions))
+            )
+
+        return compiled
+
+    def _compile_condition(self, condition: PushCondition) -> _PushCheck:
+        # Subclasses might match differently, they are asked directly.
+        if type(condition) is PushEventMatch:
+            return self._compile_event_match(condition)
+
+        if type(condition) is PushContainsDisplayName:
+            return self._contains_display_name
+
+        if type(condition) is PushRoomMemberCount:
+            compare = _MEMBER_COUNT_OPERATORS.get(condition.operator, operator.ge)
+            count = condition.count
+            return lambda context: compare(context.room.joined_count, count)
+
+        return lambda context: condition.matches(
+            context.event, context.room, context.display_name
+        )
+
+    @staticmethod
+    def _compile_event_match(condition: PushEventMatch) -> _PushCheck:
+        key = condition.key
+
+        if key == "room_id":
+            room_regex = _compile_glob(condition.pattern)
+            return lambda context: room_regex.match(context.room.room_id) is not None
+
+        words = key == "content.body"
+        regex = _compile_glob(condition.pattern.lower(), words)
+
+        def check(context: _PushContext) -> bool:
+            value = context.flat.get(key)
+
+            if not isinstance(value, str):
+                return False
+
+            if words:
+                return regex.match(f" {value.lower()} ") is not None
+
+            return regex.match(value.lower()) is not None
+
+        return check
+
+    def _contains_display_name(self, context: _PushContext) -> bool:
+        body = context.event.source.get("content", {}).get("body")
+
+        if not isinstance(body, str):
+            return False
+
+        room_id = context.room.room_id
+        cached = self._display_names.get(room_id)
+
+        if cached is None or cached[0] != context.display_name:
+            regex = _compile_display_name(context.display_name)
+            cached = self._display_names[room_id] = (context.display_name, regex)
+
+        return cached[1].match(body) is not None
+
+    @staticmethod
+    def _first_match(
+        rules: List[_CompiledRule], context: _PushContext
+    ) -> Optional[PushRule]:
+        for rule, checks in rules:
+            for check in checks:
+                if not check(context):
+                    break
+            else:
+                return rule
+
+        return None
+
+    def matching_rule(
+        self,
+        event: Event,
+        room: MatrixRoom,
+        display_name: str,
+    ) -> Optional[PushRule]:
+        """Return the push rule that matches a room event, if any.
+
+        Args:
+            event (Event): The room event to match.
+            room (MatrixRoom): The room that this event is part of.
+            display_name (str): The display name of our own user in the room.
+        """
+        context = _PushContext(event, room, display_name)
+
+        rule = self._first_match(self._override, context) or self._first_match(
+            self._content, context
+        )
+
+        if rule:
+            return rule
+
+        if self._rooms is not None:
+            rule = self._rooms.get(room.room_id)
+        else:
+            rule = self._first_match(self._room, context)
+
+        if rule:
+            return rule
+
+        if self._senders is not None:
+            sender = event.source.get("sender")
+
+            if isinstance(sender, str):
+                rule = self._senders.get(sender.lower())
+        else:
+            rule = self._first_match(self._sender, context)
+
+        return rule or self._first_match(self._underride, context)
+
+
 @dataclass
 class PushRulesEvent(AccountDataEvent):
     """Configured push rule sets for an account. Each set belongs to a scope.
@@ -617,3 +877,12 @@ class UnknownAccountDataEvent(AccountDataEvent):
         """Construct an UnknownAccountDataEvent from a dictionary."""
         content = event_dict.pop("content")
         return cls(event_dict["type"], content)
+
+
+AccountDataEvent._event_types = EventRegistry(
+    {
+        "m.fully_read": FullyReadEvent,
+        "m.tag": TagEvent,
+        "m.push_rules": PushRulesEvent,
+    }
+)
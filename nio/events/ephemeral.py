@@ -23,16 +23,32 @@ Ephemeral events are used for typing notifications and read receipts.
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import List
+from typing import Callable, ClassVar, List
 
 from ..schemas import Schemas
-from .misc import verify_or_none
+from .misc import EventRegistry, verify_or_none
 
 
 @dataclass
 class EphemeralEvent:
     """Base class for ephemeral events."""
 
+    _event_types: ClassVar[EventRegistry]
+
+    @staticmethod
+    def register_event_type(event_type: str, parser: Callable) -> None:
+        """Register a parser for an ephemeral event type.
+
+        Registered parsers are used by parse_event() and replace the built-in
+        parser for the same event type, if there is one.
+
+        Args:
+            event_type (str): The type of the event.
+            parser (Callable): An EphemeralEvent subclass or a callable that takes
+                the event dictionary and returns an event.
+        """
+        EphemeralEvent._event_types.register(event_type, parser)
+
     @classmethod
     @verify_or_none(Schemas.ephemeral_event)
     def parse_event(cls, event_dict):
@@ -51,12 +67,12 @@ class EphemeralEvent:
             event_dict (dict): The dictionary representation of the event.
 
         """
-        if event_dict["type"] == "m.typing":
-            return TypingNoticeEvent.from_dict(event_dict)
-        if event_dict["type"] == "m.receipt":
-            return ReceiptEvent.from_dict(event_dict)
+        parser = EphemeralEvent._event_types.get(event_dict["type"])
+
+        if parser is None:
+            return None
 
-        return None
+        return parser(event_dict)
 
     @classmethod
     def from_dict(cls, parsed_dict):
@@ -137,3 +153,11 @@ class ReceiptEvent(EphemeralEvent):
                         )
 
         return cls(event_receipts)
+
+
+EphemeralEvent._event_types = EventRegistry(
+    {
+        "m.typing": TypingNoticeEvent,
+        "m.receipt": ReceiptEvent,
+    }
+)
@@ -32,9 +32,10 @@ from dataclasses import dataclass, field
 from typing import Any, Dict, Optional, Union
 
 from ..schemas import Schemas
-from .misc import BadEventType, verify, verify_or_none
+from .misc import BadEventType, slotted, verify, verify_or_none
 
 
+@slotted()
 @dataclass
 class InviteEvent:
     """Matrix Event class for events in invited rooms.
@@ -99,6 +100,7 @@ class InviteEvent:
         raise NotImplementedError
 
 
+@slotted()
 @dataclass
 class InviteMemberEvent(InviteEvent):
     """Class representing to an m.room.member event in an invited room.
@@ -147,6 +149,7 @@ class InviteMemberEvent(InviteEvent):
         )
 
 
+@slotted()
 @dataclass
 class InviteAliasEvent(InviteEvent):
     """An event informing us about which alias should be preferred.
@@ -171,6 +174,7 @@ class InviteAliasEvent(InviteEvent):
         return cls(parsed_dict, sender, canonical_alias)
 
 
+@slotted()
 @dataclass
 class InviteNameEvent(InviteEvent):
     """Event holding the name of the invited room.
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
 import logging
-from dataclasses import dataclass, field
+from dataclasses import MISSING, dataclass, field, fields
 from functools import wraps
-from typing import Any, Dict, Optional, Union
+from typing import Any, Callable, Dict, Iterable, Optional, Type, TypeVar, Union
 
 from jsonschema.exceptions import SchemaError, ValidationError
 
@@ -26,6 +26,8 @@ from ..schemas import validate_json
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
 
 def validate_or_badevent(
     parsed_dict: Dict[Any, Any],
@@ -79,6 +81,109 @@ def verify_or_none(schema):
     return decorator
 
 
+def _functions(value: Any) -> Iterable[Callable]:
+    if isinstance(value, (classmethod, staticmethod)):
+        value = value.__func__
+
+    if isinstance(value, property):
+        candidates = [value.fget, value.fset, value.fdel]
+    else:
+        candidates = [value]
+
+    for function in candidates:
+        while callable(function):
+            yield function
+            function = getattr(function, "__wrapped__", None)
+
+
+def slotted(*extra: str) -> Callable[[Type[T]], Type[T]]:
+    """Class decorator that gives a dataclass a __slots__ layout.
+
+    This is what ``dataclass(slots=True)`` does on Python 3.10 and later. The
+    class is recreated with a slot for every field that isn't already a slot
+    of a base class, so its instances don't carry a ``__dict__``. Subclasses
+    that aren't slotted themselves get a ``__dict__`` as usual.
+
+    Instances can still be weakly referenced, but attributes that aren't
+    fields or listed in ``extra`` can't be set on them anymore.
+
+    Args:
+        *extra (str): Names of attributes which aren't fields but still need
+            to be settable on instances.
+
+    Example:
+        >>> @slotted()
+        ... @dataclass
+        ... class Point:
+        ...     x: int
+        ...     y: int
+    """
+
+    def decorator(cls: Type[T]) -> Type[T]:
+        inherited = set()
+
+        for base in cls.__mro__[1:]:
+            slots = base.__dict__.get("__slots__", ())
+            inherited.update((slots,) if isinstance(slots, str) else slots)
+
+        names = [f.name for f in fields(cls)] + list(extra)
+        slots = tuple(dict.fromkeys(n for n in names if n not in inherited))
+
+        if not any(base.__weakrefoffset__ for base in cls.__mro__[1:]):
+            slots += ("__weakref__",)
+
+        namespace = dict(cls.__dict__)
+        namespace.pop("__dict__", None)
+        namespace.pop("__weakref__", None)
+
+        for name in names:
+            # Field defaults live on the generated __init__, the class
+            # attributes would hide the slots.
+            namespace.pop(name, None)
+
+        # Fields that aren't initialized by __init__ would fall back to
+        # the class attribute, they get their defaults when the instance is
+        # created instead. This covers subclasses as well.
+        defaults = tuple(
+            (f.name, f.default)
+            for f in fields(cls)
+            if not f.init and f.default is not MISSING
+        )
+
+        if defaults:
+
+            def __new__(cls, *args, **kwargs):
+                instance = object.__new__(cls)
+
+                for name, default in defaults:
+                    setattr(instance, name, default)
+
+                return instance
+
+            namespace["__new__"] = __new__
+
+        namespace["__slots__"] = slots
+        new_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+        new_cls.__qualname__ = cls.__qualname__
+
+        # Methods using zero-argument super() refer to the class through a
+        # closure cell which still points at the old class.
+        for value in namespace.values():
+            for function in _functions(value):
+                code = getattr(function, "__code__", None)
+
+                if code is None or "__class__" not in code.co_freevars:
+                    continue
+
+                index = code.co_freevars.index("__class__")
+                function.__closure__[index].cell_contents = new_cls
+
+        return new_cls
+
+    return decorator
+
+
+@slotted()
 @dataclass
 class UnknownBadEvent:
     """An event that doesn't have the minimal necessary structure.
@@ -115,6 +220,7 @@ class UnknownBadEvent:
     session_id: Optional[str] = field(default=None, init=False)
 
 
+@slotted()
 @dataclass
 class BadEvent:
     """An event that failed event schema and type validation.
@@ -178,3 +284,50 @@ class BadEvent:
 
 
 BadEventType = Union[BadEvent, UnknownBadEvent]
+
+
+class EventRegistry:
+    """Mapping of event types to the parsers that handle them.
+
+    Event parsing looks up the parser of an event in a registry instead of
+    comparing the event type to every known type in turn. Custom event types
+    can be added using the register() method.
+
+    Args:
+        parsers (dict, optional): The initial mapping of event types to
+            parsers.
+    """
+
+    def __init__(self, parsers: Optional[Dict[str, Callable]] = None) -> None:
+        self._parsers: Dict[str, Callable] = {}
+
+        for key, parser in (parsers or {}).items():
+            self.register(key, parser)
+
+    def register(self, key: str, parser: Callable) -> None:
+        """Register a parser for the given event type.
+
+        An already registered parser for the same event type is replaced.
+
+        Args:
+            key (str): The event type (or message type) that the parser
+                handles.
+            parser (Callable): A callable taking the event dictionary and
+                returning an event object. If a class is given its from_dict()
+                method will be used.
+        """
+        if isinstance(parser, type):
+            parser = parser.from_dict  # type: ignore
+
+        self._parsers[key] = parser
+
+    def unregister(self, key: str) -> None:
+        """Remove the parser for the given event type if there is one."""
+        self._parsers.pop(key, None)
+
+    def get(self, key: str) -> Optional[Callable]:
+        """Get the parser for the given event type, None if there is none."""
+        return self._parsers.get(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._parsers
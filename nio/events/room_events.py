@@ -17,13 +17,22 @@ from __future__ import annotations
 
 import time
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Callable, ClassVar, Dict, List, Optional, Union
 
 from ..event_builders import RoomKeyRequestMessage
 from ..schemas import Schemas
-from .misc import BadEvent, BadEventType, UnknownBadEvent, validate_or_badevent, verify
-
-
+from .misc import (
+    BadEvent,
+    BadEventType,
+    EventRegistry,
+    UnknownBadEvent,
+    slotted,
+    validate_or_badevent,
+    verify,
+)
+
+
+@slotted("room_id")
 @dataclass
 class Event:
     """Matrix Event class.
@@ -51,6 +60,9 @@ class Event:
             when the message was sent. Is only set if the message was sent from
             our own device, otherwise None.
 
+    The event classes use ``__slots__`` to keep their memory usage low, so
+    attributes that aren't listed here can't be set on events.
+
     """
 
     source: Dict[str, Any] = field()
@@ -59,6 +71,8 @@ class Event:
     sender: str = field(init=False)
     server_timestamp: int = field(init=False)
 
+    _event_types: ClassVar[EventRegistry]
+
     decrypted: bool = field(default=False, init=False)
     verified: bool = field(default=False, init=False)
     sender_key: Optional[str] = field(default=None, init=False)
@@ -107,6 +121,20 @@ class Event:
         """
         return cls(parsed_dict)
 
+    @staticmethod
+    def register_event_type(event_type: str, parser: Callable) -> None:
+        """Register a parser for a room event type.
+
+        Registered parsers are used by parse_event() and replace the built-in
+        parser for the same event type, if there is one.
+
+        Args:
+            event_type (str): The type of the event, e.g. "org.example.poll".
+            parser (Callable): An Event subclass or a callable that takes the
+                event dictionary and returns an event.
+        """
+        Event._event_types.register(event_type, parser)
+
     @classmethod
     @verify(Schemas.room_event)
     def parse_event(cls, event_dict: Dict[Any, Any]) -> Union[Event, BadEventType]:
@@ -129,45 +157,12 @@ class Event:
             if "redacted_because" in event_dict["unsigned"]:
                 return RedactedEvent.from_dict(event_dict)
 
-        if event_dict["type"] == "m.room.message":
-            return RoomMessage.parse_event(event_dict)
-        elif event_dict["type"] == "m.room.create":
-            return RoomCreateEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.guest_access":
-            return RoomGuestAccessEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.join_rules":
-            return RoomJoinRulesEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.history_visibility":
-            return RoomHistoryVisibilityEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.member":
-            return RoomMemberEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.canonical_alias":
-            return RoomAliasEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.name":
-            return RoomNameEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.topic":
-            return RoomTopicEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.avatar":
-            return RoomAvatarEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.power_levels":
-            return PowerLevelsEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.encryption":
-            return RoomEncryptionEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.redaction":
-            return RedactionEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.tombstone":
-            return RoomUpgradeEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.space.parent":
-            return RoomSpaceParentEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.space.child":
-            return RoomSpaceChildEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.room.encrypted":
-            return Event.parse_encrypted_event(event_dict)
-        elif event_dict["type"] == "m.sticker":
-            return StickerEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.reaction":
-            return ReactionEvent.from_dict(event_dict)
-        elif event_dict["type"].startswith("m.call"):
+        parser = Event._event_types.get(event_dict["type"])
+
+        if parser is not None:
+            return parser(event_dict)
+
+        if event_dict["type"].startswith("m.call"):
             return CallEvent.parse_event(event_dict)
 
         return UnknownEvent.from_dict(event_dict)
@@ -222,6 +217,7 @@ class Event:
         return Event.parse_event(event_dict)
 
 
+@slotted()
 @dataclass
 class UnknownEvent(Event):
     """An Event which we do not understand.
@@ -246,6 +242,7 @@ class UnknownEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class UnknownEncryptedEvent(Event):
     """An encrypted event which we don't know how to decrypt.
@@ -271,6 +268,7 @@ class UnknownEncryptedEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class MegolmEvent(Event):
     """An undecrypted Megolm event.
@@ -405,6 +403,7 @@ class MegolmEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class CallEvent(Event):
     """Base Class for Matrix call signalling events.
@@ -419,6 +418,8 @@ class CallEvent(Event):
     call_id: str = field()
     version: int = field()
 
+    _call_event_types: ClassVar[EventRegistry]
+
     @staticmethod
     def parse_event(event_dict):
         """Parse a Matrix event and create a higher level event object.
@@ -436,20 +437,15 @@ class CallEvent(Event):
             event_dict (dict): The raw matrix event dictionary.
 
         """
-        if event_dict["type"] == "m.call.candidates":
-            event = CallCandidatesEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.call.invite":
-            event = CallInviteEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.call.answer":
-            event = CallAnswerEvent.from_dict(event_dict)
-        elif event_dict["type"] == "m.call.hangup":
-            event = CallHangupEvent.from_dict(event_dict)
-        else:
-            event = UnknownEvent.from_dict(event_dict)
+        parser = CallEvent._call_event_types.get(event_dict["type"])
 
-        return event
+        if parser is None:
+            return UnknownEvent.from_dict(event_dict)
 
+        return parser(event_dict)
 
+
+@slotted()
 @dataclass
 class CallCandidatesEvent(CallEvent):
     """Call event holding additional VoIP ICE candidates.
@@ -476,6 +472,7 @@ class CallCandidatesEvent(CallEvent):
         )
 
 
+@slotted()
 @dataclass
 class CallInviteEvent(CallEvent):
     """Event representing an invitation to a VoIP call.
@@ -513,6 +510,7 @@ class CallInviteEvent(CallEvent):
         )
 
 
+@slotted()
 @dataclass
 class CallAnswerEvent(CallEvent):
     """Event representing the answer to a VoIP call.
@@ -540,6 +538,7 @@ class CallAnswerEvent(CallEvent):
         )
 
 
+@slotted()
 @dataclass
 class CallHangupEvent(CallEvent):
     """An event representing the end of a VoIP call.
@@ -561,6 +560,7 @@ class CallHangupEvent(CallEvent):
         )
 
 
+@slotted()
 @dataclass
 class RedactedEvent(Event):
     """An event that has been redacted.
@@ -604,6 +604,7 @@ class RedactedEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class RoomEncryptionEvent(Event):
     """An event signaling that encryption has been enabled in a room."""
@@ -614,6 +615,7 @@ class RoomEncryptionEvent(Event):
         return cls(parsed_dict)
 
 
+@slotted()
 @dataclass
 class RoomCreateEvent(Event):
     """The first event in a room, signaling that the room was created.
@@ -651,6 +653,7 @@ class RoomCreateEvent(Event):
         return cls(parsed_dict, creator, federate, version, room_type)
 
 
+@slotted()
 @dataclass
 class RoomGuestAccessEvent(Event):
     """Event signaling whether guest users are allowed to join rooms.
@@ -673,6 +676,7 @@ class RoomGuestAccessEvent(Event):
         return cls(parsed_dict, guest_access)
 
 
+@slotted()
 @dataclass
 class RoomJoinRulesEvent(Event):
     """An event telling us how users can join the room.
@@ -697,6 +701,7 @@ class RoomJoinRulesEvent(Event):
         return cls(parsed_dict, join_rule)
 
 
+@slotted()
 @dataclass
 class RoomHistoryVisibilityEvent(Event):
     """An event telling whether users can read the room history.
@@ -739,6 +744,7 @@ class RoomHistoryVisibilityEvent(Event):
         return cls(parsed_dict, history_visibility)
 
 
+@slotted()
 @dataclass
 class RoomAliasEvent(Event):
     """An event informing us about which alias should be preferred.
@@ -760,6 +766,7 @@ class RoomAliasEvent(Event):
         return cls(parsed_dict, canonical_alias)
 
 
+@slotted()
 @dataclass
 class RoomNameEvent(Event):
     """Event holding the name of the room.
@@ -785,6 +792,7 @@ class RoomNameEvent(Event):
         return cls(parsed_dict, room_name)
 
 
+@slotted()
 @dataclass
 class RoomTopicEvent(Event):
     """Event holding the topic of a room.
@@ -810,6 +818,7 @@ class RoomTopicEvent(Event):
         return cls(parsed_dict, canonical_alias)
 
 
+@slotted()
 @dataclass
 class RoomAvatarEvent(Event):
     """Event holding a picture that is associated with the room.
@@ -831,6 +840,7 @@ class RoomAvatarEvent(Event):
         return cls(parsed_dict, room_avatar_url)
 
 
+@slotted()
 @dataclass
 class RoomSpaceParentEvent(Event):
     """Event holding the parent space of a room.
@@ -852,6 +862,7 @@ class RoomSpaceParentEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class RoomSpaceChildEvent(Event):
     """Event holding the child rooms of a space.
@@ -873,6 +884,7 @@ class RoomSpaceChildEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class RoomMessage(Event):
     """Abstract room message class.
@@ -883,29 +895,40 @@ class RoomMessage(Event):
     The class has one child class per msgtype.
     """
 
+    _msgtypes: ClassVar[EventRegistry]
+    _decrypted_msgtypes: ClassVar[EventRegistry]
+
+    @staticmethod
+    def register_msgtype(
+        msgtype: str, parser: Callable, decrypted_parser: Optional[Callable] = None
+    ) -> None:
+        """Register a parser for a room message type.
+
+        Args:
+            msgtype (str): The msgtype of the message, e.g. "m.location".
+            parser (Callable): A RoomMessage subclass or a callable that takes
+                the event dictionary and returns an event.
+            decrypted_parser (Callable, optional): The parser that should be
+                used if the message was decrypted, defaults to ``parser``.
+        """
+        RoomMessage._msgtypes.register(msgtype, parser)
+
+        if decrypted_parser is not None:
+            RoomMessage._decrypted_msgtypes.register(msgtype, decrypted_parser)
+        else:
+            RoomMessage._decrypted_msgtypes.unregister(msgtype)
+
     @classmethod
     @verify(Schemas.room_message)
     def parse_event(
         cls, parsed_dict: Dict[Any, Any]
     ) -> Union[RoomMessage, BadEventType]:
-        content_dict = parsed_dict["content"]
+        parser = RoomMessage._msgtypes.get(parsed_dict["content"]["msgtype"])
 
-        if content_dict["msgtype"] == "m.text":
-            event = RoomMessageText.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.emote":
-            event = RoomMessageEmote.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.notice":
-            event = RoomMessageNotice.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.image":
-            event = RoomMessageImage.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.audio":
-            event = RoomMessageAudio.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.video":
-            event = RoomMessageVideo.from_dict(parsed_dict)
-        elif content_dict["msgtype"] == "m.file":
-            event = RoomMessageFile.from_dict(parsed_dict)
-        else:
+        if parser is None:
             event = RoomMessageUnknown.from_dict(parsed_dict)
+        else:
+            event = parser(parsed_dict)
 
         if "unsigned" in parsed_dict:
             txn_id = parsed_dict["unsigned"].get("transaction_id", None)
@@ -919,17 +942,12 @@ class RoomMessage(Event):
         cls, parsed_dict: Dict[Any, Any]
     ) -> Union[RoomMessage, BadEventType]:
         msgtype = parsed_dict["content"]["msgtype"]
+        parser = RoomMessage._decrypted_msgtypes.get(msgtype)
 
-        if msgtype == "m.image":
-            event = RoomEncryptedImage.from_dict(parsed_dict)
-        elif msgtype == "m.audio":
-            event = RoomEncryptedAudio.from_dict(parsed_dict)
-        elif msgtype == "m.video":
-            event = RoomEncryptedVideo.from_dict(parsed_dict)
-        elif msgtype == "m.file":
-            event = RoomEncryptedFile.from_dict(parsed_dict)
-        else:
+        if parser is None:
             event = RoomMessage.parse_event(parsed_dict)
+        else:
+            event = parser(parsed_dict)
 
         if "unsigned" in parsed_dict:
             txn_id = parsed_dict["unsigned"].get("transaction_id", None)
@@ -938,6 +956,7 @@ class RoomMessage(Event):
         return event
 
 
+@slotted()
 @dataclass
 class RoomMessageMedia(RoomMessage):
     """Base class for room messages containing a URI.
@@ -961,6 +980,7 @@ class RoomMessageMedia(RoomMessage):
         )
 
 
+@slotted()
 @dataclass
 class RoomEncryptedMedia(RoomMessage):
     """Base class for encrypted room messages containing an URI.
@@ -1025,46 +1045,55 @@ class RoomEncryptedMedia(RoomMessage):
         )
 
 
+@slotted()
 @dataclass
 class RoomEncryptedImage(RoomEncryptedMedia):
     """A room message containing an image where the file is encrypted."""
 
 
+@slotted()
 @dataclass
 class RoomEncryptedAudio(RoomEncryptedMedia):
     """A room message containing an audio clip where the file is encrypted."""
 
 
+@slotted()
 @dataclass
 class RoomEncryptedVideo(RoomEncryptedMedia):
     """A room message containing a video clip where the file is encrypted."""
 
 
+@slotted()
 @dataclass
 class RoomEncryptedFile(RoomEncryptedMedia):
     """A room message containing a generic encrypted file."""
 
 
+@slotted()
 @dataclass
 class RoomMessageImage(RoomMessageMedia):
     """A room message containing an image."""
 
 
+@slotted()
 @dataclass
 class RoomMessageAudio(RoomMessageMedia):
     """A room message containing an audio clip."""
 
 
+@slotted()
 @dataclass
 class RoomMessageVideo(RoomMessageMedia):
     """A room message containing a video clip."""
 
 
+@slotted()
 @dataclass
 class RoomMessageFile(RoomMessageMedia):
     """A room message containing a generic file."""
 
 
+@slotted()
 @dataclass
 class RoomMessageUnknown(RoomMessage):
     """A m.room.message which we do not understand.
@@ -1100,6 +1129,7 @@ class RoomMessageUnknown(RoomMessage):
         return self.msgtype
 
 
+@slotted()
 @dataclass
 class RoomMessageFormatted(RoomMessage):
     """Base abstract class for room messages that can have formatted bodies.
@@ -1150,6 +1180,7 @@ class RoomMessageFormatted(RoomMessage):
         )
 
 
+@slotted()
 @dataclass
 class RoomMessageText(RoomMessageFormatted):
     """A room message corresponding to the m.text msgtype.
@@ -1171,6 +1202,7 @@ class RoomMessageText(RoomMessageFormatted):
         return validate_or_badevent(parsed_dict, Schemas.room_message_text)
 
 
+@slotted()
 @dataclass
 class RoomMessageEmote(RoomMessageFormatted):
     """A room message corresponding to the m.emote msgtype.
@@ -1193,6 +1225,7 @@ class RoomMessageEmote(RoomMessageFormatted):
         return validate_or_badevent(parsed_dict, Schemas.room_message_emote)
 
 
+@slotted()
 @dataclass
 class RoomMessageNotice(RoomMessageFormatted):
     """A room message corresponding to the m.notice msgtype.
@@ -1417,6 +1450,7 @@ class PowerLevels:
         self.users.update(new_levels.users)
 
 
+@slotted()
 @dataclass
 class PowerLevelsEvent(Event):
     """Class representing a m.room.power_levels event.
@@ -1448,6 +1482,7 @@ class PowerLevelsEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class RedactionEvent(Event):
     """An event signaling that another event has been redacted.
@@ -1480,6 +1515,7 @@ class RedactionEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class RoomMemberEvent(Event):
     """Class representing to an m.room.member event.
@@ -1527,6 +1563,7 @@ class RoomMemberEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class StickerEvent(Event):
     """An event indicating the use of a sticker
@@ -1566,6 +1603,7 @@ class StickerEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class ReactionEvent(Event):
     """An event representing an m.reaction event.
@@ -1595,6 +1633,7 @@ class ReactionEvent(Event):
         )
 
 
+@slotted()
 @dataclass
 class RoomUpgradeEvent(Event):
     """Class representing to an m.room.tombstone event.
@@ -1622,3 +1661,58 @@ class RoomUpgradeEvent(Event):
             body,
             replacement_room,
         )
+
+
+Event._event_types = EventRegistry(
+    {
+        "m.room.message": RoomMessage.parse_event,
+        "m.room.create": RoomCreateEvent,
+        "m.room.guest_access": RoomGuestAccessEvent,
+        "m.room.join_rules": RoomJoinRulesEvent,
+        "m.room.history_visibility": RoomHistoryVisibilityEvent,
+        "m.room.member": RoomMemberEvent,
+        "m.room.canonical_alias": RoomAliasEvent,
+        "m.room.name": RoomNameEvent,
+        "m.room.topic": RoomTopicEvent,
+        "m.room.avatar": RoomAvatarEvent,
+        "m.room.power_levels": PowerLevelsEvent,
+        "m.room.encryption": RoomEncryptionEvent,
+        "m.room.redaction": RedactionEvent,
+        "m.room.tombstone": RoomUpgradeEvent,
+        "m.space.parent": RoomSpaceParentEvent,
+        "m.space.child": RoomSpaceChildEvent,
+        "m.room.encrypted": Event.parse_encrypted_event,
+        "m.sticker": StickerEvent,
+        "m.reaction": ReactionEvent,
+    }
+)
+
+CallEvent._call_event_types = EventRegistry(
+    {
+        "m.call.candidates": CallCandidatesEvent,
+        "m.call.invite": CallInviteEvent,
+        "m.call.answer": CallAnswerEvent,
+        "m.call.hangup": CallHangupEvent,
+    }
+)
+
+RoomMessage._msgtypes = EventRegistry(
+    {
+        "m.text": RoomMessageText,
+        "m.emote": RoomMessageEmote,
+        "m.notice": RoomMessageNotice,
+        "m.image": RoomMessageImage,
+        "m.audio": RoomMessageAudio,
+        "m.video": RoomMessageVideo,
+        "m.file": RoomMessageFile,
+    }
+)
+
+RoomMessage._decrypted_msgtypes = EventRegistry(
+    {
+        "m.image": RoomEncryptedImage,
+        "m.audio": RoomEncryptedAudio,
+        "m.video": RoomEncryptedVideo,
+        "m.file": RoomEncryptedFile,
+    }
+)
@@ -26,7 +26,7 @@ from __future__ import annotations
 
 from copy import deepcopy
 from dataclasses import dataclass, field
-from typing import Any, Dict, Optional, Union
+from typing import Any, Callable, ClassVar, Dict, Optional, Union
 
 from ..schemas import Schemas
 from .common import (
@@ -37,7 +37,7 @@ from .common import (
     KeyVerificationMacMixin,
     KeyVerificationStartMixin,
 )
-from .misc import BadEventType, logger, verify
+from .misc import BadEventType, EventRegistry, logger, verify
 
 
 @dataclass
@@ -55,6 +55,22 @@ class ToDeviceEvent:
     source: Dict[str, Any] = field()
     sender: str = field()
 
+    _event_types: ClassVar[EventRegistry]
+
+    @staticmethod
+    def register_event_type(event_type: str, parser: Callable) -> None:
+        """Register a parser for a to-device event type.
+
+        Registered parsers are used by parse_event() and replace the built-in
+        parser for the same event type, if there is one.
+
+        Args:
+            event_type (str): The type of the event.
+            parser (Callable): A ToDeviceEvent subclass or a callable that takes
+                the event dictionary and returns an event.
+        """
+        ToDeviceEvent._event_types.register(event_type, parser)
+
     @classmethod
     @verify(Schemas.to_device)
     def parse_event(
@@ -77,20 +93,10 @@ class ToDeviceEvent:
         if not event_dict["content"]:
             return None
 
-        if event_dict["type"] == "m.room.encrypted":
-            return ToDeviceEvent.parse_encrypted_event(event_dict)
-        elif event_dict["type"] == "m.key.verification.start":
-            return KeyVerificationStart.from_dict(event_dict)
-        elif event_dict["type"] == "m.key.verification.accept":
-            return KeyVerificationAccept.from_dict(event_dict)
-        elif event_dict["type"] == "m.key.verification.key":
-            return KeyVerificationKey.from_dict(event_dict)
-        elif event_dict["type"] == "m.key.verification.mac":
-            return KeyVerificationMac.from_dict(event_dict)
-        elif event_dict["type"] == "m.key.verification.cancel":
-            return KeyVerificationCancel.from_dict(event_dict)
-        elif event_dict["type"] == "m.room_key_request":
-            return BaseRoomKeyRequest.parse_event(event_dict)
+        parser = ToDeviceEvent._event_types.get(event_dict["type"])
+
+        if parser is not None:
+            return parser(event_dict)
 
         return UnknownToDeviceEvent.from_dict(event_dict)
 
@@ -538,3 +544,16 @@ class UnknownToDeviceEvent(ToDeviceEvent):
             event_dict["sender"],
             event_dict["type"],
         )
+
+
+ToDeviceEvent._event_types = EventRegistry(
+    {
+        "m.room.encrypted": ToDeviceEvent.parse_encrypted_event,
+        "m.key.verification.start": KeyVerificationStart,
+        "m.key.verification.accept": KeyVerificationAccept,
+        "m.key.verification.key": KeyVerificationKey,
+        "m.key.verification.mac": KeyVerificationMac,
+        "m.key.verification.cancel": KeyVerificationCancel,
+        "m.room_key_request": BaseRoomKeyRequest.parse_event,
+    }
+)
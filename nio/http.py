@@ -14,7 +14,6 @@
 
 from __future__ import annotations
 
-import json
 import logging
 import pprint
 import time
@@ -27,6 +26,8 @@ import h2.connection
 import h2.events
 import h11
 
+from . import json_backend
+
 logger = logging.getLogger(__name__)
 
 USER_AGENT = "nio"
@@ -90,9 +91,7 @@ class HttpRequest(TransportRequest):
 
     @classmethod
     def _post_or_put(cls, method, host, target, data, timeout=0):
-        request_data = (
-            json.dumps(data, separators=(",", ":")) if isinstance(data, dict) else data
-        )
+        request_data = json_backend.dumps(data) if isinstance(data, dict) else data
 
         request_data = bytes(request_data, "utf-8")
 
@@ -143,9 +142,7 @@ class Http2Request(TransportRequest):
 
     @classmethod
     def _post_or_put(cls, method, host, target, data, timeout):
-        request_data = (
-            json.dumps(data, separators=(",", ":")) if isinstance(data, dict) else data
-        )
+        request_data = json_backend.dumps(data) if isinstance(data, dict) else data
 
         request_data = bytes(request_data, "utf-8")
 
@@ -0,0 +1,122 @@
+"""Pluggable JSON encoding and decoding.
+
+The JSON that nio sends and receives is handled by the fastest available
+library, orjson or ujson if they are installed and the json module from the
+standard library otherwise. The backend is shared by the whole process and
+can be changed with `use_json_backend()`.
+
+Canonical JSON, which is used for signatures, is always produced by the
+standard library since it needs to be byte exact, and JSON that a faster
+library refuses to decode is retried with the standard library.
+"""
+
+import json
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from ._compat import package_installed
+
+Dumps = Callable[[Any], str]
+Loads = Callable[[Union[str, bytes]], Any]
+
+
+def _stdlib_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def _stdlib_backend() -> Tuple[Dumps, Loads]:
+    return _stdlib_dumps, json.loads
+
+
+def _orjson_backend() -> Tuple[Dumps, Loads]:
+    import orjson
+
+    def dumps(obj: Any) -> str:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # orjson is stricter than the json module, e.g. it doesn't
+            # support integers wider than 64 bits or non-string keys.
+            return _stdlib_dumps(obj)
+
+    def loads(data: Union[str, bytes]) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson also rejects some JSON that the json module accepts,
+            # e.g. strings with lone surrogates, which can't be allowed to
+            # break a whole sync.
+            return json.loads(data)
+
+    return dumps, loads
+
+
+def _ujson_backend() -> Tuple[Dumps, Loads]:
+    import ujson
+
+    def dumps(obj: Any) -> str:
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return _stdlib_dumps(obj)
+
+    def loads(data: Union[str, bytes]) -> Any:
+        try:
+            return ujson.loads(data)
+        except ValueError:
+            # Let the json module decide, it raises a JSONDecodeError if the
+            # JSON is really invalid.
+            return json.loads(data)
+
+    return dumps, loads
+
+
+BACKENDS: Dict[str, Callable[[], Tuple[Dumps, Loads]]] = {
+    "orjson": _orjson_backend,
+    "ujson": _ujson_backend,
+    "json": _stdlib_backend,
+}
+
+_backend_name = "json"
+dumps: Dumps = _stdlib_dumps
+loads: Loads = json.loads
+
+
+def available_json_backends() -> Tuple[str, ...]:
+    """Get the names of the JSON backends that can be used, fastest first."""
+    return tuple(name for name in BACKENDS if name == "json" or package_installed(name))
+
+
+def use_json_backend(name: Optional[str] = None) -> str:
+    """Select the JSON library that nio should use.
+
+    Args:
+        name (str, optional): The name of the backend, one of "orjson",
+            "ujson" or "json". If not given the fastest installed backend is
+            used.
+
+    Returns the name of the backend that is now in use.
+
+    Raises a ValueError if the backend is unknown and an ImportWarning if the
+    library isn't installed.
+    """
+    global _backend_name, dumps, loads
+
+    if name is None:
+        name = available_json_backends()[0]
+    elif name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend {name}")
+    elif name not in available_json_backends():
+        raise ImportWarning(f"The JSON backend {name} isn't installed.")
+
+    dumps, loads = BACKENDS[name]()
+    _backend_name = name
+
+    return name
+
+
+def current_json_backend() -> str:
+    """Get the name of the JSON backend that is currently in use."""
+    return _backend_name
+
+
+use_json_backend()
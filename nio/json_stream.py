@@ -0,0 +1,201 @@
+"""Incremental parsing of large JSON objects.
+
+The parser walks the keys of a JSON object as the body arrives and decodes
+the values one at a time, descending only into the objects that were asked
+for. Only the value that is currently being decoded needs to be buffered,
+so the memory usage is bounded by the largest value instead of the whole
+document.
+"""
+
+import codecs
+import json
+import re
+from json.decoder import JSONDecodeError
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Collection,
+    List,
+    Optional,
+    Tuple,
+)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+JsonPath = Tuple[str, ...]
+
+
+class _JsonStreamReader:
+    def __init__(self, chunks: AsyncIterable[bytes], decoder: json.JSONDecoder):
+        self._chunks = chunks.__aiter__()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = decoder
+
+        self._buffer = ""
+        self._pos = 0
+        self._pending: List[str] = []
+        self._pending_size = 0
+        self._eof = False
+
+    @property
+    def _available(self) -> int:
+        return len(self._buffer) - self._pos + self._pending_size
+
+    async def _read_chunk(self) -> bool:
+        if self._eof:
+            return False
+
+        try:
+            chunk = await self._chunks.__anext__()
+        except StopAsyncIteration:
+            self._eof = True
+            text = self._utf8.decode(b"", final=True)
+        else:
+            text = self._utf8.decode(chunk)
+
+        if text:
+            self._pending.append(text)
+            self._pending_size += len(text)
+
+        return True
+
+    def _flush(self) -> None:
+        # Chunks are only joined into the buffer once they are needed, this
+        # keeps the cost of buffering a large value linear.
+        if self._pending:
+            self._buffer = self._buffer[self._pos :] + "".join(self._pending)
+            self._pos = 0
+            self._pending = []
+            self._pending_size = 0
+
+    def _error(self, message: str) -> JSONDecodeError:
+        return JSONDecodeError(message, self._buffer, self._pos)
+
+    async def peek(self) -> str:
+        """Skip whitespace and return the next character, "" at the end."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+
+            if self._pending:
+                self._flush()
+            elif not await self._read_chunk():
+                return ""
+
+    async def expect(self, char: str) -> None:
+        if await self.peek() != char:
+            raise self._error(f"Expecting {char!r}")
+
+        self._pos += 1
+
+    async def value(self) -> Any:
+        """Decode the next JSON value."""
+        await self.peek()
+        wanted = 0
+
+        while True:
+            if self._eof or self._available >= wanted:
+                self._flush()
+
+                try:
+                    value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                except JSONDecodeError:
+                    if self._eof:
+                        raise
+                else:
+                    # A value that ends exactly at the end of the buffer might
+                    # be a truncated number, the closing delimiter tells us
+                    # that it's complete.
+                    if end < len(self._buffer) or self._eof:
+                        self._pos = end
+                        return value
+
+                # Only retry once the amount of buffered data doubled, this
+                # makes sure that a value is decoded at most a couple of
+                # times no matter how many chunks it spans.
+                wanted = 2 * self._available
+
+            await self._read_chunk()
+
+    async def keys(self) -> AsyncIterator[str]:
+        """Iterate over the keys of the next JSON object.
+
+        The caller needs to consume the value of a key before continuing the
+        iteration.
+        """
+        await self.expect("{")
+
+        if await self.peek() == "}":
+            self._pos += 1
+            return
+
+        while True:
+            if await self.peek() != '"':
+                raise self._error("Expecting property name enclosed in double quotes")
+
+            key = await self.value()
+            await self.expect(":")
+            yield key
+
+            char = await self.peek()
+            self._pos += 1
+
+            if char == "}":
+                return
+
+            if char != ",":
+                self._pos -= 1
+                raise self._error("Expecting ',' delimiter")
+
+            if await self.peek() == "}":
+                raise self._error("Illegal trailing comma before end of object")
+
+
+async def iter_json_items(
+    chunks: AsyncIterable[bytes],
+    descend: Collection[JsonPath] = (),
+    decoder: Optional[json.JSONDecoder] = None,
+) -> AsyncIterator[Tuple[JsonPath, Any]]:
+    """Incrementally parse a JSON object from a stream of bytes.
+
+    Args:
+        chunks (AsyncIterable[bytes]): The UTF-8 encoded JSON document, the
+            top level value needs to be an object.
+        descend (Collection[Tuple[str, ...]]): The paths of the objects that
+            should be walked key by key instead of being decoded as a whole.
+            The top level object is always walked.
+        decoder (json.JSONDecoder, optional): The decoder that should be used
+            for the values.
+
+    Yields a tuple of the path of every value that was decoded and the value.
+    Raises a JSONDecodeError if the document isn't valid JSON.
+
+    Example:
+        >>> async for path, value in iter_json_items(
+        ...     response.content.iter_chunked(64 * 1024),
+        ...     descend=[("rooms",), ("rooms", "join")],
+        ... ):
+        ...     print(path)
+        ('next_batch',)
+        ('rooms', 'join', '!room:example.org')
+    """
+    reader = _JsonStreamReader(chunks, decoder or json.JSONDecoder())
+
+    async def walk(path: JsonPath) -> AsyncIterator[Tuple[JsonPath, Any]]:
+        async for key in reader.keys():
+            key_path = path + (key,)
+
+            if key_path in descend and await reader.peek() == "{":
+                async for item in walk(key_path):
+                    yield item
+            else:
+                yield key_path, await reader.value()
+
+    async for item in walk(()):
+        yield item
+
+    if await reader.peek():
+        raise reader._error("Extra data")
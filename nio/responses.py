@@ -31,6 +31,7 @@ from .events import (
     EphemeralEvent,
     Event,
     InviteEvent,
+    RoomMemberEvent,
     ToDeviceEvent,
 )
 from .events.presence import PresenceEvent
@@ -69,6 +70,8 @@ __all__ = [
     "JoinError",
     "JoinedMembersResponse",
     "JoinedMembersError",
+    "RoomGetMembersResponse",
+    "RoomGetMembersError",
     "JoinedRoomsResponse",
     "JoinedRoomsError",
     "KeysClaimResponse",
@@ -135,6 +138,9 @@ __all__ = [
     "ShareGroupSessionError",
     "SyncResponse",
     "SyncError",
+    "SlidingSyncError",
+    "SlidingSyncResponse",
+    "SlidingSyncRoomInfo",
     "Timeline",
     "UpdateDeviceResponse",
     "UpdateDeviceError",
@@ -435,6 +441,10 @@ class SyncError(ErrorResponse):
     pass
 
 
+class SlidingSyncError(ErrorResponse):
+    pass
+
+
 class RoomSendError(_ErrorWithRoomId):
     pass
 
@@ -621,6 +631,12 @@ class JoinedMembersError(_ErrorWithRoomId):
     pass
 
 
+class RoomGetMembersError(_ErrorWithRoomId):
+    """A response representing an unsuccessful room members query."""
+
+    pass
+
+
 class JoinedRoomsError(ErrorResponse):
     """A response representing an unsuccessful joined rooms query."""
 
@@ -836,6 +852,34 @@ class JoinedMembersResponse(Response):
         return cls(members, room_id)
 
 
+@dataclass
+class RoomGetMembersResponse(Response):
+    """A response containing the membership events of a room.
+
+    Attributes:
+        members (List[RoomMemberEvent]): The member events of the room.
+        room_id (str): The ID of the room.
+    """
+
+    members: List[RoomMemberEvent] = field()
+    room_id: str = field()
+
+    @classmethod
+    @verify(Schemas.room_members, RoomGetMembersError)
+    def from_dict(
+        cls,
+        parsed_dict: Dict[Any, Any],
+        room_id: str,
+    ) -> Union[RoomGetMembersResponse, ErrorResponse]:
+        members = [
+            event
+            for event in SyncResponse._get_room_events(parsed_dict["chunk"])
+            if isinstance(event, RoomMemberEvent)
+        ]
+
+        return cls(members, room_id)
+
+
 @dataclass
 class JoinedRoomsResponse(Response):
     """A response containing a list of joined rooms.
@@ -1954,21 +1998,40 @@ class SyncResponse(Response):
             left_rooms[room_id] = leave_info
 
         for room_id, room_dict in parsed_dict.get("join", {}).items():
-            join_info = SyncResponse._get_join_info(
-                room_dict.get("state", {}).get("events", []),
-                room_dict.get("timeline", {}).get("events", []),
-                room_dict.get("timeline", {}).get("prev_batch"),
-                room_dict.get("timeline", {}).get("limited", False),
-                room_dict.get("ephemeral", {}).get("events", []),
-                room_dict.get("summary", {}),
-                room_dict.get("unread_notifications", {}),
-                room_dict.get("account_data", {}).get("events", []),
-            )
-
-            joined_rooms[room_id] = join_info
+            joined_rooms[room_id] = SyncResponse._get_joined_room(room_dict)
 
         return Rooms(invited_rooms, joined_rooms, left_rooms)
 
+    @staticmethod
+    def _get_joined_room(room_dict: Dict[Any, Any]) -> RoomInfo:
+        return SyncResponse._get_join_info(
+            room_dict.get("state", {}).get("events", []),
+            room_dict.get("timeline", {}).get("events", []),
+            room_dict.get("timeline", {}).get("prev_batch"),
+            room_dict.get("timeline", {}).get("limited", False),
+            room_dict.get("ephemeral", {}).get("events", []),
+            room_dict.get("summary", {}),
+            room_dict.get("unread_notifications", {}),
+            room_dict.get("account_data", {}).get("events", []),
+        )
+
+    @staticmethod
+    def joined_room_from_dict(room_id: str, room_dict: Dict[Any, Any]) -> RoomInfo:
+        """Parse the section of a single joined room of a sync response.
+
+        This is used when a sync response is parsed incrementally, one joined
+        room at a time, instead of all at once using `from_dict()`.
+
+        Args:
+            room_id (str): The id of the room.
+            room_dict (Dict): The `rooms.join.<room_id>` section of the sync
+                response.
+
+        Raises a ValidationError if the room section is invalid.
+        """
+        validate_json({room_id: room_dict}, Schemas.sync_join)
+        return SyncResponse._get_joined_room(room_dict)
+
     @staticmethod
     def _get_presence(parsed_dict) -> List[PresenceEvent]:
         presence_dicts = parsed_dict.get("presence", {}).get("events", [])
@@ -2016,6 +2079,180 @@ class SyncResponse(Response):
         )
 
 
+@dataclass
+class SlidingSyncRoomInfo:
+    """Sliding sync data of a room that isn't part of the room state.
+
+    Attributes:
+        name (str, optional): The name of the room as calculated by the
+            server.
+        initial (bool): Is this the first time the room is returned on this
+            connection.
+        bump_stamp (int, optional): The position of the latest activity in
+            the room, the room lists are sorted by it.
+    """
+
+    name: Optional[str] = None
+    initial: bool = False
+    bump_stamp: Optional[int] = None
+
+
+@dataclass
+class SlidingSyncResponse(Response):
+    """A response to a sliding sync request.
+
+    The rooms and extensions are converted to their sync response
+    counterparts, so the response updates the client state the same way a
+    sync response does.
+
+    Attributes:
+        pos (str): The position of the connection, it needs to be passed to
+            the next request.
+        lists (Dict[str, int]): The total number of rooms of every requested
+            list.
+        rooms (Rooms): The joined, invited and left rooms that were returned.
+        room_info (Dict[str, SlidingSyncRoomInfo]): The sliding sync data of
+            the returned rooms.
+        device_key_count (DeviceOneTimeKeyCount): The number of one-time keys
+            on the server.
+        device_list (DeviceList): The users whose devices changed.
+        to_device_events (List[ToDeviceEvent]): The to-device messages.
+        to_device_since (str, optional): The token that acknowledges the
+            to-device messages in the next request.
+        presence_events (List[PresenceEvent]): Always empty, sliding sync
+            doesn't return presence.
+        account_data_events (List[AccountDataEvent]): The global account
+            data.
+    """
+
+    pos: str = field()
+    lists: Dict[str, int] = field()
+    rooms: Rooms = field()
+    room_info: Dict[str, SlidingSyncRoomInfo] = field()
+    device_key_count: DeviceOneTimeKeyCount = field()
+    device_list: DeviceList = field()
+    to_device_events: List[ToDeviceEvent] = field()
+    to_device_since: Optional[str] = None
+    presence_events: List[PresenceEvent] = field(default_factory=list)
+    account_data_events: List[AccountDataEvent] = field(default_factory=list)
+
+    @staticmethod
+    def _own_membership(user_id: str, room_info: RoomInfo) -> Optional[str]:
+        membership = None
+
+        for event in room_info.state + room_info.timeline.events:
+            if isinstance(event, RoomMemberEvent) and event.state_key == user_id:
+                membership = event.membership
+
+        return membership
+
+    @staticmethod
+    def _get_rooms(
+        parsed_dict: Dict[Any, Any], extensions: Dict[Any, Any], user_id: str
+    ) -> Tuple[Rooms, Dict[str, SlidingSyncRoomInfo]]:
+        rooms = Rooms({}, {}, {})
+        room_info: Dict[str, SlidingSyncRoomInfo] = {}
+
+        account_data = extensions.get("account_data", {}).get("rooms", {})
+        receipts = extensions.get("receipts", {}).get("rooms", {})
+        typing = extensions.get("typing", {}).get("rooms", {})
+
+        # The extensions can contain rooms which didn't change otherwise.
+        room_ids = dict.fromkeys([*parsed_dict, *account_data, *receipts, *typing])
+
+        for room_id in room_ids:
+            room_dict = parsed_dict.get(room_id, {})
+
+            if room_id in parsed_dict:
+                room_info[room_id] = SlidingSyncRoomInfo(
+                    room_dict.get("name"),
+                    room_dict.get("initial", False),
+                    room_dict.get("bump_stamp"),
+                )
+
+            if "invite_state" in room_dict:
+                state = SyncResponse._get_invite_state(
+                    {"events": room_dict["invite_state"]}
+                )
+                rooms.invite[room_id] = InviteInfo(state)
+                continue
+
+            heroes = room_dict.get("heroes")
+            summary = {
+                "m.joined_member_count": room_dict.get("joined_count"),
+                "m.invited_member_count": room_dict.get("invited_count"),
+                "m.heroes": [h["user_id"] for h in heroes] if heroes else None,
+            }
+
+            info = SyncResponse._get_join_info(
+                room_dict.get("required_state", []),
+                room_dict.get("timeline", []),
+                room_dict.get("prev_batch"),
+                room_dict.get("limited", False),
+                [e[room_id] for e in (receipts, typing) if room_id in e],
+                summary,
+                room_dict,
+                account_data.get(room_id, []),
+            )
+
+            if SlidingSyncResponse._own_membership(user_id, info) in (
+                "leave",
+                "ban",
+            ):
+                rooms.leave[room_id] = info
+            else:
+                rooms.join[room_id] = info
+
+        return rooms, room_info
+
+    @classmethod
+    @verify(Schemas.sliding_sync, SlidingSyncError, False)
+    def from_dict(
+        cls,
+        parsed_dict: Dict[Any, Any],
+        user_id: str,
+    ) -> Union[SlidingSyncResponse, ErrorResponse]:
+        extensions = parsed_dict.get("extensions", {})
+
+        to_device = extensions.get("to_device", {})
+        e2ee = extensions.get("e2ee", {})
+
+        key_count_dict = e2ee.get("device_one_time_keys_count", {})
+        key_count = DeviceOneTimeKeyCount(
+            key_count_dict.get("curve25519"), key_count_dict.get("signed_curve25519")
+        )
+
+        devices = DeviceList(
+            e2ee.get("device_lists", {}).get("changed", []),
+            e2ee.get("device_lists", {}).get("left", []),
+        )
+
+        rooms, room_info = cls._get_rooms(
+            parsed_dict.get("rooms", {}), extensions, user_id
+        )
+
+        account_data = [
+            AccountDataEvent.parse_event(event_dict)
+            for event_dict in extensions.get("account_data", {}).get("global", [])
+        ]
+
+        return cls(
+            parsed_dict["pos"],
+            {
+                name: list_dict["count"]
+                for name, list_dict in parsed_dict.get("lists", {}).items()
+            },
+            rooms,
+            room_info,
+            key_count,
+            devices,
+            SyncResponse._get_to_device(to_device),
+            to_device.get("next_batch"),
+            [],
+            account_data,
+        )
+
+
 class UploadFilterError(ErrorResponse):
     pass
 
@@ -16,6 +16,7 @@
 from __future__ import annotations
 
 import logging
+import sys
 from collections import defaultdict
 from typing import DefaultDict, Dict, List, Optional, Set, Tuple, Union
 
@@ -61,8 +62,24 @@ __all__ = [
 class MatrixRoom:
     """Represents a Matrix room."""
 
-    def __init__(self, room_id: str, own_user_id: str, encrypted: bool = False) -> None:
-        """Initialize a MatrixRoom object."""
+    def __init__(
+        self,
+        room_id: str,
+        own_user_id: str,
+        encrypted: bool = False,
+        intern_strings: bool = False,
+    ) -> None:
+        """Initialize a MatrixRoom object.
+
+        Args:
+            room_id (str): The unique identifier of the room.
+            own_user_id (str): The user id of our own user.
+            encrypted (bool): Is the room encrypted.
+            intern_strings (bool): Should the user ids and display names of
+                the members be interned. Members of many rooms then share a
+                single copy of their strings, which saves memory for large
+                member lists.
+        """
         # yapf: disable
         self.room_id: str = room_id
         self.own_user_id = own_user_id
@@ -93,6 +110,7 @@ class MatrixRoom:
         self.unread_highlights: int = 0
         self.members_synced: bool = False
         self.replacement_room: Union[str, None] = None
+        self.intern_strings: bool = intern_strings
         # yapf: enable
 
     @property
@@ -256,6 +274,10 @@ class MatrixRoom:
         if user_id in self.users:
             return False
 
+        if self.intern_strings:
+            user_id = sys.intern(user_id)
+            display_name = display_name and sys.intern(display_name)
+
         level = self.power_levels.users.get(
             user_id,
             self.power_levels.defaults.users_default,
@@ -335,6 +357,10 @@ class MatrixRoom:
             if "displayname" in event.content:
                 self.names[user.name].remove(user.user_id)
                 user.display_name = event.content["displayname"]
+
+                if self.intern_strings and user.display_name:
+                    user.display_name = sys.intern(user.display_name)
+
                 self.names[user.name].append(user.user_id)
 
             if "avatar_url" in event.content:
@@ -485,11 +511,26 @@ class MatrixRoom:
 
         return joined + invited
 
+    @property
+    def pending_member_count(self) -> int:
+        """Get the number of members that aren't loaded yet.
+
+        If members are lazy loaded the sync only contains the members needed
+        to display the timeline while the room summary counts all of them.
+        The remaining members are loaded on demand, after which this is 0.
+        """
+        if self.members_synced:
+            return 0
+
+        return max(self.member_count - len(self.users), 0)
+
 
 class MatrixInvitedRoom(MatrixRoom):
-    def __init__(self, room_id: str, own_user_id: str) -> None:
+    def __init__(
+        self, room_id: str, own_user_id: str, intern_strings: bool = False
+    ) -> None:
         self.inviter: Optional[str] = None
-        super().__init__(room_id, own_user_id)
+        super().__init__(room_id, own_user_id, intern_strings=intern_strings)
 
     def handle_membership(
         self,
@@ -525,6 +566,21 @@ class MatrixInvitedRoom(MatrixRoom):
 
 
 class MatrixUser:
+    # Only the attributes listed here can be set on users, this keeps the
+    # member lists of large rooms small.
+    __slots__ = (
+        "user_id",
+        "display_name",
+        "avatar_url",
+        "power_level",
+        "invited",
+        "presence",
+        "last_active_ago",
+        "currently_active",
+        "status_msg",
+        "__weakref__",
+    )
+
     def __init__(
         self,
         user_id: str,
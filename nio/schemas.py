@@ -14,7 +14,9 @@
 # CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
 
+import numbers
 import re
+from typing import Any, Callable, Dict, Tuple
 
 from jsonschema import Draft4Validator, FormatChecker, validators
 
@@ -62,8 +64,351 @@ def check_http_url(value: str) -> bool:
     return True
 
 
+_validator_cache: Dict[int, Tuple[Any, Any]] = {}
+_compiled_cache: Dict[int, Tuple[Any, Callable[[Any], bool]]] = {}
+_use_compiled_validators = False
+
+
+def use_compiled_validators(enabled: bool = True) -> None:
+    """Enable or disable the compiled fast-path validation engine.
+
+    When enabled, ``validate_json()`` first checks instances using a
+    specialized checker function that is compiled once per schema. Only
+    instances that fail the fast check are handed to jsonschema, so error
+    messages stay exactly the same as before.
+
+    Args:
+        enabled (bool): Whether the compiled validators should be used.
+    """
+    global _use_compiled_validators
+    _use_compiled_validators = enabled
+
+
+def get_validator(schema):
+    """Get a cached jsonschema validator for the given schema.
+
+    Validators are cached by schema identity, the schemas in ``Schemas``
+    are module level constants so every schema is only prepared once.
+    """
+    cached = _validator_cache.get(id(schema))
+
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+
+    validator = Validator(schema, format_checker=Checker)
+    _validator_cache[id(schema)] = (schema, validator)
+
+    return validator
+
+
+def get_compiled_validator(schema) -> Callable[[Any], bool]:
+    """Get a cached compiled checker function for the given schema.
+
+    The returned function returns True if the instance is valid, defaults
+    are filled in the same way the jsonschema validator does it.
+    """
+    cached = _compiled_cache.get(id(schema))
+
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+
+    checker = _compile_subschema(schema)
+    _compiled_cache[id(schema)] = (schema, checker)
+
+    return checker
+
+
 def validate_json(instance, schema):
-    Validator(schema, format_checker=Checker).validate(instance)
+    if _use_compiled_validators and get_compiled_validator(schema)(instance):
+        return
+
+    get_validator(schema).validate(instance)
+
+
+class _UnsupportedSchema(Exception):
+    pass
+
+
+# Type checks following the Draft 4 type checker of jsonschema.
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda instance: isinstance(instance, dict),
+    "array": lambda instance: isinstance(instance, list),
+    "string": lambda instance: isinstance(instance, str),
+    "boolean": lambda instance: isinstance(instance, bool),
+    "null": lambda instance: instance is None,
+    "integer": lambda instance: (
+        isinstance(instance, int) and not isinstance(instance, bool)
+    ),
+    "number": lambda instance: (
+        isinstance(instance, numbers.Number) and not isinstance(instance, bool)
+    ),
+}
+
+
+def _unknown_type(instance):
+    # Let jsonschema raise the appropriate UnknownType error.
+    return False
+
+
+def _compile_type(types, schema):
+    if isinstance(types, str):
+        return _TYPE_CHECKS.get(types, _unknown_type)
+
+    if not isinstance(types, list) or not all(isinstance(t, str) for t in types):
+        raise _UnsupportedSchema
+
+    checks = [_TYPE_CHECKS.get(t, _unknown_type) for t in types]
+
+    def check_type(instance):
+        return any(check(instance) for check in checks)
+
+    return check_type
+
+
+def _compile_properties(properties, schema):
+    if not isinstance(properties, dict):
+        raise _UnsupportedSchema
+
+    for subschema in properties.values():
+        if not isinstance(subschema, dict):
+            raise _UnsupportedSchema
+
+    defaults = [
+        (name, subschema["default"])
+        for name, subschema in properties.items()
+        if "default" in subschema
+    ]
+    checks = [
+        (name, _compile_subschema(subschema)) for name, subschema in properties.items()
+    ]
+
+    def check_properties(instance):
+        if not isinstance(instance, dict):
+            # Setting defaults on a non-object fails in jsonschema, let it
+            # produce the same error.
+            return not defaults
+
+        for name, default in defaults:
+            instance.setdefault(name, default)
+
+        for name, check in checks:
+            if name in instance and not check(instance[name]):
+                return False
+
+        return True
+
+    return check_properties
+
+
+def _compile_pattern_properties(pattern_properties, schema):
+    if not isinstance(pattern_properties, dict):
+        raise _UnsupportedSchema
+
+    checks = [
+        (re.compile(pattern), _compile_subschema(subschema))
+        for pattern, subschema in pattern_properties.items()
+    ]
+
+    def check_pattern_properties(instance):
+        if not isinstance(instance, dict):
+            return True
+
+        for pattern, check in checks:
+            for key, value in instance.items():
+                if pattern.search(key) and not check(value):
+                    return False
+
+        return True
+
+    return check_pattern_properties
+
+
+def _compile_additional_properties(additional_properties, schema):
+    properties = schema.get("properties", {})
+    patterns = "|".join(schema.get("patternProperties", {}))
+    pattern = re.compile(patterns) if patterns else None
+
+    def extras(instance):
+        for key in instance:
+            if key in properties:
+                continue
+            if pattern and pattern.search(key):
+                continue
+            yield key
+
+    if isinstance(additional_properties, dict):
+        check = _compile_subschema(additional_properties)
+
+        def check_additional_properties(instance):
+            if not isinstance(instance, dict):
+                return True
+
+            return all(check(instance[key]) for key in extras(instance))
+
+    elif not additional_properties:
+
+        def check_additional_properties(instance):
+            if not isinstance(instance, dict):
+                return True
+
+            return next(extras(instance), None) is None
+
+    else:
+
+        def check_additional_properties(instance):
+            return True
+
+    return check_additional_properties
+
+
+def _compile_required(required, schema):
+    if not isinstance(required, list):
+        raise _UnsupportedSchema
+
+    def check_required(instance):
+        if not isinstance(instance, dict):
+            return True
+
+        return all(name in instance for name in required)
+
+    return check_required
+
+
+def _compile_items(items, schema):
+    if isinstance(items, dict):
+        check = _compile_subschema(items)
+
+        def check_items(instance):
+            if not isinstance(instance, list):
+                return True
+
+            return all(check(item) for item in instance)
+
+    elif isinstance(items, list):
+        checks = [_compile_subschema(subschema) for subschema in items]
+
+        def check_items(instance):
+            if not isinstance(instance, list):
+                return True
+
+            return all(check(item) for check, item in zip(checks, instance))
+
+    else:
+        raise _UnsupportedSchema
+
+    return check_items
+
+
+def _compile_enum(enum, schema):
+    # Only string enums are compiled, everything else needs the more
+    # elaborate equality semantics of jsonschema.
+    if not isinstance(enum, list) or not all(isinstance(e, str) for e in enum):
+        raise _UnsupportedSchema
+
+    values = frozenset(enum)
+
+    def check_enum(instance):
+        return isinstance(instance, str) and instance in values
+
+    return check_enum
+
+
+def _compile_format(format, schema):
+    def check_format(instance):
+        return Checker.conforms(instance, format)
+
+    return check_format
+
+
+def _compile_minimum(minimum, schema):
+    number = _TYPE_CHECKS["number"]
+
+    if schema.get("exclusiveMinimum", False):
+
+        def check_minimum(instance):
+            return not number(instance) or instance > minimum
+
+    else:
+
+        def check_minimum(instance):
+            return not number(instance) or instance >= minimum
+
+    return check_minimum
+
+
+def _compile_pattern(pattern, schema):
+    regex = re.compile(pattern)
+
+    def check_pattern(instance):
+        return not isinstance(instance, str) or bool(regex.search(instance))
+
+    return check_pattern
+
+
+def _compile_not(not_schema, schema):
+    check = _compile_subschema(not_schema)
+
+    def check_not(instance):
+        return not check(instance)
+
+    return check_not
+
+
+_KEYWORD_COMPILERS: Dict[str, Callable[[Any, Dict[Any, Any]], Callable]] = {
+    "type": _compile_type,
+    "properties": _compile_properties,
+    "patternProperties": _compile_pattern_properties,
+    "additionalProperties": _compile_additional_properties,
+    "required": _compile_required,
+    "items": _compile_items,
+    "enum": _compile_enum,
+    "format": _compile_format,
+    "minimum": _compile_minimum,
+    "pattern": _compile_pattern,
+    "not": _compile_not,
+}
+
+
+def _compile(schema) -> Callable[[Any], bool]:
+    if not isinstance(schema, dict):
+        raise _UnsupportedSchema
+
+    checks = []
+
+    # Keywords are checked in the same order jsonschema checks them, this
+    # matters since the properties keyword fills in defaults.
+    for keyword, value in schema.items():
+        keyword_compiler = _KEYWORD_COMPILERS.get(keyword)
+
+        if keyword_compiler is not None:
+            checks.append(keyword_compiler(value, schema))
+        elif keyword in Validator.VALIDATORS:
+            raise _UnsupportedSchema
+
+    if not checks:
+        return lambda instance: True
+
+    if len(checks) == 1:
+        return checks[0]
+
+    def check_schema(instance):
+        for check in checks:
+            if not check(instance):
+                return False
+        return True
+
+    return check_schema
+
+
+def _compile_subschema(schema) -> Callable[[Any], bool]:
+    try:
+        return _compile(schema)
+    except _UnsupportedSchema:
+        if not isinstance(schema, dict):
+            raise
+
+        # Fall back to jsonschema for the parts we don't know how to compile.
+        return get_validator(schema).is_valid
 
 
 class Schemas:
@@ -334,6 +679,114 @@ class Schemas:
         "required": ["events"],
     }
 
+    sync_join = {
+        "type": "object",
+        "default": {},
+        "patternProperties": {
+            RoomRegex: {
+                "type": "object",
+                "properties": {
+                    "timeline": room_timeline,
+                    "state": {
+                        "type": "object",
+                        "default": {},
+                        "properties": {
+                            "events": {
+                                "type": "array",
+                                "default": [],
+                            },
+                        },
+                    },
+                    "ephemeral": {
+                        "type": "object",
+                        "default": {},
+                        "properties": {
+                            "events": {
+                                "type": "array",
+                                "default": [],
+                            }
+                        },
+                    },
+                    "summary": {
+                        "type": "object",
+                        "properties": {
+                            "m.invited_member_count": {"type": "integer"},
+                            "m.joined_member_count": {"type": "integer"},
+                            "m.heroes": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                            },
+                        },
+                    },
+                    "account_data": {
+                        "type": "object",
+                        "default": {},
+                        "properties": {
+                            "events": {
+                                "type": "array",
+                                "default": [],
+                            },
+                        },
+                    },
+                },
+            }
+        },
+    }
+
+    sync_to_device = {
+        "type": "object",
+        "default": {},
+        "properties": {"events": {"type": "array", "default": []}},
+    }
+
+    sliding_sync_room = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "initial": {"type": "boolean"},
+            "required_state": {"type": "array", "items": {"type": "object"}},
+            "timeline": {"type": "array", "items": {"type": "object"}},
+            "invite_state": {"type": "array", "items": {"type": "object"}},
+            "prev_batch": {"type": "string"},
+            "limited": {"type": "boolean"},
+            "joined_count": {"type": "integer"},
+            "invited_count": {"type": "integer"},
+            "notification_count": {"type": "integer"},
+            "highlight_count": {"type": "integer"},
+            "bump_stamp": {"type": "integer"},
+            "heroes": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"user_id": {"type": "string"}},
+                    "required": ["user_id"],
+                },
+            },
+        },
+    }
+
+    sliding_sync = {
+        "type": "object",
+        "properties": {
+            "pos": {"type": "string"},
+            "lists": {
+                "type": "object",
+                "additionalProperties": {
+                    "type": "object",
+                    "properties": {"count": {"type": "integer"}},
+                    "required": ["count"],
+                },
+            },
+            "rooms": {
+                "type": "object",
+                "patternProperties": {RoomRegex: sliding_sync_room},
+                "additionalProperties": False,
+            },
+            "extensions": {"type": "object"},
+        },
+        "required": ["pos"],
+    }
+
     sync = {
         "type": "object",
         "properties": {
@@ -379,63 +832,7 @@ class Schemas:
                             }
                         },
                     },
-                    "join": {
-                        "type": "object",
-                        "default": {},
-                        "patternProperties": {
-                            RoomRegex: {
-                                "type": "object",
-                                "properties": {
-                                    "timeline": room_timeline,
-                                    "state": {
-                                        "type": "object",
-                                        "default": {},
-                                        "properties": {
-                                            "events": {
-                                                "type": "array",
-                                                "default": [],
-                                            },
-                                        },
-                                    },
-                                    "ephemeral": {
-                                        "type": "object",
-                                        "default": {},
-                                        "properties": {
-                                            "events": {
-                                                "type": "array",
-                                                "default": [],
-                                            }
-                                        },
-                                    },
-                                    "summary": {
-                                        "type": "object",
-                                        "properties": {
-                                            "m.invited_member_count": {
-                                                "type": "integer"
-                                            },
-                                            "m.joined_member_count": {
-                                                "type": "integer"
-                                            },
-                                            "m.heroes": {
-                                                "type": "array",
-                                                "items": {"type": "string"},
-                                            },
-                                        },
-                                    },
-                                    "account_data": {
-                                        "type": "object",
-                                        "default": {},
-                                        "properties": {
-                                            "events": {
-                                                "type": "array",
-                                                "default": [],
-                                            },
-                                        },
-                                    },
-                                },
-                            }
-                        },
-                    },
+                    "join": sync_join,
                     "leave": {
                         "type": "object",
                         "default": {},
@@ -469,11 +866,7 @@ class Schemas:
                     },
                 },
             },
-            "to_device": {
-                "type": "object",
-                "default": {},
-                "properties": {"events": {"type": "array", "default": []}},
-            },
+            "to_device": sync_to_device,
             "presence": {
                 "type": "object",
                 "default": {},
@@ -1450,6 +1843,12 @@ class Schemas:
         "required": ["joined"],
     }
 
+    room_members = {
+        "type": "object",
+        "properties": {"chunk": {"type": "array"}},
+        "required": ["chunk"],
+    }
+
     joined_rooms = {
         "type": "object",
         "properties": {"joined_rooms": {"type": "array", "items": {"type": "string"}}},
@@ -28,16 +28,24 @@ if package_installed("olm"):
         ForwardedChains,
         Keys,
         MegolmInboundSessions,
+        MegolmMessageIndices,
         OlmSessions,
         OutgoingKeyRequests,
+        RoomMembers,
+        RoomStates,
         StoreVersion,
+        SyncFilters,
         SyncTokens,
     )
     from .database import (
+        DatabaseProfile,
         DefaultStore,
         MatrixStore,
+        RoomSnapshot,
         SqliteMemoryStore,
         SqliteStore,
+        snapshot_rooms,
         use_database,
         use_database_atomic,
     )
+    from .async_store import AsyncMatrixStore
@@ -0,0 +1,115 @@
+"""Asynchronous access to a MatrixStore.
+
+The peewee calls of the store block, running them on the event loop stalls
+every other coroutine while e.g. a large set of device keys is written. The
+AsyncMatrixStore runs the store on a dedicated database thread instead.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from typing import Any, Callable, TypeVar
+
+from .database import MatrixStore
+
+T = TypeVar("T")
+
+
+class AsyncMatrixStore:
+    """Run a MatrixStore on a dedicated database thread.
+
+    The store is created on the database thread and it's only used from that
+    thread, so it owns the database connection. Calls are queued and run one
+    at a time in the order they were made.
+
+    Every public method of the store is available as a coroutine function
+    with the same signature. Code that can't await, like the Olm machine,
+    can use the `blocking` proxy which has the interface of the store and
+    waits for the database thread to run the call.
+
+    Args:
+        store_factory (Callable[[], MatrixStore]): A function that creates the
+            store, it is called on the database thread.
+
+    Attributes:
+        store (MatrixStore): The wrapped store, it should only be used on the
+            database thread.
+        blocking (MatrixStore): A proxy for the store that runs the calls on
+            the database thread and waits for them to finish.
+
+    Example:
+        >>> store = AsyncMatrixStore(
+        ...     partial(SqliteStore, user_id, device_id, store_path)
+        ... )
+        >>> await store.save_sync_token(token)
+        >>> store.blocking.load_sync_token()
+        'token'
+    """
+
+    def __init__(self, store_factory: Callable[[], MatrixStore]):
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="nio-store")
+
+        try:
+            self._thread = self._executor.submit(threading.current_thread).result()
+            self.store = self._executor.submit(store_factory).result()
+        except BaseException:
+            self._executor.shutdown(wait=False)
+            raise
+
+        self.blocking = _BlockingMatrixStore(self)
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run a function on the database thread and wait for the result."""
+        if threading.current_thread() is self._thread:
+            return func(*args, **kwargs)
+
+        return self._executor.submit(func, *args, **kwargs).result()
+
+    async def run(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run a function on the database thread without blocking the loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
+
+    async def close(self) -> None:
+        """Close the store and stop the database thread."""
+        await self.run(self.store.close)
+        self._executor.shutdown(wait=False)
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") or name == "store":
+            raise AttributeError(name)
+
+        attribute = getattr(self.store, name)
+
+        if not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        async def method(*args, **kwargs):
+            return await self.run(attribute, *args, **kwargs)
+
+        return method
+
+
+class _BlockingMatrixStore:
+    def __init__(self, async_store: AsyncMatrixStore):
+        self._async_store = async_store
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        async_store = self._async_store
+        attribute = getattr(async_store.store, name)
+
+        if not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def method(*args, **kwargs):
+            return async_store.call(attribute, *args, **kwargs)
+
+        return method
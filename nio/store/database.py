@@ -14,17 +14,36 @@ from __future__ import annotations
 
 import os
 import sqlite3
-from dataclasses import dataclass, field
-from functools import wraps
-from typing import List, Optional
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from functools import partial, wraps
+from itertools import groupby
+from typing import (
+    Any,
+    Callable,
+    DefaultDict,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from peewee import DoesNotExist, SqliteDatabase
+from peewee import JOIN, DoesNotExist, SqliteDatabase
 from playhouse.sqliteq import SqliteQueueDatabase
 
+from .. import json_backend
 from ..crypto import (
     DeviceStore,
     GroupSessionStore,
     InboundGroupSession,
+    LazyGroupSessionStore,
+    LazySessionStore,
     OlmAccount,
     OlmDevice,
     OutgoingKeyRequest,
@@ -32,6 +51,9 @@ from ..crypto import (
     SessionStore,
     TrustState,
 )
+from ..events import DefaultLevels, PowerLevels, Receipt
+from ..responses import RoomSummary
+from ..rooms import MatrixRoom
 from . import (
     Accounts,
     DeviceKeys,
@@ -43,9 +65,13 @@ from . import (
     Keys,
     KeyStore,
     MegolmInboundSessions,
+    MegolmMessageIndices,
     OlmSessions,
     OutgoingKeyRequests,
+    RoomMembers,
+    RoomStates,
     StoreVersion,
+    SyncFilters,
     SyncTokens,
 )
 
@@ -57,6 +83,10 @@ def use_database(fn):
 
     @wraps(fn)
     def inner(self, *args, **kwargs):
+        # Queued writes need to land first, otherwise they could be missing
+        # from reads or get overwritten by older state.
+        self._flush_queued()
+
         with self.database.bind_ctx(self.models):
             return fn(self, *args, **kwargs)
 
@@ -72,6 +102,8 @@ def use_database_atomic(fn):
 
     @wraps(fn)
     def inner(self, *args, **kwargs):
+        self._flush_queued()
+
         with self.database.bind_ctx(self.models):
             if isinstance(self.database, SqliteQueueDatabase):
                 return fn(self, *args, **kwargs)
@@ -82,14 +114,242 @@ def use_database_atomic(fn):
     return inner
 
 
+def use_write_behind(key: Callable[..., Hashable]):
+    """
+    Queue the wrapped write if the store batches its writes.
+
+    Queued writes with the same key replace each other, so only the latest
+    state of an object gets written when the queue is flushed.
+    """
+
+    def decorator(fn):
+        @wraps(fn)
+        def inner(self, *args, **kwargs):
+            if not self.write_behind:
+                return fn(self, *args, **kwargs)
+
+            write_key = (fn.__name__, key(*args, **kwargs))
+            self._queue_write(write_key, partial(fn, self, *args, **kwargs))
+
+        return inner
+
+    return decorator
+
+
+def _room_to_state(room: MatrixRoom) -> Dict[str, Any]:
+    """Serialize the member independent state of a room."""
+    return {
+        "creator": room.creator,
+        "federate": room.federate,
+        "room_version": room.room_version,
+        "room_type": room.room_type,
+        "guest_access": room.guest_access,
+        "join_rule": room.join_rule,
+        "history_visibility": room.history_visibility,
+        "canonical_alias": room.canonical_alias,
+        "topic": room.topic,
+        "name": room.name,
+        "parents": sorted(room.parents),
+        "children": sorted(room.children),
+        "encrypted": room.encrypted,
+        "power_levels": asdict(room.power_levels),
+        "read_receipts": {
+            user_id: asdict(receipt) for user_id, receipt in room.read_receipts.items()
+        },
+        "summary": asdict(room.summary) if room.summary else None,
+        "room_avatar_url": room.room_avatar_url,
+        "fully_read_marker": room.fully_read_marker,
+        "tags": room.tags,
+        "unread_notifications": room.unread_notifications,
+        "unread_highlights": room.unread_highlights,
+        "members_synced": room.members_synced,
+        "replacement_room": room.replacement_room,
+    }
+
+
+@dataclass(frozen=True)
+class RoomSnapshot:
+    """The state of a room in the form that the store saves it.
+
+    Attributes:
+        room_id (str): The id of the room.
+        state (str): The serialized member independent state of the room.
+        members (List[Tuple[str, Optional[str], Optional[str], bool]]): The
+            user id, display name, avatar url and invite status of the
+            members that changed.
+        left_members (List[str]): The ids of the users that changed and
+            aren't part of the room anymore.
+    """
+
+    room_id: str
+    state: str
+    members: List[Tuple[str, Optional[str], Optional[str], bool]]
+    left_members: List[str]
+
+
+def snapshot_rooms(
+    rooms: Iterable[MatrixRoom], changed_members: Dict[str, Set[str]]
+) -> List[RoomSnapshot]:
+    """Take a snapshot of the state of rooms that can be saved later on.
+
+    The snapshot doesn't reference the rooms, so it can be saved on another
+    thread while the rooms keep changing.
+
+    Args:
+        rooms (Iterable[MatrixRoom]): The rooms whose state should be saved.
+        changed_members (Dict[str, Set[str]]): A mapping from a room id to
+            the set of user ids whose membership or profile changed.
+    """
+    snapshots = []
+
+    for room in rooms:
+        members = []
+        left = []
+
+        for user_id in changed_members.get(room.room_id, ()):
+            user = room.users.get(user_id)
+
+            if user:
+                members.append(
+                    (user.user_id, user.display_name, user.avatar_url, user.invited)
+                )
+            else:
+                left.append(user_id)
+
+        snapshots.append(
+            RoomSnapshot(
+                room.room_id, json_backend.dumps(_room_to_state(room)), members, left
+            )
+        )
+
+    return snapshots
+
+
+def _room_from_state(
+    room_id: str,
+    own_user_id: str,
+    state: Dict[str, Any],
+    intern_strings: bool = False,
+):
+    """Create a MatrixRoom without members from its serialized state."""
+    room = MatrixRoom(room_id, own_user_id, state["encrypted"], intern_strings)
+
+    room.creator = state["creator"]
+    room.federate = state["federate"]
+    room.room_version = state["room_version"]
+    room.room_type = state["room_type"]
+    room.guest_access = state["guest_access"]
+    room.join_rule = state["join_rule"]
+    room.history_visibility = state["history_visibility"]
+    room.canonical_alias = state["canonical_alias"]
+    room.topic = state["topic"]
+    room.name = state["name"]
+    room.parents = set(state["parents"])
+    room.children = set(state["children"])
+
+    power_levels = state["power_levels"]
+    room.power_levels = PowerLevels(
+        DefaultLevels(**power_levels["defaults"]),
+        power_levels["users"],
+        power_levels["events"],
+    )
+
+    room.read_receipts = {
+        user_id: Receipt(**receipt)
+        for user_id, receipt in state["read_receipts"].items()
+    }
+    room.summary = RoomSummary(**state["summary"]) if state["summary"] else None
+    room.room_avatar_url = state["room_avatar_url"]
+    room.fully_read_marker = state["fully_read_marker"]
+    room.tags = state["tags"]
+    room.unread_notifications = state["unread_notifications"]
+    room.unread_highlights = state["unread_highlights"]
+    room.members_synced = state["members_synced"]
+    room.replacement_room = state["replacement_room"]
+
+    return room
+
+
+@dataclass(frozen=True)
+class DatabaseProfile:
+    """SQLite settings of a MatrixStore database.
+
+    The defaults keep SQLite's rollback journal and zero out deleted data,
+    `DatabaseProfile.performance()` returns settings suited to write heavy
+    workloads.
+
+    Attributes:
+        journal_mode (str, optional): The SQLite journal mode, e.g. "wal" or
+            "delete". If not set the mode of the database file is kept.
+        synchronous (str, optional): How often SQLite waits for data to reach
+            the disk, "full", "normal" or "off". With the "wal" journal mode
+            "normal" is still safe against corruption but the last
+            transactions may be rolled back after a power loss.
+        secure_delete (bool): Overwrite deleted data with zeros.
+        cache_size (int, optional): The size of the page cache, in pages if
+            positive and in KiB if negative.
+        mmap_size (int, optional): The maximum number of bytes of the
+            database file that are memory mapped.
+        queue (bool): Send all writes through a single writer thread using
+            `SqliteQueueDatabase`, reads stay on the calling thread. Writes
+            aren't wrapped in transactions in that case.
+    """
+
+    journal_mode: Optional[str] = None
+    synchronous: Optional[str] = None
+    secure_delete: bool = True
+    cache_size: Optional[int] = None
+    mmap_size: Optional[int] = None
+    queue: bool = False
+
+    @classmethod
+    def performance(cls, queue: bool = False) -> DatabaseProfile:
+        """Settings that trade secure deletion for write throughput."""
+        return cls(
+            journal_mode="wal",
+            synchronous="normal",
+            secure_delete=False,
+            cache_size=-64 * 1024,
+            mmap_size=256 * 1024 * 1024,
+            queue=queue,
+        )
+
+    @property
+    def pragmas(self) -> Dict[str, Any]:
+        pragmas = {
+            "foreign_keys": 1,
+            "secure_delete": int(self.secure_delete),
+        }
+
+        optional = {
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "cache_size": self.cache_size,
+            "mmap_size": self.mmap_size,
+        }
+        pragmas.update((k, v) for k, v in optional.items() if v is not None)
+
+        return pragmas
+
+
 @dataclass
 class MatrixStore:
-    """Storage class for matrix state."""
+    """Storage class for matrix state.
+
+    By default every change is written to the database right away. If
+    write_behind is enabled, changes to the account, the Olm and Megolm
+    sessions, the device keys and the sync token are queued instead and
+    written together in a single transaction when flush() is called. The
+    queue is also flushed when it holds max_queued_writes changes, when the
+    oldest change is older than flush_interval seconds, or before any other
+    database access.
+    """
 
     models = [
         Accounts,
         OlmSessions,
         MegolmInboundSessions,
+        MegolmMessageIndices,
         ForwardedChains,
         DeviceKeys,
         EncryptedRooms,
@@ -97,6 +357,9 @@ class MatrixStore:
         StoreVersion,
         Keys,
         SyncTokens,
+        SyncFilters,
+        RoomStates,
+        RoomMembers,
     ]
     store_version = 2
 
@@ -107,15 +370,13 @@ class MatrixStore:
     database_name: str = ""
     database_path: str = field(init=False)
     database: SqliteDatabase = field(init=False)
+    write_behind: bool = field(default=False, init=False)
+    max_queued_writes: int = field(default=1000, init=False)
+    flush_interval: float = field(default=5.0, init=False)
+    profile: DatabaseProfile = field(default_factory=DatabaseProfile)
 
     def _create_database(self):
-        return SqliteDatabase(
-            self.database_path,
-            pragmas={
-                "foreign_keys": 1,
-                "secure_delete": 1,
-            },
-        )
+        return SqliteDatabase(self.database_path, pragmas=self.profile.pragmas)
 
     def upgrade_to_v2(self):
         with self.database.bind_ctx([DeviceKeys_v1]):
@@ -132,8 +393,15 @@ class MatrixStore:
         self._update_version(2)
 
     def __post_init__(self):
+        self._queued_writes: Dict[Hashable, Callable[[], None]] = {}
+        self._queued_device_keys: DefaultDict[str, Dict[str, OlmDevice]] = defaultdict(
+            dict
+        )
+        self._queued_since = 0.0
+
         self.database_name = self.database_name or f"{self.user_id}_{self.device_id}.db"
         self.database_path = os.path.join(self.store_path, self.database_name)
+
         self.database = self._create_database()
         self.database.connect()
 
@@ -146,6 +414,83 @@ class MatrixStore:
         with self.database.bind_ctx(self.models):
             self.database.create_tables(self.models)
 
+        # The writer thread of a queue database doesn't wait for schema
+        # changes to be applied, so it's only used once the schema is set up.
+        if self.profile.queue:
+            self.database.close()
+            self.database = SqliteQueueDatabase(
+                self.database_path, pragmas=self.profile.pragmas
+            )
+            self.database.connect()
+
+    def _queue_write(self, key: Hashable, write: Callable[[], None]) -> None:
+        if not self._queued_writes and not self._queued_device_keys:
+            self._queued_since = time.monotonic()
+
+        self._queued_writes[key] = write
+        self._flush_if_due()
+
+    def _flush_if_due(self) -> None:
+        queued = len(self._queued_writes) + sum(
+            len(devices) for devices in self._queued_device_keys.values()
+        )
+
+        if (
+            queued >= self.max_queued_writes
+            or time.monotonic() - self._queued_since >= self.flush_interval
+        ):
+            self.flush()
+
+    def _flush_queued(self) -> None:
+        if self._queued_writes or self._queued_device_keys:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all the queued changes to the database.
+
+        The changes are written in a single transaction, if any of them fails
+        none of them are written and they stay queued.
+        """
+        writes, self._queued_writes = self._queued_writes, {}
+        device_keys, self._queued_device_keys = self._queued_device_keys, (
+            defaultdict(dict)
+        )
+
+        if not writes and not device_keys:
+            return
+
+        if isinstance(self.database, SqliteQueueDatabase):
+            transaction = nullcontext()
+        else:
+            transaction = self.database.atomic()
+
+        try:
+            with self.database.bind_ctx(self.models), transaction:
+                for write in writes.values():
+                    write()
+
+                if device_keys:
+                    self._save_device_keys(device_keys)
+        except BaseException:
+            # Changes that were queued in the meantime are newer.
+            writes.update(self._queued_writes)
+            self._queued_writes = writes
+
+            for user_id, devices in self._queued_device_keys.items():
+                device_keys[user_id].update(devices)
+            self._queued_device_keys = device_keys
+
+            raise
+
+    def close(self) -> None:
+        """Write the queued changes and close the database."""
+        self.flush()
+
+        if isinstance(self.database, SqliteQueueDatabase):
+            self.database.stop()
+
+        self.database.close()
+
     def _get_store_version(self):
         with self.database.bind_ctx([StoreVersion]):
             self.database.create_tables([StoreVersion])
@@ -182,7 +527,6 @@ class MatrixStore:
 
         return OlmAccount.from_pickle(account.account, self.pickle_key, account.shared)
 
-    @use_database
     def save_account(self, account):
         """Save the provided Olm account to the database.
 
@@ -190,44 +534,78 @@ class MatrixStore:
             account (OlmAccount): The olm account that will be pickled and
                 saved in the database.
         """
+        # Queued writes only hold the pickle, the account can keep changing
+        # while they wait to be flushed.
+        self._save_account(account.pickle(self.pickle_key), account.shared)
+
+    @use_write_behind(lambda pickle, shared: None)
+    @use_database
+    def _save_account(self, pickle: str, shared: bool) -> None:
         Accounts.insert(
             user_id=self.user_id,
             device_id=self.device_id,
-            shared=account.shared,
-            account=account.pickle(self.pickle_key),
+            shared=shared,
+            account=pickle,
         ).on_conflict_ignore().execute()
 
         Accounts.update(
             {
-                Accounts.account: account.pickle(self.pickle_key),
-                Accounts.shared: account.shared,
+                Accounts.account: pickle,
+                Accounts.shared: shared,
             }
         ).where(
             (Accounts.user_id == self.user_id) & (Accounts.device_id == self.device_id)
         ).execute()
 
-    @use_database
-    def load_sessions(self) -> SessionStore:
+    def load_sessions(self, lazy: bool = False) -> SessionStore:
         """Load all Olm sessions from the database.
 
+        Args:
+            lazy (bool): If set, the sessions of a sender key are only loaded
+                the first time they are needed.
+
         Returns:
             ``SessionStore`` object, containing all the loaded sessions.
 
         """
-        session_store = SessionStore()
-
-        account = self._get_account()
+        if lazy:
+            return LazySessionStore(self._load_sender_key_sessions, self.load_sessions)
 
-        if not account:
-            return session_store
+        session_store = SessionStore()
 
-        for s in account.olm_sessions:
-            session = Session.from_pickle(s.session, s.creation_time, self.pickle_key)
-            session_store.add(s.sender_key, session)
+        for sender_key, session in self._load_sessions():
+            session_store.add(sender_key, session)
 
         return session_store
 
+    def _load_sender_key_sessions(self, sender_key: str) -> List[Session]:
+        return [
+            session
+            for _, session in self._load_sessions(OlmSessions.sender_key == sender_key)
+        ]
+
     @use_database
+    def _load_sessions(self, *conditions) -> List[Tuple[str, Session]]:
+        query = (
+            OlmSessions.select(
+                OlmSessions.sender_key,
+                OlmSessions.session,
+                OlmSessions.creation_time,
+            )
+            .join(Accounts)
+            .where(
+                (Accounts.user_id == self.user_id)
+                & (Accounts.device_id == self.device_id),
+                *conditions,
+            )
+            .tuples()
+        )
+
+        return [
+            (sender_key, Session.from_pickle(pickle, creation_time, self.pickle_key))
+            for sender_key, pickle, creation_time in query
+        ]
+
     def save_session(self, curve_key, session):
         """Save the provided Olm session to the database.
 
@@ -236,72 +614,226 @@ class MatrixStore:
             session (Session): The Olm session that will be pickled and
                 saved in the database.
         """
+        self._save_session(
+            curve_key,
+            session.id,
+            session.pickle(self.pickle_key),
+            session.creation_time,
+            session.use_time,
+        )
+
+    @use_write_behind(lambda curve_key, session_id, *args: session_id)
+    @use_database
+    def _save_session(
+        self,
+        curve_key: str,
+        session_id: str,
+        pickle: str,
+        creation_time: datetime,
+        use_time: datetime,
+    ) -> None:
         account = self._get_account()
         assert account
 
         OlmSessions.replace(
             account=account,
             sender_key=curve_key,
-            session=session.pickle(self.pickle_key),
-            session_id=session.id,
-            creation_time=session.creation_time,
-            last_usage_date=session.use_time,
+            session=pickle,
+            session_id=session_id,
+            creation_time=creation_time,
+            last_usage_date=use_time,
         ).execute()
 
-    @use_database
-    def load_inbound_group_sessions(self) -> GroupSessionStore:
-        """Load all Olm sessions from the database.
+    def load_inbound_group_sessions(
+        self, lazy: bool = False, max_sessions: int = 1000
+    ) -> GroupSessionStore:
+        """Load all Megolm inbound group sessions from the database.
+
+        Args:
+            lazy (bool): If set, sessions are only loaded the first time they
+                are needed instead of all at once.
+            max_sessions (int): The maximum number of sessions a lazy store
+                keeps in memory.
 
         Returns:
             ``GroupSessionStore`` object, containing all the loaded sessions.
 
         """
-        store = GroupSessionStore()
-
-        account = self._get_account()
+        if lazy:
+            return LazyGroupSessionStore(
+                self.load_inbound_group_session,
+                self._load_inbound_group_sessions,
+                max_sessions,
+            )
 
-        if not account:
-            return store
+        store = GroupSessionStore()
 
-        for s in account.inbound_group_sessions:
-            session = InboundGroupSession.from_pickle(
-                s.session,
-                s.fp_key,
-                s.sender_key,
-                s.room_id,
-                self.pickle_key,
-                [chain.sender_key for chain in s.forwarded_chains],
-            )
+        for session in self._load_inbound_group_sessions():
             store.add(session)
 
         return store
 
+    def load_inbound_group_session(
+        self, room_id: str, sender_key: str, session_id: str
+    ) -> Optional[InboundGroupSession]:
+        """Load a single Megolm inbound group session from the database.
+
+        Args:
+            room_id (str): The room id of the session.
+            sender_key (str): The curve25519 key of the session's sender.
+            session_id (str): The id of the session.
+
+        Returns the session or None if it wasn't found.
+        """
+        sessions = self._load_inbound_group_sessions(
+            MegolmInboundSessions.session_id == session_id,
+            MegolmInboundSessions.room_id == room_id,
+            MegolmInboundSessions.sender_key == sender_key,
+        )
+
+        return sessions[0] if sessions else None
+
     @use_database
+    def _load_inbound_group_sessions(self, *conditions) -> List[InboundGroupSession]:
+        # The forwarding chains are fetched in the same query, one row per
+        # chain, and grouped back together by session.
+        query = (
+            MegolmInboundSessions.select(
+                MegolmInboundSessions.session_id,
+                MegolmInboundSessions.session,
+                MegolmInboundSessions.fp_key,
+                MegolmInboundSessions.sender_key,
+                MegolmInboundSessions.room_id,
+                ForwardedChains.sender_key,
+            )
+            .join(Accounts)
+            .switch(MegolmInboundSessions)
+            .join(ForwardedChains, JOIN.LEFT_OUTER)
+            .where(
+                (Accounts.user_id == self.user_id)
+                & (Accounts.device_id == self.device_id),
+                *conditions,
+            )
+            .order_by(MegolmInboundSessions.session_id, ForwardedChains.id)
+            .tuples()
+        )
+
+        return [
+            InboundGroupSession.from_pickle(
+                pickle,
+                fp_key,
+                sender_key,
+                room_id,
+                self.pickle_key,
+                [row[-1] for row in rows if row[-1] is not None],
+            )
+            for (_, pickle, fp_key, sender_key, room_id), rows in groupby(
+                query, key=lambda row: row[:-1]
+            )
+        ]
+
     def save_inbound_group_session(self, session):
         """Save the provided Megolm inbound group session to the database.
 
         Args:
             session (InboundGroupSession): The session to save.
         """
+        self._save_inbound_group_session(
+            session.id,
+            session.sender_key,
+            session.ed25519,
+            session.room_id,
+            session.pickle(self.pickle_key),
+            list(session.forwarding_chain),
+        )
+
+    @use_write_behind(lambda session_id, *args: session_id)
+    @use_database
+    def _save_inbound_group_session(
+        self,
+        session_id: str,
+        sender_key: str,
+        ed25519: str,
+        room_id: str,
+        pickle: str,
+        forwarding_chain: List[str],
+    ) -> None:
         account = self._get_account()
         assert account
 
         MegolmInboundSessions.insert(
-            sender_key=session.sender_key,
+            sender_key=sender_key,
             account=account,
-            fp_key=session.ed25519,
-            room_id=session.room_id,
-            session=session.pickle(self.pickle_key),
-            session_id=session.id,
+            fp_key=ed25519,
+            room_id=room_id,
+            session=pickle,
+            session_id=session_id,
         ).on_conflict_ignore().execute()
 
-        MegolmInboundSessions.update(
-            {MegolmInboundSessions.session: session.pickle(self.pickle_key)}
-        ).where(MegolmInboundSessions.session_id == session.id).execute()
+        MegolmInboundSessions.update({MegolmInboundSessions.session: pickle}).where(
+            MegolmInboundSessions.session_id == session_id
+        ).execute()
 
-        # TODO, use replace many here
-        for chain in session.forwarding_chain:
-            ForwardedChains.replace(sender_key=chain, session=session.id).execute()
+        if forwarding_chain:
+            ForwardedChains.replace_many(
+                [
+                    {"sender_key": chain, "session": session_id}
+                    for chain in forwarding_chain
+                ]
+            ).execute()
+
+    @use_database
+    def load_message_indices(self, sender_key: str, session_id: str) -> Optional[bytes]:
+        """Load the replay protection indices of a Megolm session.
+
+        Args:
+            sender_key (str): The curve25519 key of the session's sender.
+            session_id (str): The id of the session.
+
+        Returns the packed indices, see `MessageIndexStore`, or None if there
+        are none.
+        """
+        account = self._get_account()
+
+        if not account:
+            return None
+
+        try:
+            return (
+                account.message_indices.select(MegolmMessageIndices.indices)
+                .where(
+                    (MegolmMessageIndices.sender_key == sender_key)
+                    & (MegolmMessageIndices.session_id == session_id)
+                )
+                .get()
+                .indices
+            )
+        except DoesNotExist:
+            return None
+
+    @use_database_atomic
+    def save_message_indices(self, indices: Dict[Tuple[str, str], bytes]) -> None:
+        """Save the replay protection indices of Megolm sessions.
+
+        Args:
+            indices (Dict[Tuple[str, str], bytes]): The packed indices, keyed
+                by the sender key and the id of the session.
+        """
+        account = self._get_account()
+        assert account
+
+        rows = [
+            {
+                "sender_key": sender_key,
+                "session_id": session_id,
+                "account": account,
+                "indices": data,
+            }
+            for (sender_key, session_id), data in indices.items()
+        ]
+
+        for idx in range(0, len(rows), 100):
+            MegolmMessageIndices.replace_many(rows[idx : idx + 100]).execute()
 
     @use_database
     def load_device_keys(self) -> DeviceStore:
@@ -328,7 +860,6 @@ class MatrixStore:
 
         return store
 
-    @use_database_atomic
     def save_device_keys(self, device_keys):
         """Save the provided device keys to the database.
 
@@ -337,6 +868,20 @@ class MatrixStore:
                 containing a mapping from a user id to a dictionary containing
                 a mapping of a device id to a OlmDevice.
         """
+        if not self.write_behind:
+            self._save_device_keys(device_keys)
+            return
+
+        if not self._queued_writes and not self._queued_device_keys:
+            self._queued_since = time.monotonic()
+
+        for user_id, devices in device_keys.items():
+            self._queued_device_keys[user_id].update(devices)
+
+        self._flush_if_due()
+
+    @use_database_atomic
+    def _save_device_keys(self, device_keys):
         account = self._get_account()
         assert account
         rows = []
@@ -450,6 +995,7 @@ class MatrixStore:
                 rows, fields=[EncryptedRooms.room_id, EncryptedRooms.account]
             ).on_conflict_ignore().execute()
 
+    @use_write_behind(lambda token: None)
     @use_database
     def save_sync_token(self, token: str) -> None:
         """Save the given token"""
@@ -473,6 +1019,201 @@ class MatrixStore:
 
         return None
 
+    @use_database
+    def save_filter_id(self, filter_hash: str, filter_id: str) -> None:
+        """Save the id of an uploaded filter.
+
+        Args:
+            filter_hash (str): The hash of the filter definition.
+            filter_id (str): The id that the server assigned to the filter.
+        """
+        account = self._get_account()
+        assert account
+
+        SyncFilters.replace(
+            account=account, filter_hash=filter_hash, filter_id=filter_id
+        ).execute()
+
+    @use_database
+    def load_filter_ids(self) -> Dict[str, str]:
+        """Load the ids of the uploaded filters.
+
+        Returns a mapping from the hash of a filter definition to its id.
+        """
+        account = self._get_account()
+
+        if not account:
+            return {}
+
+        query = (
+            SyncFilters.select(SyncFilters.filter_hash, SyncFilters.filter_id)
+            .where(SyncFilters.account == account)
+            .tuples()
+        )
+
+        return dict(query)
+
+    @use_database
+    def delete_filter_id(self, filter_hash: str) -> None:
+        """Forget the id of a filter that the server doesn't know anymore."""
+        account = self._get_account()
+
+        if not account:
+            return
+
+        SyncFilters.delete().where(
+            (SyncFilters.account == account) & (SyncFilters.filter_hash == filter_hash)
+        ).execute()
+
+    @use_database
+    def load_rooms(self, intern_strings: bool = False) -> Dict[str, MatrixRoom]:
+        """Load the stored state of the joined rooms for this account.
+
+        Args:
+            intern_strings (bool): Should the rooms intern the user ids and
+                display names of their members.
+
+        Returns:
+            ``Dict`` containing a mapping from room id to ``MatrixRoom``.
+
+        """
+        account = self._get_account()
+
+        if not account:
+            return {}
+
+        rooms: Dict[str, MatrixRoom] = {}
+        rooms_by_row: Dict[int, MatrixRoom] = {}
+
+        query = (
+            RoomStates.select(RoomStates.id, RoomStates.room_id, RoomStates.state)
+            .where(RoomStates.account == account)
+            .tuples()
+        )
+
+        for row_id, room_id, state in query:
+            room = _room_from_state(
+                room_id, self.user_id, json_backend.loads(state), intern_strings
+            )
+            rooms[room_id] = room
+            rooms_by_row[row_id] = room
+
+        query = (
+            RoomMembers.select(
+                RoomMembers.room,
+                RoomMembers.user_id,
+                RoomMembers.display_name,
+                RoomMembers.avatar_url,
+                RoomMembers.invited,
+            )
+            .join(RoomStates)
+            .where(RoomStates.account == account)
+            .tuples()
+        )
+
+        for row_id, user_id, display_name, avatar_url, invited in query:
+            rooms_by_row[row_id].add_member(user_id, display_name, avatar_url, invited)
+
+        return rooms
+
+    def save_rooms(
+        self,
+        rooms: Iterable[MatrixRoom],
+        changed_members: Dict[str, Set[str]],
+    ) -> None:
+        """Save the state of the given rooms.
+
+        The state of the rooms is always saved, only the members that have
+        changed are updated.
+
+        Args:
+            rooms (Iterable[MatrixRoom]): The rooms whose state should be
+                saved.
+            changed_members (Dict[str, Set[str]]): A mapping from a room id to
+                the set of user ids whose membership or profile changed.
+                Members that aren't part of the room anymore are removed.
+        """
+        self.save_room_snapshots(snapshot_rooms(rooms, changed_members))
+
+    @use_database_atomic
+    def save_room_snapshots(self, snapshots: List[RoomSnapshot]) -> None:
+        """Save the state of rooms that was taken with `snapshot_rooms()`."""
+        account = self._get_account()
+        assert account
+
+        if not snapshots:
+            return
+
+        rows = [
+            {"room_id": snapshot.room_id, "account": account, "state": snapshot.state}
+            for snapshot in snapshots
+        ]
+
+        for idx in range(0, len(rows), 100):
+            data = rows[idx : idx + 100]
+            RoomStates.insert_many(data).on_conflict_ignore().execute()
+
+        for row in rows:
+            RoomStates.update({RoomStates.state: row["state"]}).where(
+                (RoomStates.account == account) & (RoomStates.room_id == row["room_id"])
+            ).execute()
+
+        room_ids = [snapshot.room_id for snapshot in snapshots]
+        row_ids: Dict[str, int] = {}
+
+        for idx in range(0, len(room_ids), 400):
+            query = (
+                RoomStates.select(RoomStates.room_id, RoomStates.id)
+                .where(
+                    (RoomStates.account == account)
+                    & (RoomStates.room_id.in_(room_ids[idx : idx + 400]))
+                )
+                .tuples()
+            )
+            row_ids.update(query)
+
+        member_rows = []
+
+        for snapshot in snapshots:
+            if not snapshot.left_members and not snapshot.members:
+                continue
+
+            row_id = row_ids[snapshot.room_id]
+            left = snapshot.left_members
+
+            for idx in range(0, len(left), 400):
+                RoomMembers.delete().where(
+                    (RoomMembers.room == row_id)
+                    & (RoomMembers.user_id.in_(left[idx : idx + 400]))
+                ).execute()
+
+            for user_id, display_name, avatar_url, invited in snapshot.members:
+                member_rows.append(
+                    {
+                        "room": row_id,
+                        "user_id": user_id,
+                        "display_name": display_name,
+                        "avatar_url": avatar_url,
+                        "invited": invited,
+                    }
+                )
+
+        for idx in range(0, len(member_rows), 100):
+            data = member_rows[idx : idx + 100]
+            RoomMembers.replace_many(data).execute()
+
+    @use_database
+    def delete_room(self, room_id: str) -> None:
+        """Delete the stored state of a room."""
+        account = self._get_account()
+
+        if not account:
+            return
+
+        RoomStates.delete().where(
+            (RoomStates.account == account) & (RoomStates.room_id == room_id)
+        ).execute()
+
     @use_database
     def delete_encrypted_room(self, room: str) -> None:
         """Delete an encrypted room from the store."""
@@ -608,6 +1349,8 @@ class DefaultStore(MatrixStore):
             encryption keys while they are in storage.
         database_name (str, optional): The file-name of the database that
             should be used.
+        profile (DatabaseProfile, optional): The SQLite settings of the
+            database.
     """
 
     trust_db: KeyStore = field(init=False)
@@ -746,6 +1489,8 @@ class SqliteStore(MatrixStore):
             encryption keys while they are in storage.
         database_name (str, optional): The file-name of the database that
             should be used.
+        profile (DatabaseProfile, optional): The SQLite settings of the
+            database.
     """
 
     models = MatrixStore.models + [DeviceTrustState]
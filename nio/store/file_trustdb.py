@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from functools import wraps
-from typing import Any, Iterator, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from atomicwrites import atomic_write
 
@@ -66,6 +66,9 @@ class Ed25519Key(Key):
 class KeyStore:
     def __init__(self, filename: str):
         self._entries: List[Key] = []
+        # The entries of every device, for lookups that don't need to scan
+        # the whole list.
+        self._devices: Dict[Tuple[str, str], List[Key]] = {}
         self._filename: str = filename
 
         self._load(filename)
@@ -73,6 +76,12 @@ class KeyStore:
     def __iter__(self) -> Iterator[Key]:
         yield from self._entries
 
+    def __contains__(self, key: object) -> bool:
+        if not isinstance(key, Key):
+            return False
+
+        return key in self._devices.get((key.user_id, key.device_id), ())
+
     def __repr__(self) -> str:
         return f"KeyStore object, file: {self._filename}"
 
@@ -90,16 +99,26 @@ class KeyStore:
                     if not entry:
                         continue
 
-                    self._entries.append(entry)
+                    self._append(entry)
         except FileNotFoundError:
             pass
 
-    def get_key(self, user_id: str, device_id: str) -> Optional[Key]:
-        for entry in self._entries:
-            if user_id == entry.user_id and device_id == entry.device_id:
-                return entry
+    def _append(self, key: Key) -> None:
+        self._entries.append(key)
+        self._devices.setdefault((key.user_id, key.device_id), []).append(key)
+
+    def _remove(self, key: Key) -> None:
+        self._entries.remove(key)
 
-        return None
+        device_keys = self._devices[(key.user_id, key.device_id)]
+        device_keys.remove(key)
+
+        if not device_keys:
+            del self._devices[(key.user_id, key.device_id)]
+
+    def get_key(self, user_id: str, device_id: str) -> Optional[Key]:
+        device_keys = self._devices.get((user_id, device_id))
+        return device_keys[0] if device_keys else None
 
     def _save_store(f):
         @wraps(f)
@@ -138,7 +157,7 @@ class KeyStore:
                     logger.error(message)
                     raise OlmTrustError(message)
 
-        self._entries.append(key)
+        self._append(key)
         return True
 
     @_save_store  # type: ignore
@@ -148,16 +167,16 @@ class KeyStore:
     @_save_store  # type: ignore
     def remove_many(self, keys: List[Key]):
         for key in keys:
-            if key in self._entries:
-                self._entries.remove(key)
+            if key in self:
+                self._remove(key)
 
     @_save_store  # type: ignore
     def remove(self, key: Key) -> bool:
-        if key in self._entries:
-            self._entries.remove(key)
+        if key in self:
+            self._remove(key)
             return True
 
         return False
 
     def check(self, key: Key) -> bool:
-        return key in self._entries
+        return key in self
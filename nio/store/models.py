@@ -81,7 +81,7 @@ class Accounts(Model):
 class OlmSessions(Model):
     creation_time = DateField()
     last_usage_date = DateField()
-    sender_key = TextField()
+    sender_key = TextField(index=True)
     account = ForeignKeyField(
         model=Accounts, backref="olm_sessions", on_delete="CASCADE"
     )
@@ -159,6 +159,21 @@ class MegolmInboundSessions(Model):
     session_id = TextField(primary_key=True)
 
 
+class MegolmMessageIndices(Model):
+    sender_key = TextField()
+    session_id = TextField()
+    account = ForeignKeyField(
+        model=Accounts,
+        column_name="account_id",
+        on_delete="CASCADE",
+        backref="message_indices",
+    )
+    indices = ByteField()
+
+    class Meta:
+        constraints = [SQL("UNIQUE(sender_key,session_id,account_id)")]
+
+
 class ForwardedChains(Model):
     sender_key = TextField()
     session = ForeignKeyField(
@@ -213,6 +228,20 @@ class SyncTokens(Model):
         constraints = [SQL("UNIQUE(account_id)")]
 
 
+class SyncFilters(Model):
+    filter_hash = TextField()
+    filter_id = TextField()
+    account = ForeignKeyField(
+        model=Accounts,
+        column_name="account_id",
+        on_delete="CASCADE",
+        backref="sync_filters",
+    )
+
+    class Meta:
+        constraints = [SQL("UNIQUE(account_id,filter_hash)")]
+
+
 class TrackedUsers(Model):
     user_id = TextField()
     account = ForeignKeyField(
@@ -224,3 +253,33 @@ class TrackedUsers(Model):
 
     class Meta:
         constraints = [SQL("UNIQUE(account_id,user_id)")]
+
+
+class RoomStates(Model):
+    room_id = TextField()
+    state = TextField()
+    account = ForeignKeyField(
+        model=Accounts,
+        column_name="account_id",
+        on_delete="CASCADE",
+        backref="room_states",
+    )
+
+    class Meta:
+        constraints = [SQL("UNIQUE(room_id,account_id)")]
+
+
+class RoomMembers(Model):
+    user_id = TextField()
+    display_name = TextField(null=True)
+    avatar_url = TextField(null=True)
+    invited = BooleanField()
+    room = ForeignKeyField(
+        model=RoomStates,
+        column_name="room_state_id",
+        on_delete="CASCADE",
+        backref="members",
+    )
+
+    class Meta:
+        constraints = [SQL("UNIQUE(room_state_id,user_id)")]
@@ -12,8 +12,9 @@
 # CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF OR IN
 # CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 
+import json
 
-from nio.api import Api
+from nio.api import Api, SlidingSyncList
 
 
 class TestClass:
@@ -76,3 +77,27 @@ class TestClass:
         resp = api.put_room_alias(token, room_alias, room_id)
 
         assert resp == ("PUT", expected_path, expected_data)
+
+    def test_sliding_sync(self) -> None:
+        """Test that sliding_sync sends the lists and the position"""
+        token = "SECRET_TOKEN"
+        room_list = SlidingSyncList([("m.room.name", "")], 5, [(0, 9)])
+
+        method, path, data = Api.sliding_sync(
+            token, {"all": room_list.as_dict()}, pos="3", timeout=30000
+        )
+
+        assert method == "POST"
+        assert path == (
+            "/_matrix/client/unstable/org.matrix.simplified_msc3575/sync"
+            f"?access_token={token}&pos=3&timeout=30000"
+        )
+        assert json.loads(data) == {
+            "lists": {
+                "all": {
+                    "required_state": [["m.room.name", ""]],
+                    "timeline_limit": 5,
+                    "ranges": [[0, 9]],
+                }
+            }
+        }
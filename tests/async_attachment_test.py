@@ -1,12 +1,24 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import aiofiles
 import pytest
 import unpaddedbase64
 from Crypto import Random  # nosec
-
-from nio import EncryptionError
-from nio.crypto import async_encrypt_attachment, decrypt_attachment
+from Crypto.Cipher import AES  # nosec
+from Crypto.Hash import SHA256  # nosec
+from Crypto.Util import Counter  # nosec
+
+from nio import AsyncClient, EncryptionError
+from nio.crypto import (
+    async_decrypt_attachment,
+    async_encrypt_attachment,
+    async_generator_from_data,
+    decrypt_attachment,
+)
+from nio.crypto.attachments import _get_decryption_info_dict
 
 FILEPATH = "tests/data/test_bytes"
 
@@ -60,6 +72,67 @@ class TestClass:
         with pytest.raises(TypeError):
             await self.test_encrypt(123)
 
+    async def test_encrypt_chunk_size(self):
+        data = Random.new().read(300 * 1024)
+        small_chunks = [data[i : i + 1024] for i in range(0, len(data), 1024)]
+
+        class CountingExecutor(ThreadPoolExecutor):
+            submitted = 0
+
+            def submit(self, *args, **kwargs):
+                CountingExecutor.submitted += 1
+                return super().submit(*args, **kwargs)
+
+        for source in (data, small_chunks):
+            with CountingExecutor(1) as executor:
+                *chunks, keys = [
+                    i
+                    async for i in async_encrypt_attachment(
+                        source, chunk_size=128 * 1024, executor=executor
+                    )
+                ]
+
+            assert [len(c) for c in chunks] == [128 * 1024, 128 * 1024, 44 * 1024]
+            assert all(isinstance(c, bytes) for c in chunks)
+            assert data == decrypt_attachment(
+                b"".join(chunks),
+                keys["key"]["k"],
+                keys["hashes"]["sha256"],
+                keys["iv"],
+            )
+
+        # The last chunk is small enough to be encrypted inline.
+        assert CountingExecutor.submitted == 4
+
+    async def test_decrypt(self):
+        data = Random.new().read(300 * 1024)
+        *chunks, keys = [i async for i in async_encrypt_attachment(data)]
+        ciphertext = b"".join(chunks)
+
+        async def stream(ciphertext):
+            for i in range(0, len(ciphertext), 100 * 1024):
+                yield ciphertext[i : i + 100 * 1024]
+
+        decrypted = [
+            chunk
+            async for chunk in async_decrypt_attachment(
+                stream(ciphertext),
+                keys["key"]["k"],
+                keys["hashes"]["sha256"],
+                keys["iv"],
+            )
+        ]
+        assert b"".join(decrypted) == data
+
+        truncated = async_decrypt_attachment(
+            stream(ciphertext[:-1]),
+            keys["key"]["k"],
+            keys["hashes"]["sha256"],
+            keys["iv"],
+        )
+        with pytest.raises(EncryptionError, match="Mismatched SHA-256 digest"):
+            [_ async for _ in truncated]
+
     async def test_hash_verification(self):
         data, ciphertext, keys = await self._get_data_cypher_keys()
 
@@ -127,3 +200,55 @@ class TestClass:
             keys["iv"],
         )
         assert plaintext != data
+
+
+async def _legacy_encrypt_attachment(data):
+    # The previous implementation, kept as a baseline for the benchmark: 4 KiB
+    # chunks and separate thread pool round trips for the cipher and the hash.
+    key = Random.new().read(32)
+    iv = Random.new().read(8)
+    ctr = Counter.new(64, prefix=iv, initial_value=0)
+
+    cipher = AES.new(key, AES.MODE_CTR, counter=ctr)
+    sha256 = SHA256.new()
+
+    loop = asyncio.get_event_loop()
+
+    async for chunk in async_generator_from_data(data):
+        crypt_chunk = await loop.run_in_executor(None, cipher.encrypt, chunk)
+        await loop.run_in_executor(None, sha256.update, crypt_chunk)
+        yield crypt_chunk
+
+    yield _get_decryption_info_dict(key, iv, sha256)
+
+
+@pytest.mark.parametrize("implementation", ["legacy", "streaming"])
+def test_upload_encryption_benchmark(benchmark, monkeypatch, implementation):
+    if implementation == "legacy":
+        monkeypatch.setattr(
+            "nio.client.async_client.async_encrypt_attachment",
+            _legacy_encrypt_attachment,
+        )
+
+    size = 16 * 1024 * 1024
+    data = Random.new().read(size)
+
+    async def encrypt():
+        # The generator that AsyncClient.upload(encrypt=True) streams to the
+        # server.
+        client = AsyncClient("https://example.org")
+        try:
+            async for _ in client._encrypted_data_generator(data, {}):
+                pass
+        finally:
+            await client.close()
+
+    durations = []
+
+    def run():
+        start = time.perf_counter()
+        asyncio.run(encrypt())
+        durations.append(time.perf_counter() - start)
+
+    benchmark.pedantic(run, rounds=3)
+    benchmark.extra_info["MB/s"] = size / min(durations) / 1e6
@@ -1,9 +1,12 @@
 import asyncio
 import json
 import math
+import os
 import re
+import stat
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from os import path
 from pathlib import Path
@@ -22,6 +25,7 @@ from aiohttp import (
 )
 from aioresponses import CallbackResult, aioresponses
 from helpers import faker
+from olm import Account
 from yarl import URL
 
 from nio import (
@@ -38,10 +42,12 @@ from nio import (
     DirectRoomsResponse,
     DiscoveryInfoError,
     DiscoveryInfoResponse,
+    DiskDownloadResponse,
     DownloadError,
     DownloadResponse,
     EnablePushRuleResponse,
     ErrorResponse,
+    Event,
     FullyReadEvent,
     GetOpenIDTokenResponse,
     JoinedMembersResponse,
@@ -57,6 +63,7 @@ from nio import (
     LogoutResponse,
     MegolmEvent,
     OlmTrustError,
+    OlmUnverifiedDeviceError,
     PresenceEvent,
     PresenceGetResponse,
     PresenceSetResponse,
@@ -89,6 +96,7 @@ from nio import (
     RoomForgetResponse,
     RoomGetEventError,
     RoomGetEventResponse,
+    RoomGetMembersResponse,
     RoomGetStateEventResponse,
     RoomGetStateResponse,
     RoomGetVisibilityResponse,
@@ -114,8 +122,12 @@ from nio import (
     SetPushRuleActionsResponse,
     SetPushRuleResponse,
     ShareGroupSessionResponse,
+    SlidingSyncError,
+    SlidingSyncList,
+    SlidingSyncResponse,
     SpaceGetHierarchyError,
     SpaceGetHierarchyResponse,
+    SyncError,
     SyncResponse,
     ThumbnailError,
     ThumbnailResponse,
@@ -127,9 +139,19 @@ from nio import (
     UploadFilterResponse,
     UploadResponse,
 )
-from nio.api import EventFormat, ResizingMethod, RoomPreset, RoomVisibility
-from nio.client.async_client import connect_wrapper, on_request_chunk_sent
-from nio.crypto import OlmDevice, Session, decrypt_attachment
+from nio.api import Api, EventFormat, ResizingMethod, RoomPreset, RoomVisibility
+from nio.client.async_client import (
+    RoomCallbackDispatcher,
+    connect_wrapper,
+    on_request_chunk_sent,
+)
+from nio.crypto import (
+    OlmDevice,
+    Session,
+    decrypt_attachment,
+    encrypt_attachment,
+)
+from nio.crypto.async_attachments import DEFAULT_CHUNK_SIZE
 
 TEST_ROOM_ID = "!testroom:example.org"
 
@@ -221,6 +243,24 @@ class TestClass:
             }
         }
 
+    @property
+    def room_members_response(self):
+        return {
+            "chunk": [
+                {
+                    "type": "m.room.member",
+                    "event_id": f"$member{index}:example.org",
+                    "sender": user_id,
+                    "state_key": user_id,
+                    "origin_server_ts": 1516809890615,
+                    "content": {"membership": "join", "displayname": name},
+                }
+                for index, (user_id, name) in enumerate(
+                    [(ALICE_ID, "Alice"), (EIRIN_ID, "Eirin")]
+                )
+            ]
+        }
+
     @property
     def joined_rooms_response(self):
         return {"joined_rooms": [TEST_ROOM_ID]}
@@ -810,6 +850,196 @@ class TestClass:
         resp5 = await async_client.sync(timeout=None)
         assert isinstance(resp5, SyncResponse)
 
+    async def test_sync_streaming(self, async_client, aioresponse):
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+        async_client.config = AsyncClientConfig(streaming_sync=True, io_chunk_size=7)
+
+        events = []
+
+        async def cb(room, event):
+            events.append((room.room_id, event))
+
+        async_client.add_event_callback(cb, Event)
+
+        url = "https://example.org/_matrix/client/r0/sync?access_token=abc123"
+        aioresponse.get(url, status=200, payload=self.sync_response)
+
+        resp = await async_client.sync()
+        assert isinstance(resp, SyncResponse)
+        assert resp.next_batch == async_client.next_batch
+        assert not resp.rooms.join
+
+        expected = SyncResponse.from_dict(self.sync_response)
+        room_id = "!SVkFJHzfwvuaIEawgC:localhost"
+        timeline = expected.rooms.join[room_id].timeline.events
+        assert [event for _, event in events] == timeline
+        assert all(event_room == room_id for event_room, _ in events)
+
+        room = async_client.rooms[room_id]
+        assert room.unread_notifications == 11
+        assert room.users["@example:localhost"].presence == "online"
+
+        # Invalid room sections and bodies result in an error response.
+        sync_response = self.sync_response
+        sync_response["rooms"]["join"][room_id]["timeline"] = []
+        aioresponse.get(
+            re.compile(rf"^{re.escape(url)}&since=.*$"),
+            status=200,
+            payload=sync_response,
+        )
+        assert isinstance(await async_client.sync(), SyncError)
+
+        aioresponse.get(
+            re.compile(rf"^{re.escape(url)}&since=.*$"),
+            status=200,
+            body='{"next_batch": "token", "rooms": {"join": {',
+            content_type="application/json",
+        )
+        assert isinstance(await async_client.sync(), SyncError)
+
+        # Handling the rooms doesn't count towards the request timeout, only
+        # a silent server times the sync out.
+        aioresponse.get(
+            re.compile(rf"^{re.escape(url)}&.*timeout=30000.*$"),
+            status=200,
+            payload=self.sync_response,
+        )
+        assert isinstance(await async_client.sync(30000), SyncResponse)
+
+        (request,) = (
+            call
+            for (_, request_url), calls in aioresponse.requests.items()
+            if "timeout=30000" in str(request_url)
+            for call in calls
+        )
+        request_timeout = request.kwargs["timeout"]
+        assert request_timeout.total is None
+        assert request_timeout.sock_read == 45
+
+    async def test_sync_streaming_error_replay(self, async_client, aioresponse):
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+        async_client.config = AsyncClientConfig(
+            streaming_sync=True, store_room_state=True
+        )
+
+        events = []
+
+        async def cb(room, event):
+            events.append(event.event_id)
+
+        async_client.add_event_callback(cb, RoomMessageText)
+
+        room_id = "!SVkFJHzfwvuaIEawgC:localhost"
+        room = self.sync_response["rooms"]["join"][room_id]
+        body = (
+            f'{{"next_batch": "token", "rooms": {{"join": {{"{room_id}": '
+            f"{json.dumps(room)}, "
+        )
+
+        url = "https://example.org/_matrix/client/r0/sync?access_token=abc123"
+        aioresponse.get(
+            url, status=200, body=body + '"!broken', content_type="application/json"
+        )
+        aioresponse.get(url, status=200, body=body[:-2] + "}}}")
+
+        # The room before the error was handled but nothing was saved and the
+        # token wasn't advanced.
+        assert isinstance(await async_client.sync(), SyncError)
+        assert events == ["$152037280074GZeOm:localhost"]
+        assert async_client.next_batch == ""
+        assert room_id not in async_client.store.load_rooms()
+
+        # The next sync returns the same events, their callbacks run again.
+        assert isinstance(await async_client.sync(), SyncResponse)
+        assert events == ["$152037280074GZeOm:localhost"] * 2
+        assert async_client.next_batch == "token"
+        assert room_id in async_client.store.load_rooms()
+
+    async def test_sync_concurrent_room_callbacks(self, async_client, aioresponse):
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+        async_client.config = AsyncClientConfig(room_callback_concurrency=4)
+
+        events = []
+
+        async def cb(room, event):
+            await asyncio.sleep(0)
+            events.append(event)
+
+        async_client.add_event_callback(cb, Event)
+
+        aioresponse.get(
+            "https://example.org/_matrix/client/r0/sync?access_token=abc123",
+            status=200,
+            payload=self.sync_response,
+        )
+
+        resp = await async_client.sync()
+        assert isinstance(resp, SyncResponse)
+
+        await async_client.drain_room_callbacks()
+
+        room_id = "!SVkFJHzfwvuaIEawgC:localhost"
+        assert events == resp.rooms.join[room_id].timeline.events
+
+    async def test_room_callback_dispatcher(self):
+        dispatcher = RoomCallbackDispatcher(concurrency=2, queue_size=1)
+        calls = []
+        slow_started = asyncio.Event()
+        slow_release = asyncio.Event()
+
+        def callback(room_id, index, wait=False):
+            async def run():
+                if wait:
+                    slow_started.set()
+                    await slow_release.wait()
+                calls.append((room_id, index))
+
+            return run
+
+        await dispatcher.put("!a", callback("!a", 0, wait=True))
+        await dispatcher.put("!a", callback("!a", 1))
+        await slow_started.wait()
+
+        # Other rooms aren't blocked by the slow callback.
+        for index in range(3):
+            await dispatcher.put("!b", callback("!b", index))
+
+        await asyncio.sleep(0.01)
+        assert calls == [("!b", 0), ("!b", 1), ("!b", 2)]
+
+        # The queue of the slow room is full, queueing waits for it.
+        put = asyncio.ensure_future(dispatcher.put("!a", callback("!a", 2)))
+        await asyncio.sleep(0.01)
+        assert not put.done()
+
+        slow_release.set()
+        await put
+        await dispatcher.drain()
+
+        assert [call for call in calls if call[0] == "!a"] == [
+            ("!a", 0),
+            ("!a", 1),
+            ("!a", 2),
+        ]
+
+        async def failing():
+            raise ValueError("callback error")
+
+        await dispatcher.put("!a", failing)
+        await dispatcher.put("!a", callback("!a", 3))
+
+        with pytest.raises(ValueError, match="callback error"):
+            await dispatcher.drain()
+
+        assert calls[-1] == ("!a", 3)
+        await dispatcher.drain()
+
     async def test_sync_presence(self, async_client, aioresponse):
         """Test if prsences info in sync events are parsed correctly"""
         await async_client.receive_response(
@@ -1034,6 +1264,415 @@ class TestClass:
 
         assert isinstance(response, RoomSendResponse)
 
+    async def test_group_session_pre_sharing(self, async_client, aioresponse):
+        base_url = "https://example.org/_matrix/client/r0"
+
+        aioresponse.put(
+            re.compile(rf"{base_url}/rooms/{TEST_ROOM_ID}/send/.*"),
+            status=200,
+            payload={"event_id": "$1555:example.org"},
+            repeat=True,
+        )
+        aioresponse.get(
+            f"{base_url}/rooms/{TEST_ROOM_ID}/joined_members?access_token=abc123",
+            status=200,
+            payload=self.joined_members_response,
+        )
+        aioresponse.post(
+            f"{base_url}/keys/query?access_token=abc123",
+            status=200,
+            payload=self.keys_query_response,
+            repeat=True,
+        )
+        aioresponse.post(
+            f"{base_url}/keys/claim?access_token=abc123",
+            status=200,
+            payload={"one_time_keys": {}, "failures": {}},
+            repeat=True,
+        )
+
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+        async_client.config = AsyncClientConfig(pre_share_group_sessions=True)
+
+        await async_client.receive_response(self.encryption_sync_response)
+        await async_client.joined_members(TEST_ROOM_ID)
+        await async_client.keys_query()
+
+        # Pre-sharing skips rooms with unverified devices, even if they are
+        # still waiting for their one-time keys.
+        for device in async_client.device_store:
+            async_client.verify_device(device)
+
+        async_client.olm.create_outbound_group_session(TEST_ROOM_ID)
+        session = async_client.olm.outbound_group_sessions[TEST_ROOM_ID]
+        session.shared = True
+
+        await async_client.room_send(
+            TEST_ROOM_ID, "m.room.message", {"body": "hello"}, "1"
+        )
+        # The session is fresh, there's nothing to share yet.
+        assert not async_client._pre_share_task
+        assert not await async_client.pre_share_group_sessions()
+
+        # The next session is shared before the current one runs out.
+        session.message_count = session.max_messages - 5
+        await async_client.room_send(
+            TEST_ROOM_ID, "m.room.message", {"body": "hello"}, "2"
+        )
+        await async_client._pre_share_task
+
+        new_session = async_client.olm.outbound_group_sessions[TEST_ROOM_ID]
+        assert new_session.id != session.id
+        assert new_session.shared
+        assert not async_client.olm.should_share_group_session(TEST_ROOM_ID)
+
+        # A membership change invalidates the session, the sync response
+        # starts sharing a new one.
+        async_client._invalidate_session_for_member_event(TEST_ROOM_ID, ALICE_ID)
+        assert async_client.olm.should_share_group_session(TEST_ROOM_ID)
+
+        await async_client.receive_response(self.encryption_sync_response)
+        await async_client._pre_share_task
+        assert not async_client.olm.should_share_group_session(TEST_ROOM_ID)
+
+        # Idle rooms are left alone.
+        async_client.config = AsyncClientConfig(
+            pre_share_group_sessions=True, pre_share_idle_time=0
+        )
+        async_client.invalidate_outbound_session(TEST_ROOM_ID)
+        assert not await async_client.pre_share_group_sessions()
+        assert async_client.olm.should_share_group_session(TEST_ROOM_ID)
+        assert TEST_ROOM_ID not in async_client._last_room_send
+
+        # A message that waits for a share which fails, e.g. a pre-share
+        # refusing unverified devices, shares the session itself.
+        async_client.config = AsyncClientConfig()
+        failing_share = asyncio.Event()
+        async_client.sharing_session[TEST_ROOM_ID] = failing_share
+
+        send = asyncio.ensure_future(
+            async_client.room_send(
+                TEST_ROOM_ID,
+                "m.room.message",
+                {"body": "hello"},
+                "3",
+                ignore_unverified_devices=True,
+            )
+        )
+        await asyncio.sleep(0)
+        assert not send.done()
+
+        del async_client.sharing_session[TEST_ROOM_ID]
+        failing_share.set()
+
+        assert isinstance(await send, RoomSendResponse)
+        assert not async_client.olm.should_share_group_session(TEST_ROOM_ID)
+
+    async def test_lazy_loaded_members(self, async_client, aioresponse):
+        base_url = "https://example.org/_matrix/client/r0"
+        sync_filters = []
+
+        def sync_cb(url, **kwargs):
+            sync_filters.append(json.loads(url.query["filter"]))
+            return CallbackResult(
+                status=200,
+                payload={
+                    "next_batch": "token1",
+                    "rooms": {
+                        "join": {
+                            TEST_ROOM_ID: {
+                                "state": {"events": [member_event(ALICE_ID)]},
+                                "timeline": {
+                                    "events": [
+                                        {
+                                            "type": "m.room.encryption",
+                                            "event_id": "$encryption",
+                                            "sender": ALICE_ID,
+                                            "state_key": "",
+                                            "origin_server_ts": 1,
+                                            "content": {
+                                                "algorithm": "m.megolm.v1.aes-sha2"
+                                            },
+                                        }
+                                    ]
+                                },
+                                "summary": {
+                                    "m.joined_member_count": 2,
+                                    "m.invited_member_count": 1,
+                                },
+                            }
+                        }
+                    },
+                },
+            )
+
+        def member_event(user_id, membership="join"):
+            return {
+                "type": "m.room.member",
+                "event_id": f"$member-{user_id}",
+                "sender": user_id,
+                "state_key": user_id,
+                "origin_server_ts": 1,
+                "content": {"membership": membership},
+            }
+
+        aioresponse.get(re.compile(rf"{base_url}/sync\?.*"), callback=sync_cb)
+        aioresponse.get(
+            re.compile(
+                rf"{base_url}/rooms/{TEST_ROOM_ID}/members"
+                rf"\?access_token=abc123&at=token1&not_membership=leave"
+            ),
+            status=200,
+            payload={
+                "chunk": [
+                    member_event(ALICE_ID),
+                    member_event(EIRIN_ID),
+                    member_event(CAROL_ID, "invite"),
+                ]
+            },
+        )
+        aioresponse.put(
+            re.compile(rf"{base_url}/rooms/{TEST_ROOM_ID}/send/.*"),
+            status=200,
+            payload={"event_id": "$1555:example.org"},
+            repeat=True,
+        )
+        aioresponse.post(
+            f"{base_url}/keys/query?access_token=abc123",
+            status=200,
+            payload=self.keys_query_response,
+            repeat=True,
+        )
+        aioresponse.post(
+            f"{base_url}/keys/claim?access_token=abc123",
+            status=200,
+            payload={"one_time_keys": {}, "failures": {}},
+            repeat=True,
+        )
+
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+        await async_client.sync(
+            sync_filter={"room": {"timeline": {"limit": 5}}}, lazy_load_members=True
+        )
+
+        assert sync_filters == [
+            {"room": {"timeline": {"limit": 5}, "state": {"lazy_load_members": True}}}
+        ]
+
+        room = async_client.rooms[TEST_ROOM_ID]
+        assert room.encrypted
+        assert not room.members_synced
+        assert room.users.keys() == {ALICE_ID}
+        assert room.pending_member_count == 2
+
+        # A shared session doesn't need the member list.
+        async_client.olm.create_outbound_group_session(TEST_ROOM_ID)
+        session = async_client.olm.outbound_group_sessions[TEST_ROOM_ID]
+        session.shared = True
+
+        await async_client.room_send(
+            TEST_ROOM_ID, "m.room.message", {"body": "hello"}, "1"
+        )
+        assert not room.members_synced
+
+        # Sharing a new session loads the members first.
+        async_client.invalidate_outbound_session(TEST_ROOM_ID)
+
+        response = await async_client.room_send(
+            TEST_ROOM_ID,
+            "m.room.message",
+            {"body": "hello"},
+            "2",
+            ignore_unverified_devices=True,
+        )
+        assert isinstance(response, RoomSendResponse)
+
+        assert room.members_synced
+        assert room.pending_member_count == 0
+        assert room.users.keys() == {ALICE_ID, EIRIN_ID, CAROL_ID}
+        assert room.invited_users.keys() == {CAROL_ID}
+        assert async_client.olm.outbound_group_sessions[TEST_ROOM_ID].id != session.id
+
+    async def test_room_get_members_during_sync(self, async_client, aioresponse):
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+        await async_client.receive_response(self.encryption_sync_response)
+        room = async_client.rooms[TEST_ROOM_ID]
+
+        def member_event(user_id, membership):
+            return RoomMemberEvent(
+                {
+                    "event_id": f"$member-{user_id}",
+                    "sender": user_id,
+                    "origin_server_ts": 1516809890615,
+                },
+                user_id,
+                membership,
+                None,
+                {"membership": membership},
+            )
+
+        def member_json(user_id, membership):
+            return {
+                "type": "m.room.member",
+                "event_id": f"$member-{user_id}",
+                "sender": user_id,
+                "state_key": user_id,
+                "origin_server_ts": 1,
+                "content": {"membership": membership},
+            }
+
+        # Eirin joins and Carol leaves in a sync that is handled while the
+        # member list, which is older, is on its way.
+        sync_response = SyncResponse(
+            "token456",
+            Rooms(
+                {},
+                {
+                    TEST_ROOM_ID: RoomInfo(
+                        Timeline(
+                            [
+                                member_event(EIRIN_ID, "join"),
+                                member_event(CAROL_ID, "leave"),
+                            ],
+                            False,
+                            "prev_batch_token",
+                        ),
+                        [],
+                        [],
+                        [],
+                    )
+                },
+                {},
+            ),
+            DeviceOneTimeKeyCount(49, 50),
+            DeviceList([], []),
+            [],
+            [],
+        )
+
+        async def members_cb(url, **kwargs):
+            await async_client.receive_response(sync_response)
+            return CallbackResult(
+                status=200,
+                payload={
+                    "chunk": [
+                        member_json(ALICE_ID, "join"),
+                        member_json(CAROL_ID, "invite"),
+                    ]
+                },
+            )
+
+        aioresponse.get(
+            re.compile(
+                rf"https://example\.org/_matrix/client/r0/rooms/{TEST_ROOM_ID}/members.*"
+            ),
+            callback=members_cb,
+        )
+
+        response = await async_client.room_get_members(TEST_ROOM_ID)
+        assert isinstance(response, RoomGetMembersResponse)
+
+        assert room.members_synced
+        assert room.users.keys() == {ALICE_ID, EIRIN_ID}
+        assert not async_client._member_requests
+
+    async def test_sliding_sync(self, async_client, aioresponse):
+        url = re.compile(
+            r"https://example\.org/_matrix/client/unstable/"
+            r"org\.matrix\.simplified_msc3575/sync\?.*"
+        )
+        requests = []
+        responses = [
+            (200, self._load_response("tests/data/sliding_sync_response.json")),
+            (400, {"errcode": "M_UNKNOWN_POS", "error": "Unknown position"}),
+            (200, {"pos": "1"}),
+        ]
+
+        def sliding_sync_cb(url, data, **kwargs):
+            requests.append((url.query.get("pos"), json.loads(data)))
+            status, payload = responses.pop(0) if responses else (200, {"pos": "2"})
+            return CallbackResult(status=status, payload=payload)
+
+        aioresponse.post(url, callback=sliding_sync_cb, repeat=True)
+        aioresponse.post(
+            "https://example.org/_matrix/client/r0/keys/upload?access_token=abc123",
+            status=200,
+            payload=self.final_keys_upload_response,
+            repeat=True,
+        )
+        aioresponse.post(
+            "https://example.org/_matrix/client/r0/keys/query?access_token=abc123",
+            status=200,
+            payload=self.keys_query_response,
+            repeat=True,
+        )
+
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+
+        messages = []
+
+        async def cb(room, event):
+            messages.append((room.room_id, event.body))
+
+        async_client.add_event_callback(cb, RoomMessageText)
+
+        room_id = "!SVkFJHzfwvuaIEawgC:localhost"
+        lists = {"all": SlidingSyncList([("m.room.name", "")], 1, [(0, 19)])}
+
+        response = await async_client.sliding_sync(lists)
+        assert isinstance(response, SlidingSyncResponse)
+
+        assert async_client.sliding_sync_pos == "5"
+        assert messages == [(room_id, "hello")]
+        assert async_client.rooms[room_id].encrypted
+        assert "@bob:example.org" in async_client.rooms[room_id].users
+        assert "!invited:localhost" in async_client.invited_rooms
+
+        pos, body = requests[0]
+        assert pos is None
+        assert body["lists"]["all"] == {
+            "required_state": [["m.room.name", ""], ["m.room.encryption", ""]],
+            "timeline_limit": 1,
+            "ranges": [[0, 19]],
+        }
+        assert body["extensions"]["to_device"] == {"enabled": True}
+        assert body["extensions"]["e2ee"] == {"enabled": True}
+
+        # The position and the to-device token are passed on, an expired
+        # position starts a new connection.
+        lists["all"].ranges = [(20, 39)]
+        response = await async_client.sliding_sync(lists)
+        assert isinstance(response, SlidingSyncError)
+        assert async_client.sliding_sync_pos == ""
+
+        pos, body = requests[1]
+        assert pos == "5"
+        assert body["lists"]["all"]["ranges"] == [[20, 39]]
+        assert body["extensions"]["to_device"] == {"enabled": True, "since": "td-7"}
+
+        await async_client.sliding_sync(lists)
+        assert requests[2][0] is None
+        assert async_client.sliding_sync_pos == "1"
+
+        task = asyncio.ensure_future(async_client.sliding_sync_forever(lists))
+        await async_client.synced.wait()
+        await async_client.synced.wait()
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert async_client.sliding_sync_pos == "2"
+        assert [pos for pos, _ in requests[3:5]] == ["1", "2"]
+
     async def test_room_get_event(self, async_client, aioresponse):
         await async_client.receive_response(
             LoginResponse.from_dict(self.login_response)
@@ -1311,6 +1950,162 @@ class TestClass:
         assert not async_client.get_missing_sessions(TEST_ROOM_ID)
         assert async_client.olm.session_store.get(alice_device.curve25519)
 
+    async def test_pipelined_session_sharing(self, async_client, aioresponse):
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+        await async_client.receive_response(self.encryption_sync_response)
+
+        async_client.config = AsyncClientConfig(
+            key_claim_batch_size=2, max_key_sharing_requests=1
+        )
+
+        accounts = {}
+
+        for _ in range(5):
+            account = Account()
+            account.generate_one_time_keys(1)
+            device = OlmDevice(ALICE_ID, faker.device_id(), account.identity_keys)
+            async_client.device_store.add(device)
+            async_client.verify_device(device)
+            accounts[device.id] = account
+
+        # One device already has an Olm session, the others need to claim a
+        # one-time key first.
+        device_id, account = next(iter(accounts.items()))
+        one_time = list(account.one_time_keys["curve25519"].values())[0]
+        async_client.olm.create_session(
+            one_time, async_client.device_store[ALICE_ID][device_id].curve25519
+        )
+
+        events = []
+        in_flight = 0
+        max_in_flight = 0
+
+        async def claim_cb(url, data, **kwargs):
+            device_ids = json.loads(data)["one_time_keys"][ALICE_ID]
+            events.append(("claim", len(device_ids)))
+            await asyncio.sleep(0.05)
+
+            one_time_keys = {}
+
+            for device_id in device_ids:
+                account = accounts[device_id]
+                key_id, key = list(account.one_time_keys["curve25519"].items())[0]
+                one_time_keys[device_id] = {
+                    f"signed_curve25519:{key_id}": {
+                        "key": key,
+                        "signatures": {
+                            ALICE_ID: {
+                                f"ed25519:{device_id}": account.sign(
+                                    Api.to_canonical_json({"key": key})
+                                )
+                            }
+                        },
+                    }
+                }
+
+            return CallbackResult(
+                status=200,
+                payload={"one_time_keys": {ALICE_ID: one_time_keys}, "failures": {}},
+            )
+
+        async def to_device_cb(url, data, **kwargs):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            events.append(("send", list(json.loads(data)["messages"][ALICE_ID])))
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return CallbackResult(status=200, payload={})
+
+        aioresponse.post(
+            "https://example.org/_matrix/client/r0/keys/claim?access_token=abc123",
+            callback=claim_cb,
+            repeat=True,
+        )
+        aioresponse.put(
+            re.compile(
+                r"https://example\.org/_matrix/client/r0/sendToDevice/m\.room.encrypted/.*"
+            ),
+            callback=to_device_cb,
+            repeat=True,
+        )
+
+        response = await async_client.share_group_session(TEST_ROOM_ID)
+
+        assert isinstance(response, ShareGroupSessionResponse)
+        assert {device for user, device in response.users_shared_with} == set(accounts)
+
+        # The claims are batched and the device that had a session got the
+        # room key before the claims returned.
+        assert events[:3] == [("claim", 2), ("claim", 2), ("send", [device_id])]
+        assert sorted(len(e[1]) for e in events if e[0] == "send") == [1, 2, 2]
+        assert max_in_flight == 1
+
+        session = async_client.olm.outbound_group_sessions[TEST_ROOM_ID]
+        assert session.shared
+        assert {(ALICE_ID, device) for device in accounts} <= session.users_shared_with
+        assert not async_client.get_missing_sessions(TEST_ROOM_ID)
+
+    async def test_session_sharing_unverified_unclaimed(
+        self, async_client, aioresponse
+    ):
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+        await async_client.receive_response(self.encryption_sync_response)
+
+        async_client.config = AsyncClientConfig(key_claim_batch_size=1)
+
+        accounts = {}
+
+        for _ in range(3):
+            account = Account()
+            account.generate_one_time_keys(1)
+            device = OlmDevice(ALICE_ID, faker.device_id(), account.identity_keys)
+            async_client.device_store.add(device)
+            accounts[device.id] = account
+
+        # Only the last device, which is waiting for its one-time key to be
+        # claimed, isn't verified.
+        device_ids = list(accounts)
+
+        for device_id in device_ids[:-1]:
+            async_client.verify_device(async_client.device_store[ALICE_ID][device_id])
+
+        device_id = device_ids[0]
+        one_time = list(accounts[device_id].one_time_keys["curve25519"].values())[0]
+        async_client.olm.create_session(
+            one_time, async_client.device_store[ALICE_ID][device_id].curve25519
+        )
+
+        requests = []
+
+        async def callback(url, data, **kwargs):
+            requests.append(url)
+            return CallbackResult(status=200, payload={})
+
+        aioresponse.post(
+            "https://example.org/_matrix/client/r0/keys/claim?access_token=abc123",
+            callback=callback,
+            repeat=True,
+        )
+        aioresponse.put(
+            re.compile(
+                r"https://example\.org/_matrix/client/r0/sendToDevice/m\.room.encrypted/.*"
+            ),
+            callback=callback,
+            repeat=True,
+        )
+
+        with pytest.raises(OlmUnverifiedDeviceError):
+            await async_client.share_group_session(TEST_ROOM_ID)
+
+        # Nothing was sent before the unverified device was found.
+        assert not requests
+        assert TEST_ROOM_ID not in async_client.sharing_session
+
     async def test_session_sharing_2(self, alice_client, async_client, aioresponse):
         await async_client.receive_response(
             LoginResponse.from_dict(self.login_response)
@@ -2091,7 +2886,7 @@ class TestClass:
         self._verify_monitor_state_for_finished_transfer(monitor, left_size)
 
     async def test_encrypted_data_generator(self, async_client):
-        original_data = b"x" * 4096 * 4
+        original_data = b"x" * DEFAULT_CHUNK_SIZE * 4
         data_size = len(original_data)
         monitor = TransferMonitor(data_size)
         decryption_dict = {}
@@ -2263,6 +3058,78 @@ class TestClass:
         resp = await async_client.download(mxc=mxc)
         assert isinstance(resp, DownloadError)
 
+    async def test_download_decrypted(self, async_client, aioresponse, tempdir):
+        mxc = "mxc://example.org/ascERGshawAWawugaAcauga"
+        url = "https://example.org/_matrix/media/r0/download/example.org/ascERGshawAWawugaAcauga?allow_remote=true"
+
+        plaintext = os.urandom(200 * 1024)
+        ciphertext, keys = encrypt_attachment(plaintext)
+        key = keys["key"]["k"]
+        sha256 = keys["hashes"]["sha256"]
+        iv = keys["iv"]
+
+        class CountingExecutor(ThreadPoolExecutor):
+            jobs = 0
+
+            def submit(self, *args, **kwargs):
+                self.jobs += 1
+                return super().submit(*args, **kwargs)
+
+        executor = CountingExecutor(1)
+        async_client.config = AsyncClientConfig(
+            io_chunk_size=64 * 1024, decryption_executor=executor
+        )
+        save_to = Path(tempdir) / "file"
+
+        aioresponse.get(
+            url, status=200, content_type="application/octet-stream", body=ciphertext
+        )
+        resp = await async_client.download_decrypted(mxc, key, sha256, iv, save_to)
+        assert isinstance(resp, DiskDownloadResponse)
+        assert resp.body == save_to
+        assert save_to.read_bytes() == plaintext
+        assert executor.jobs
+        executor.shutdown()
+
+        # The file follows the umask like the ones download() saves, an
+        # existing file keeps its permissions.
+        umask = os.umask(0)
+        os.umask(umask)
+        assert stat.S_IMODE(save_to.stat().st_mode) == 0o666 & ~umask
+
+        save_to.chmod(0o640)
+        aioresponse.get(
+            url, status=200, content_type="application/octet-stream", body=ciphertext
+        )
+        async_client.config = AsyncClientConfig(io_chunk_size=16 * 1024)
+        resp = await async_client.download_decrypted(mxc, key, sha256, iv, save_to)
+        assert isinstance(resp, DiskDownloadResponse)
+        assert stat.S_IMODE(save_to.stat().st_mode) == 0o640
+
+        # A corrupted file is discarded and doesn't replace the existing one.
+        aioresponse.get(
+            url,
+            status=200,
+            content_type="application/octet-stream",
+            body=b"x" + ciphertext[1:],
+        )
+        resp = await async_client.download_decrypted(mxc, key, sha256, iv, save_to)
+        assert isinstance(resp, DownloadError)
+        assert resp.message == "Mismatched SHA-256 digest."
+        assert save_to.read_bytes() == plaintext
+        assert os.listdir(tempdir) == ["file"]
+
+        aioresponse.get(
+            url,
+            status=200,
+            content_type="application/octet-stream",
+            body=ciphertext,
+            headers={"content-disposition": 'inline; filename="example.png"'},
+        )
+        resp = await async_client.download_decrypted(mxc, key, sha256, iv, tempdir)
+        assert resp.body == Path(tempdir) / "example.png"
+        assert resp.body.read_bytes() == plaintext
+
     async def test_thumbnail(self, async_client, aioresponse):
         server_name = "example.org"
         media_id = "ascERGshawAWawugaAcauga"
@@ -2363,6 +3230,47 @@ class TestClass:
         assert room.fully_read_marker == "event_id_2"
         assert room.tags == {"u.test": {"order": 1}}
 
+    async def test_threaded_store(self, async_client):
+        with pytest.raises(ValueError, match="store_write_behind"):
+            AsyncClientConfig(threaded_store=True)
+
+        async_client.config = AsyncClientConfig(
+            store_sync_tokens=True,
+            store_room_state=True,
+            store_write_behind=True,
+            threaded_store=True,
+        )
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response)
+        )
+
+        assert async_client.async_store
+        assert async_client.store is async_client.async_store.blocking
+
+        await async_client.receive_response(SyncResponse.from_dict(self.sync_response))
+
+        async_store = async_client.async_store
+        assert await async_store.load_sync_token() == async_client.next_batch
+        assert "!SVkFJHzfwvuaIEawgC:localhost" in await async_store.load_rooms()
+
+        # Closing the client stops the database thread.
+        await async_client.close()
+        assert not async_client.async_store
+        async_store._thread.join(5)
+        assert not async_store._thread.is_alive()
+
+        async_client.config = AsyncClientConfig(threaded_store=False)
+        client = AsyncClient(
+            async_client.homeserver,
+            async_client.user,
+            async_client.device_id,
+            async_client.store_path,
+            async_client.config,
+        )
+        client.restore_login(async_client.user_id, async_client.device_id, "abc123")
+        assert not client.async_store
+        assert client.store.load_sync_token() == async_client.next_batch
+
     async def test_get_profile(
         self, async_client: AsyncClient, aioresponse: aioresponses
     ):
@@ -4096,10 +5004,12 @@ class TestClass:
             return CallbackResult(status=200, payload={})
 
         aioresponse.get(
-            f"https://example.org/_matrix/client/r0/rooms/{TEST_ROOM_ID}/"
-            f"joined_members?access_token=bob_1234",
+            re.compile(
+                rf"https://example\.org/_matrix/client/r0/rooms/{TEST_ROOM_ID}/"
+                rf"members\?access_token=bob_1234.*"
+            ),
             status=200,
-            payload=self.joined_members_response,
+            payload=self.room_members_response,
         )
 
         aioresponse.post(
@@ -4229,6 +5139,63 @@ class TestClass:
         assert isinstance(resp, UploadFilterResponse)
         assert resp.filter_id == "abc123"
 
+    async def test_upload_sync_filters(self, async_client, aioresponse):
+        async_client.config = AsyncClientConfig(upload_sync_filters=True)
+        await async_client.receive_response(
+            LoginResponse.from_dict(self.login_response),
+        )
+
+        uploads = []
+        sync_filters = []
+
+        def filter_cb(url, data, **kwargs):
+            uploads.append(json.loads(data))
+            return CallbackResult(
+                status=200, payload={"filter_id": f"filter{len(uploads)}"}
+            )
+
+        def sync_cb(url, **kwargs):
+            sync_filters.append(url.query["filter"])
+
+            # The server forgot the first filter.
+            if url.query["filter"] == "filter1":
+                return CallbackResult(
+                    status=404, payload={"errcode": "M_NOT_FOUND", "error": ""}
+                )
+
+            return CallbackResult(status=200, payload=self.empty_sync)
+
+        aioresponse.post(
+            re.compile(r"https://example\.org/_matrix/client/r0/user/.*/filter\?.*"),
+            callback=filter_cb,
+            repeat=True,
+        )
+        aioresponse.get(
+            re.compile(r"https://example\.org/_matrix/client/r0/sync\?.*"),
+            callback=sync_cb,
+            repeat=True,
+        )
+
+        sync_filter = {"room": {"timeline": {"limit": 5}}}
+
+        assert isinstance(
+            await async_client.sync(sync_filter=sync_filter), SyncResponse
+        )
+        uploaded = {"event_format": "client", **sync_filter}
+        assert uploads == [uploaded, uploaded]
+        assert sync_filters == ["filter1", "filter2"]
+
+        # The id is reused and it's remembered in the store.
+        await async_client.sync(sync_filter={"room": {"timeline": {"limit": 5}}})
+        assert len(uploads) == 2
+        assert sync_filters[-1] == "filter2"
+        assert list(async_client.store.load_filter_ids().values()) == ["filter2"]
+
+        # Filter ids are sent unchanged.
+        await async_client.sync(sync_filter="custom")
+        assert sync_filters[-1] == "custom"
+        assert len(uploads) == 2
+
     async def test_global_account_data_cb(self, async_client, aioresponse):
         await async_client.receive_response(
             LoginResponse.from_dict(self.login_response),
@@ -1,5 +1,6 @@
 import json
 import random
+import sys
 from uuid import uuid4
 
 import pytest
@@ -12,6 +13,7 @@ from nio import (
     DeviceOneTimeKeyCount,
     DownloadResponse,
     EncryptionError,
+    Event,
     FullyReadEvent,
     HttpClient,
     InviteInfo,
@@ -51,6 +53,7 @@ from nio import (
     TransportType,
     TypingNoticeEvent,
 )
+from nio.client.base_client import ClientCallback
 from nio.event_builders import ToDeviceMessage
 
 HOST = "example.org"
@@ -1077,6 +1080,69 @@ class TestClass:
         with pytest.raises(CallbackException):
             client.receive_response(self.sync_response)
 
+    def test_event_callback_routing(self, client):
+        client.receive_response(self.login_response)
+
+        received = []
+
+        def recorder(name):
+            def cb(room, event):
+                received.append((name, event.event_id))
+
+            return cb
+
+        client.add_event_callback(recorder("all"), Event)
+        client.add_event_callback(recorder("member"), RoomMemberEvent)
+        client.add_event_callback(recorder("alice"), Event, sender=ALICE_ID)
+        client.add_event_callback(recorder("bob"), Event, sender=[BOB_ID])
+        client.add_event_callback(recorder("room"), Event, room_id=TEST_ROOM_ID)
+        client.add_event_callback(recorder("other"), Event, room_id="!other:x.org")
+        client.add_event_callback(recorder("removed"), Event)
+        client.event_callbacks.pop()
+
+        event = RoomMemberEvent(
+            {"event_id": "$1", "sender": ALICE_ID, "origin_server_ts": 0},
+            ALICE_ID,
+            "join",
+            None,
+            {"membership": "join"},
+        )
+        routed = client.event_callbacks.route(event, TEST_ROOM_ID)
+        assert routed is not client.event_callbacks.route(event, "!other:x.org")
+        assert len(routed) == 4
+
+        # The cache doesn't grow with the number of rooms.
+        assert list(client.event_callbacks._routes) == [RoomMemberEvent]
+
+        client.receive_response(self.sync_response)
+
+        assert received == [
+            ("all", "event_id_1"),
+            ("member", "event_id_1"),
+            ("alice", "event_id_1"),
+            ("room", "event_id_1"),
+            ("all", "event_id_2"),
+            ("member", "event_id_2"),
+            ("alice", "event_id_2"),
+            ("room", "event_id_2"),
+            ("all", "event_id_3"),
+            ("alice", "event_id_3"),
+            ("room", "event_id_3"),
+        ]
+
+    def test_plain_callback_list(self, client):
+        client.receive_response(self.login_response)
+
+        received = []
+
+        def cb(room, event):
+            received.append(event.event_id)
+
+        client.event_callbacks = [ClientCallback(cb, RoomMemberEvent)]
+        client.receive_response(self.sync_response)
+
+        assert received == ["event_id_1", "event_id_2"]
+
     def test_to_device_cb(self, client):
         client.receive_response(self.login_response)
 
@@ -1257,6 +1323,56 @@ class TestClass:
 
         assert alice_device
 
+    def test_room_devices_cache(self, client):
+        client.receive_response(self.login_response)
+        client.receive_response(self.sync_response)
+        client.receive_response(self.keys_query_response)
+
+        room_devices = client.room_devices(TEST_ROOM_ID)
+        assert room_devices.keys() == {ALICE_ID, CAROL_ID}
+        assert client.room_devices(TEST_ROOM_ID) is room_devices
+        assert client.room_contains_unverified(TEST_ROOM_ID)
+
+        for device in list(room_devices[ALICE_ID].values()):
+            client.verify_device(device)
+
+        assert not client.room_contains_unverified(TEST_ROOM_ID)
+
+        device = next(iter(room_devices[ALICE_ID].values()))
+        client.unverify_device(device)
+        assert client.room_contains_unverified(TEST_ROOM_ID)
+        client.blacklist_device(device)
+        assert not client.room_contains_unverified(TEST_ROOM_ID)
+
+        client.device_store.mark_deleted(device)
+        assert device.id not in client.room_devices(TEST_ROOM_ID)[ALICE_ID]
+
+        leave_event = RoomMemberEvent(
+            {
+                "event_id": "event_id_4",
+                "sender": CAROL_ID,
+                "origin_server_ts": 1516809890615,
+            },
+            CAROL_ID,
+            "leave",
+            "invite",
+            {"membership": "leave"},
+        )
+        timeline = Timeline([leave_event], False, "prev_batch_token")
+        response = SyncResponse(
+            "token456",
+            Rooms({}, {TEST_ROOM_ID: RoomInfo(timeline, [], [], [])}, {}),
+            DeviceOneTimeKeyCount(None, None),
+            DeviceList([], []),
+            [],
+            [],
+        )
+        client.receive_response(response)
+        assert client.room_devices(TEST_ROOM_ID).keys() == {ALICE_ID}
+
+        client.receive_response(RoomForgetResponse(TEST_ROOM_ID))
+        assert TEST_ROOM_ID not in client.olm._room_devices
+
     def test_soft_logout(self, client):
         client.receive_response(self.login_response)
 
@@ -1292,6 +1408,96 @@ class TestClass:
         client.receive_response(self.login_response)
         assert client.loaded_sync_token
 
+    def test_room_state_restoring(self, client):
+        user = client.user_id
+        device_id = client.device_id
+        path = client.store_path
+        del client
+
+        config = ClientConfig(store_sync_tokens=True, store_room_state=True)
+        client = Client(user, device_id, path, config=config)
+
+        client.receive_response(self.login_response)
+        client.receive_response(self.sync_response)
+        room = client.rooms[TEST_ROOM_ID]
+
+        restored_client = Client(user, device_id, path, config=config)
+        restored_client.receive_response(self.login_response)
+        assert restored_client.loaded_sync_token == "token123"
+        restored_room = restored_client.rooms[TEST_ROOM_ID]
+
+        assert restored_room.encrypted
+        assert restored_room.users.keys() == room.users.keys()
+        assert restored_room.invited_users.keys() == {CAROL_ID}
+        assert dict(restored_room.names) == dict(room.names)
+        assert restored_room.read_receipts == room.read_receipts
+        assert restored_room.fully_read_marker == "event_id_2"
+        assert restored_room.tags == {"u.test": {"order": 1}}
+        assert restored_room.summary == room.summary
+        assert restored_room.power_levels == room.power_levels
+        assert restored_room.display_name == room.display_name
+
+        leave_event = RoomMemberEvent(
+            {
+                "event_id": "event_id_4",
+                "sender": CAROL_ID,
+                "origin_server_ts": 1516809890615,
+            },
+            CAROL_ID,
+            "leave",
+            "invite",
+            {"membership": "leave"},
+        )
+        timeline = Timeline([leave_event], False, "prev_batch_token")
+        room_info = RoomInfo(timeline, [], [], [])
+        response = SyncResponse(
+            "token456",
+            Rooms({}, {TEST_ROOM_ID: room_info}, {}),
+            DeviceOneTimeKeyCount(None, None),
+            DeviceList([], []),
+            [],
+            [],
+        )
+        restored_client.receive_response(response)
+
+        client = Client(user, device_id, path, config=config)
+        client.receive_response(self.login_response)
+        assert client.loaded_sync_token == "token456"
+        assert client.rooms[TEST_ROOM_ID].users.keys() == {ALICE_ID}
+
+        client.receive_response(RoomForgetResponse(TEST_ROOM_ID))
+
+        client = Client(user, device_id, path, config=config)
+        client.receive_response(self.login_response)
+        assert TEST_ROOM_ID not in client.rooms
+
+    def test_sync_token_saved_last(self, client):
+        user = client.user_id
+        device_id = client.device_id
+        path = client.store_path
+        del client
+
+        config = ClientConfig(store_sync_tokens=True, store_room_state=True)
+        client = Client(user, device_id, path, config=config)
+        client.receive_response(self.login_response)
+
+        class CallbackException(Exception):
+            pass
+
+        def cb(room, event):
+            raise CallbackException
+
+        client.add_event_callback(cb, Event)
+
+        # A sync that fails halfway doesn't advance the stored token, so it
+        # is fetched again after a restart.
+        with pytest.raises(CallbackException):
+            client.receive_response(self.sync_response)
+
+        client = Client(user, device_id, path, config=config)
+        client.receive_response(self.login_response)
+        assert not client.loaded_sync_token
+
     def test_presence_callback(self, client):
         client.receive_response(self.login_response)
 
@@ -1308,3 +1514,139 @@ class TestClass:
 
         with pytest.raises(CallbackException):
             client.receive_response(self.sync_response)
+
+    def test_drop_event_source(self, tempdir):
+        config = ClientConfig(
+            encryption_enabled=False, drop_event_source=(RoomMemberEvent,)
+        )
+        client = Client("ephemeral", "DEVICEID", tempdir, config)
+        client.receive_response(self.login_response)
+
+        seen = []
+        client.add_event_callback(lambda room, event: seen.append(event), Event)
+
+        response = self.sync_response
+        client.receive_response(response)
+
+        assert seen == response.rooms.join[TEST_ROOM_ID].timeline.events
+        assert client.rooms[TEST_ROOM_ID].users.keys() == {ALICE_ID, CAROL_ID}
+
+        for event in seen:
+            if isinstance(event, RoomMemberEvent):
+                assert event.source == {}
+            else:
+                assert event.source
+
+    @staticmethod
+    def _member_list_sync(room_count, member_count, user_count):
+        # Every room shares members with the others, like the rooms of a big
+        # server. The response goes through JSON so that every event has its
+        # own strings, as if it came from the network.
+        rooms = {}
+
+        for room in range(room_count):
+            events = []
+
+            for member in range(member_count):
+                user_id = f"@user{(room * 97 + member) % user_count}:{HOST}"
+                events.append(
+                    {
+                        "type": "m.room.member",
+                        "event_id": f"$member{room}.{member}",
+                        "sender": user_id,
+                        "state_key": user_id,
+                        "origin_server_ts": 1516362244026,
+                        "content": {
+                            "membership": "join",
+                            "displayname": user_id[1:].split(":")[0].title(),
+                        },
+                    }
+                )
+
+            rooms[f"!room{room}:{HOST}"] = {
+                "state": {"events": events},
+                "timeline": {"events": []},
+            }
+
+        body = json.dumps({"next_batch": "token", "rooms": {"join": rooms}})
+        return SyncResponse.from_dict(json.loads(body))
+
+    @staticmethod
+    def _deep_size(obj, seen):
+        if id(obj) in seen:
+            return 0
+
+        seen.add(id(obj))
+
+        if isinstance(obj, dict):
+            children = [*obj.keys(), *obj.values()]
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            children = list(obj)
+        elif isinstance(obj, (str, bytes, int, float, type(None))):
+            children = []
+        else:
+            children = [
+                getattr(obj, name)
+                for cls in type(obj).__mro__
+                for name in cls.__dict__.get("__slots__", ())
+                if hasattr(obj, name)
+            ]
+
+            if hasattr(obj, "__dict__"):
+                children.append(obj.__dict__)
+
+        return sys.getsizeof(obj) + sum(
+            TestClass._deep_size(child, seen) for child in children
+        )
+
+    def _member_list_memory(self, tempdir, config, *sync_args):
+        client = Client("ephemeral", "DEVICEID", tempdir, config)
+        client.receive_response(self.login_response)
+        client.receive_response(self._member_list_sync(*sync_args))
+
+        assert sum(len(room.users) for room in client.rooms.values()) == (
+            sync_args[0] * sync_args[1]
+        )
+
+        return self._deep_size(client.rooms, set())
+
+    def test_member_list_memory(self, tempdir):
+        sizes = {
+            intern: self._member_list_memory(
+                tempdir,
+                ClientConfig(encryption_enabled=False, intern_member_strings=intern),
+                20,
+                200,
+                400,
+            )
+            for intern in (False, True)
+        }
+
+        assert sizes[True] < sizes[False]
+
+    @pytest.mark.parametrize("intern_member_strings", [False, True])
+    def test_member_list_memory_benchmark(
+        self, benchmark, tempdir, intern_member_strings
+    ):
+        room_count, member_count, user_count = 10, 1000, 2000
+        config = ClientConfig(
+            encryption_enabled=False, intern_member_strings=intern_member_strings
+        )
+
+        def setup():
+            client = Client("ephemeral", "DEVICEID", tempdir, config)
+            client.receive_response(self.login_response)
+            response = self._member_list_sync(room_count, member_count, user_count)
+            return (client, response), {}
+
+        benchmark.pedantic(
+            lambda client, response: client.receive_response(response),
+            setup=setup,
+            rounds=3,
+        )
+
+        size = self._member_list_memory(
+            tempdir, config, room_count, member_count, user_count
+        )
+        benchmark.extra_info["MiB"] = size / 2**20
+        benchmark.extra_info["bytes/member"] = size / (room_count * member_count)
@@ -1,12 +1,14 @@
 import copy
 import json
 import os
+import shutil
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import pytest
 from helpers import faker
-from olm import Account, OutboundGroupSession
+from olm import Account, InboundSession, OlmPreKeyMessage, OutboundGroupSession
 
 from nio.crypto import (
     DeviceStore,
@@ -137,8 +139,17 @@ class TestClass:
     def _load(self, user_id, device_id, pickle_key=""):
         return Olm(user_id, device_id, self._get_store(user_id, device_id, pickle_key))
 
-    def test_account_loading(self):
-        olm = self._load("example", "DEVICEID", PICKLE_KEY)
+    @staticmethod
+    def _load_example(tempdir):
+        # Opening the store migrates it, work on a copy to keep the fixture.
+        for name in ("example_DEVICEID.db", "example_DEVICEID.known_devices"):
+            shutil.copy(os.path.join(ephemeral_dir, name), tempdir)
+
+        store = DefaultStore("example", "DEVICEID", tempdir, PICKLE_KEY)
+        return Olm("example", "DEVICEID", store)
+
+    def test_account_loading(self, tempdir):
+        olm = self._load_example(tempdir)
         assert isinstance(olm.account, Account)
         assert (
             olm.account.identity_keys["curve25519"]
@@ -253,8 +264,8 @@ class TestClass:
             olm.session_store.get(bob.identity_keys["curve25519"]), OutboundSession
         )
 
-    def test_olm_session_load(self):
-        olm = self._load("example", "DEVICEID", PICKLE_KEY)
+    def test_olm_session_load(self, tempdir):
+        olm = self._load_example(tempdir)
 
         bob_session = olm.session_store.get(
             "+Qs131S/odNdWG6VJ8hiy9YZW0us24wnsDjYQbaxLk4"
@@ -1023,6 +1034,143 @@ class TestClass:
 
         assert decrypted_event.body == message["content"]["body"]
 
+        # The message indices are kept in the store and survive a restart.
+        bob.save_message_indices()
+        bob = Olm(bob.user_id, bob.device_id, bob.store)
+
+        encrypted_message["event_id"] = "!new_event_id"
+        event = MegolmEvent.from_dict(encrypted_message)
+
+        with pytest.raises(EncryptionError):
+            bob.decrypt_megolm_event(event)
+
+    @pytest.mark.asyncio()
+    async def test_group_session_chunks(self, olm_account):
+        alice = olm_account
+        recipients = {}
+
+        for _ in range(45):
+            account = Account()
+            account.generate_one_time_keys(1)
+            one_time = list(account.one_time_keys["curve25519"].values())[0]
+
+            device = OlmDevice(faker.mx_id(), faker.device_id(), account.identity_keys)
+            alice.device_store.add(device)
+            alice.create_session(one_time, device.curve25519)
+            recipients[device.user_id] = (account, device)
+
+        # A device of another user that claims the keys of a recipient shares
+        # its Olm session.
+        _, claimed = next(iter(recipients.values()))
+        impostor = OlmDevice(faker.mx_id(), faker.device_id(), dict(claimed.keys))
+        alice.device_store.add(impostor)
+
+        users = list(recipients) + [impostor.user_id]
+
+        with ThreadPoolExecutor(2) as executor:
+            chunks = [
+                chunk
+                async for chunk in alice.share_group_session_chunks(
+                    TEST_ROOM,
+                    users,
+                    ignore_unverified_devices=True,
+                    executor=executor,
+                    max_workers=2,
+                )
+            ]
+
+        assert len(chunks) == 3
+        shared = [pair for sharing_with, _ in chunks for pair in sharing_with]
+        assert len(shared) == len(set(shared)) == 46
+
+        session_id = alice.outbound_group_sessions[TEST_ROOM].id
+
+        for sharing_with, to_device in chunks:
+            for user_id, device_id in sharing_with:
+                if user_id == impostor.user_id:
+                    continue
+
+                account, device = recipients[user_id]
+                content = to_device["messages"][user_id][device_id]
+                ciphertext = content["ciphertext"][device.curve25519]
+                message = OlmPreKeyMessage(ciphertext["body"])
+
+                session = InboundSession(account, message)
+                payload = json.loads(session.decrypt(message))
+
+                assert payload["recipient"] == user_id
+                assert payload["content"]["session_id"] == session_id
+
+    @pytest.mark.asyncio()
+    async def test_batched_group_decryption(self, olm_account, bob_account):
+        alice = olm_account
+        bob = bob_account
+
+        alice_device = OlmDevice(
+            alice.user_id, alice.device_id, alice.account.identity_keys
+        )
+        bob_device = OlmDevice(bob.user_id, bob.device_id, bob.account.identity_keys)
+
+        alice.device_store.add(bob_device)
+        bob.device_store.add(alice_device)
+
+        bob.account.generate_one_time_keys(1)
+        one_time = list(bob.account.one_time_keys["curve25519"].values())[0]
+        bob.account.mark_keys_as_published()
+
+        alice.create_session(one_time, bob_device.curve25519)
+
+        _, to_device = alice.share_group_session(
+            TEST_ROOM, [bob.user_id], ignore_unverified_devices=True
+        )
+        alice.outbound_group_sessions[TEST_ROOM].shared = True
+
+        olm_message = self.olm_message_to_event(to_device, bob, alice)
+        event = ToDeviceEvent.parse_event(olm_message)
+        assert isinstance(bob.decrypt_event(event), RoomKeyEvent)
+
+        def megolm_event(event_id, body, room_id=TEST_ROOM):
+            message = {
+                "type": "m.room.message",
+                "content": {"msgtype": "m.text", "body": body},
+            }
+            return {
+                "event_id": event_id,
+                "type": "m.room.encrypted",
+                "sender": alice.user_id,
+                "origin_server_ts": 0,
+                "content": alice.group_encrypt(room_id, message),
+                "room_id": room_id,
+            }
+
+        event_dicts = [megolm_event(f"!event_{i}", f"message {i}") for i in range(5)]
+
+        # A replayed event that reuses the ciphertext of the first event.
+        replayed = copy.deepcopy(event_dicts[0])
+        replayed["event_id"] = "!replayed"
+        event_dicts.append(replayed)
+
+        # An event with an unknown session.
+        alice.create_outbound_group_session("!other_room:example.org")
+        alice.outbound_group_sessions["!other_room:example.org"].shared = True
+        event_dicts.append(
+            megolm_event("!unknown", "unknown", room_id="!other_room:example.org")
+        )
+
+        events = [MegolmEvent.from_dict(event_dict) for event_dict in event_dicts]
+        decrypted = await bob.decrypt_megolm_events(events)
+
+        assert [event.body for event in decrypted[:5]] == [
+            f"message {i}" for i in range(5)
+        ]
+        assert all(event.decrypted for event in decrypted[:5])
+        assert decrypted[5:] == [None, None]
+
+        # Decrypting the same events again is fine, the replay protection
+        # only rejects conflicting events.
+        decrypted = await bob.decrypt_megolm_events(events[:5], TEST_ROOM)
+        assert all(isinstance(event, RoomMessageText) for event in decrypted)
+
     def test_key_forwards_with_ourselves(self, alice_account_pair):
         alice, bob = alice_account_pair
 
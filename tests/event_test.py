@@ -1,4 +1,10 @@
 import json
+import pickle
+import weakref
+from copy import deepcopy
+from dataclasses import dataclass, field
+
+import pytest
 
 from nio.api import PushRuleKind
 from nio.events import (
@@ -51,9 +57,11 @@ from nio.events import (
     RoomKeyRequest,
     RoomKeyRequestCancellation,
     RoomMemberEvent,
+    RoomMessage,
     RoomMessageEmote,
     RoomMessageNotice,
     RoomMessageText,
+    RoomMessageUnknown,
     RoomNameEvent,
     RoomTopicEvent,
     StickerEvent,
@@ -652,6 +660,216 @@ class TestClass:
         )
         assert ruleset.matching_rule(*args) is ruleset.room[1]
 
+        assert ruleset.compile().matching_rule(*args) is ruleset.room[1]
+
         del ruleset.room[1]
         del ruleset.sender[0]
         assert ruleset.matching_rule(*args) is None
+        assert ruleset.compile().matching_rule(*args) is None
+
+    @staticmethod
+    def _push_rule_samples():
+        ruleset = PushRulesEvent.from_dict(
+            TestClass._load_response("tests/data/events/push_rules_default.json")
+        ).global_rules
+
+        ruleset.room = [
+            PushRule(PushRuleKind.room, "!muted:example.org", False, enabled=False),
+            PushRule(PushRuleKind.room, "!quiet:example.org", False),
+        ]
+        ruleset.sender = [PushRule(PushRuleKind.sender, "@Bob:example.org", False)]
+
+        rooms = []
+
+        for room_id, joined in [
+            ("!muted:example.org", 10),
+            ("!quiet:example.org", 10),
+            ("!direct:example.org", 2),
+            ("!big:example.org", 500),
+        ]:
+            room = MatrixRoom(room_id, "@alice:example.org")
+            room.summary = RoomSummary(joined, 0)
+            room.power_levels.users["@carol:example.org"] = 50
+            rooms.append(room)
+
+        events = []
+        bodies = ["hello", "alice!", "Hey ALICE, look", "@room alert", "malice"]
+
+        for event_file in [
+            "message_text.json",
+            "message_notice.json",
+            "member.json",
+            "megolm.json",
+            "call_invite.json",
+            "topic.json",
+            "unknown.json",
+        ]:
+            for sender in ["@bob:example.org", "@carol:example.org"]:
+                for body in bodies:
+                    source = TestClass._load_response(f"tests/data/events/{event_file}")
+                    source["sender"] = sender
+
+                    if source["type"] == "m.room.message":
+                        source["content"]["body"] = body
+
+                    events.append(Event.parse_event(source))
+
+        return ruleset, rooms, events
+
+    def test_compiled_pushrules_matching(self):
+        ruleset, rooms, events = self._push_rule_samples()
+        evaluator = ruleset.compile()
+
+        for room in rooms:
+            for name in ["Alice", "Bob", ""]:
+                for event in events:
+                    args = (event, room, name)
+                    assert evaluator.matching_rule(*args) is ruleset.matching_rule(
+                        *args
+                    )
+
+        # Room and sender rules with glob characters still match.
+        ruleset.room.append(PushRule(PushRuleKind.room, "!big:*", False))
+        ruleset.sender.insert(0, PushRule(PushRuleKind.sender, "@carol:*", False))
+        evaluator = ruleset.compile()
+
+        for room in rooms:
+            for event in events:
+                args = (event, room, "Alice")
+                assert evaluator.matching_rule(*args) is ruleset.matching_rule(*args)
+
+    @pytest.mark.parametrize("compiled", [False, True], ids=["ruleset", "compiled"])
+    def test_pushrules_matching_benchmark(self, benchmark, compiled):
+        ruleset, rooms, events = self._push_rule_samples()
+        matcher = ruleset.compile() if compiled else ruleset
+
+        def match_all():
+            return [
+                matcher.matching_rule(event, room, "Alice")
+                for room in rooms
+                for event in events
+            ]
+
+        matched = benchmark(match_all)
+        assert matched == [
+            ruleset.matching_rule(event, room, "Alice")
+            for room in rooms
+            for event in events
+        ]
+
+    def test_custom_event_registration(self):
+        @dataclass
+        class PollStartEvent(Event):
+            question: str = field()
+
+            @classmethod
+            def from_dict(cls, parsed_dict):
+                return cls(parsed_dict, parsed_dict["content"]["question"])
+
+        parsed_dict = TestClass._load_response("tests/data/events/unknown.json")
+        parsed_dict["type"] = "org.example.poll.start"
+        parsed_dict["content"] = {"question": "Tea or coffee?"}
+
+        assert isinstance(Event.parse_event(parsed_dict), UnknownEvent)
+
+        Event.register_event_type("org.example.poll.start", PollStartEvent)
+        try:
+            event = Event.parse_event(parsed_dict)
+            assert isinstance(event, PollStartEvent)
+            assert event.question == "Tea or coffee?"
+        finally:
+            Event._event_types.unregister("org.example.poll.start")
+
+        assert isinstance(Event.parse_event(parsed_dict), UnknownEvent)
+
+    def test_custom_msgtype_registration(self):
+        parsed_dict = TestClass._load_response("tests/data/events/message_text.json")
+        parsed_dict["content"]["msgtype"] = "org.example.location"
+
+        assert isinstance(Event.parse_event(parsed_dict), RoomMessageUnknown)
+
+        RoomMessage.register_msgtype("org.example.location", RoomMessageText)
+        try:
+            assert isinstance(Event.parse_event(parsed_dict), RoomMessageText)
+            assert isinstance(Event.parse_decrypted_event(parsed_dict), RoomMessageText)
+        finally:
+            RoomMessage._msgtypes.unregister("org.example.location")
+
+    def test_custom_to_device_registration(self):
+        @dataclass
+        class PingEvent(ToDeviceEvent):
+            @classmethod
+            def from_dict(cls, parsed_dict):
+                return cls(parsed_dict, parsed_dict["sender"])
+
+        parsed_dict = TestClass._load_response(
+            "tests/data/events/unknown_to_device.json"
+        )
+        ToDeviceEvent.register_event_type(parsed_dict["type"], PingEvent)
+        try:
+            event = ToDeviceEvent.parse_event(parsed_dict)
+            assert isinstance(event, PingEvent)
+
+            parsed_dict["content"] = {}
+            assert ToDeviceEvent.parse_event(parsed_dict) is None
+        finally:
+            ToDeviceEvent._event_types.unregister(parsed_dict["type"])
+
+    def test_slotted_events(self):
+        parsed_dict = TestClass._load_response("tests/data/events/message_text.json")
+        event = Event.parse_event(parsed_dict)
+
+        assert isinstance(event, RoomMessageText)
+        assert not hasattr(event, "__dict__")
+        assert not event.decrypted
+
+        event.room_id = "!test:example.org"
+
+        with pytest.raises(AttributeError):
+            event.unknown_attribute = True
+
+        assert pickle.loads(pickle.dumps(event)) == event
+        assert deepcopy(event) == event
+        assert weakref.ref(event)() is event
+
+        @dataclass
+        class CustomTextEvent(RoomMessageText):
+            reviewed: bool = field(default=False, init=False)
+
+        custom = CustomTextEvent.from_dict(parsed_dict)
+        assert isinstance(custom, CustomTextEvent)
+        assert custom.body == event.body
+        assert not custom.reviewed
+        assert not custom.decrypted
+
+    def test_parse_event_benchmark(self, benchmark):
+        # A mix resembling a busy sync: mostly messages and membership
+        # changes, with some state, reactions and unknown events.
+        mix = [
+            ("message_text.json", 30),
+            ("member.json", 25),
+            ("megolm.json", 15),
+            ("reaction.json", 8),
+            ("message_notice.json", 5),
+            ("redaction.json", 3),
+            ("power_levels.json", 2),
+            ("name.json", 2),
+            ("topic.json", 2),
+            ("sticker.json", 2),
+            ("call_invite.json", 1),
+            ("unknown.json", 5),
+        ]
+        events = [
+            TestClass._load_response(f"tests/data/events/{event_file}")
+            for event_file, count in mix
+            for _ in range(count)
+        ]
+
+        def parse_all():
+            return [Event.parse_event(deepcopy(event)) for event in events]
+
+        parsed = benchmark(parse_all)
+
+        assert not any(
+            isinstance(event, (BadEvent, UnknownBadEvent)) for event in parsed
+        )
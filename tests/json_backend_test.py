@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from nio import AsyncClientConfig, json_backend
+from nio.api import Api
+from nio.json_backend import (
+    available_json_backends,
+    current_json_backend,
+    use_json_backend,
+)
+
+CONTENT = {
+    "body": "Hello wörld ☃ 😀 </script>",
+    "msgtype": "m.text",
+    "count": 3,
+    "big": 2**70,
+    "nested": {"list": [1, 2.5, None, True, False], "empty": {}},
+}
+
+
+@pytest.fixture(params=available_json_backends())
+def backend(request):
+    previous = current_json_backend()
+    yield use_json_backend(request.param)
+    use_json_backend(previous)
+
+
+class TestClass:
+    def test_default_backend(self):
+        assert current_json_backend() == available_json_backends()[0]
+        assert "json" in available_json_backends()
+
+    def test_round_trip(self, backend):
+        assert current_json_backend() == backend
+
+        encoded = Api.to_json(CONTENT)
+        assert isinstance(encoded, str)
+        assert json.loads(encoded) == CONTENT
+
+        assert json_backend.loads(encoded) == json.loads(encoded)
+        assert json_backend.loads(encoded.encode()) == json.loads(encoded)
+
+    def test_invalid_json(self, backend):
+        with pytest.raises(json.JSONDecodeError):
+            json_backend.loads('{"a": ')
+
+    def test_lone_surrogate(self, backend):
+        # orjson refuses strings that the json module accepts.
+        encoded = '{"body":"\\ud800"}'
+        assert json_backend.loads(encoded) == json.loads(encoded)
+        assert json_backend.loads(encoded.encode()) == json.loads(encoded)
+
+    def test_canonical_json(self, backend):
+        assert Api.to_canonical_json(CONTENT) == json.dumps(
+            CONTENT, ensure_ascii=False, separators=(",", ":"), sort_keys=True
+        )
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError, match="Unknown JSON backend"):
+            use_json_backend("simplejson")
+
+        with pytest.raises(ValueError, match="Unknown JSON backend"):
+            AsyncClientConfig(json_backend="simplejson")
+
+        for name in json_backend.BACKENDS:
+            if name not in available_json_backends():
+                with pytest.raises(ImportWarning):
+                    AsyncClientConfig(json_backend=name)
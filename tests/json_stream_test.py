@@ -0,0 +1,88 @@
+import asyncio
+import json
+from json.decoder import JSONDecodeError
+from pathlib import Path
+
+import pytest
+
+from nio.json_stream import iter_json_items
+
+DATA_DIR = Path(__file__).parent / "data"
+
+
+async def _chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def _collect(data: bytes, size: int, descend=()):
+    return [item async for item in iter_json_items(_chunks(data, size), descend)]
+
+
+def _documents():
+    for path in sorted(DATA_DIR.glob("**/*.json")):
+        with open(path, "rb") as f:
+            data = f.read()
+
+        if isinstance(json.loads(data), dict):
+            yield path.name, data
+
+
+class TestClass:
+    @pytest.mark.parametrize("size", [1, 3, 4096])
+    def test_top_level_items(self, size):
+        for name, data in _documents():
+            items = asyncio.run(_collect(data, size))
+            assert {path[0]: value for path, value in items} == json.loads(data), name
+
+    def test_descend(self):
+        document = {
+            "next_batch": "token",
+            "rooms": {
+                "join": {
+                    "!a:example.org": {"timeline": {"events": [1, 2.5e3, None]}},
+                    "!b:example.org": {"summary": {"m.heroes": ["ü", "☃"]}},
+                },
+                "leave": {},
+            },
+            "presence": {"events": []},
+        }
+        data = json.dumps(document, indent=1, ensure_ascii=False).encode()
+
+        for size in (1, 2, 5, 1024):
+            items = asyncio.run(_collect(data, size, [("rooms",), ("rooms", "join")]))
+
+            assert items == [
+                (("next_batch",), "token"),
+                (
+                    ("rooms", "join", "!a:example.org"),
+                    document["rooms"]["join"]["!a:example.org"],
+                ),
+                (
+                    ("rooms", "join", "!b:example.org"),
+                    document["rooms"]["join"]["!b:example.org"],
+                ),
+                (("rooms", "leave"), {}),
+                (("presence",), {"events": []}),
+            ]
+
+    def test_descend_into_non_objects(self):
+        items = asyncio.run(_collect(b'{"rooms": null, "a": 12}', 1, [("rooms",)]))
+        assert items == [(("rooms",), None), (("a",), 12)]
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            b"",
+            b"[]",
+            b'{"a": 1',
+            b'{"a": 1,}',
+            b'{"a": 1 "b": 2}',
+            b'{"a": 12',
+            b'{"a": 1} 2',
+            b"{a: 1}",
+        ],
+    )
+    def test_invalid_documents(self, data):
+        with pytest.raises(JSONDecodeError):
+            asyncio.run(_collect(data, 1))
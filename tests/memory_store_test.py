@@ -4,6 +4,7 @@ from nio.crypto import (
     DeviceStore,
     GroupSessionStore,
     InboundGroupSession,
+    MessageIndexStore,
     OlmAccount,
     OutboundGroupSession,
     OutboundSession,
@@ -81,6 +82,30 @@ class TestClass:
 
         assert fetched_device == device
 
+    def test_device_key_index(self):
+        store = DeviceStore()
+        device = faker.olm_device()
+        store.add(device)
+
+        assert device in store
+        assert store.device_from_ed25519_key(device.user_id, device.ed25519) is device
+        assert not store.device_from_sender_key(BOB_ID, device.curve25519)
+
+        # Another user claiming the same keys doesn't shadow the device.
+        impostor = faker.olm_device()
+        impostor.keys = dict(device.keys)
+        store.add(impostor)
+        assert store.device_from_sender_key(device.user_id, device.curve25519) is device
+
+        old_key = device.curve25519
+        store.update_keys(device, {"curve25519": BOB_CURVE})
+        assert not store.device_from_sender_key(device.user_id, old_key)
+        assert store.device_from_sender_key(device.user_id, BOB_CURVE) is device
+
+        device.deleted = True
+        assert not store.device_from_sender_key(device.user_id, BOB_CURVE)
+        assert not store.device_from_ed25519_key(device.user_id, device.ed25519)
+
     def test_group_session_store(self):
         store = GroupSessionStore()
         account = OlmAccount()
@@ -104,3 +129,48 @@ class TestClass:
         assert not store.add(session)
 
         assert store[TEST_ROOM] == {BOB_CURVE: {session.id: session}}
+
+    def test_message_index_store(self):
+        saved = {}
+        store = MessageIndexStore(
+            lambda *key: saved.get(key), saved.update, max_indices=3000
+        )
+
+        assert store.check(BOB_CURVE, "session", 0, "$event0", 1)
+        assert store.check(BOB_CURVE, "session", 0, "$event0", 1)
+        assert not store.check(BOB_CURVE, "session", 0, "$replayed", 1)
+        assert not store.check(BOB_CURVE, "session", 0, "$event0", 2)
+
+        # Indices far away from the others don't grow the array.
+        assert store.check(BOB_CURVE, "session", 2000, "$event2000", 1)
+        assert store.check(BOB_CURVE, "session", 3, "$event3", 1)
+        assert len(store) == 5
+
+        # Once the array reaches the far away index it's moved into it.
+        assert store.check(BOB_CURVE, "session", 1000, "$event1000", 1)
+        assert len(store) == 1002
+        assert store.check(BOB_CURVE, "session", 2020, "$event2020", 1)
+        assert len(store) == 2021
+        assert not store.check(BOB_CURVE, "session", 2000, "$replayed", 1)
+
+        changes = store.pop_changes()
+        assert list(changes) == [(BOB_CURVE, "session")]
+        assert not store.pop_changes()
+        saved.update(changes)
+
+        # The least recently used session gets evicted, changes are saved.
+        assert store.check(BOB_CURVE, "other", 0, "$other", 1)
+        assert store.check(BOB_CURVE, "other", 1, "$other1", 1)
+        assert len(store) == 2023
+        assert (BOB_CURVE, "other") not in saved
+
+        for index in range(3000):
+            assert store.check(BOB_CURVE, "third", index, f"$third{index}", 1)
+
+        assert (BOB_CURVE, "other") in saved
+        assert len(store) == 3000
+
+        # Evicted sessions are loaded again when needed.
+        assert not store.check(BOB_CURVE, "other", 1, "$replayed", 1)
+        assert not store.check(BOB_CURVE, "session", 2020, "$replayed", 1)
+        assert store.check(BOB_CURVE, "session", 3, "$event3", 1)
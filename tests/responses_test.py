@@ -31,12 +31,16 @@ from nio.responses import (
     RoomContextResponse,
     RoomCreateResponse,
     RoomForgetResponse,
+    RoomGetMembersError,
+    RoomGetMembersResponse,
     RoomKeyRequestError,
     RoomKeyRequestResponse,
     RoomKnockResponse,
     RoomLeaveResponse,
     RoomMessagesResponse,
     RoomTypingResponse,
+    SlidingSyncError,
+    SlidingSyncResponse,
     SpaceGetHierarchyResponse,
     SyncError,
     SyncResponse,
@@ -124,6 +128,21 @@ class TestClass:
         response = JoinedMembersResponse.from_dict(parsed_dict, "!testroom")
         assert isinstance(response, JoinedMembersError)
 
+    def test_room_members_parse(self):
+        parsed_dict = _load_response("tests/data/room_members_response.json")
+        response = RoomGetMembersResponse.from_dict(parsed_dict, "!testroom")
+        assert isinstance(response, RoomGetMembersResponse)
+        assert [m.state_key for m in response.members] == [
+            "@alice:example.org",
+            "@bob:example.org",
+        ]
+        assert response.members[1].membership == "invite"
+
+    def test_room_members_fail(self):
+        parsed_dict = {}
+        response = RoomGetMembersResponse.from_dict(parsed_dict, "!testroom")
+        assert isinstance(response, RoomGetMembersError)
+
     def test_upload_parse(self):
         parsed_dict = _load_response("tests/data/upload_response.json")
         response = UploadResponse.from_dict(parsed_dict)
@@ -178,6 +197,51 @@ class TestClass:
         response = SyncResponse.from_dict(parsed_dict)
         assert type(response) == SyncResponse
 
+    def test_sliding_sync_parse(self):
+        parsed_dict = _load_response("tests/data/sliding_sync_response.json")
+        response = SlidingSyncResponse.from_dict(parsed_dict, "@example:localhost")
+        assert isinstance(response, SlidingSyncResponse)
+
+        room_id = "!SVkFJHzfwvuaIEawgC:localhost"
+        assert response.pos == "5"
+        assert response.lists == {"all": 1200}
+        assert response.to_device_since == "td-7"
+        assert len(response.to_device_events) == 1
+        assert response.device_key_count.signed_curve25519 == 50
+        assert response.device_list.changed == ["@bob:example.org"]
+        assert len(response.account_data_events) == 1
+
+        assert list(response.rooms.join) == [room_id, "!quiet:localhost"]
+        assert list(response.rooms.invite) == ["!invited:localhost"]
+        assert list(response.rooms.leave) == ["!left:localhost"]
+
+        info = response.rooms.join[room_id]
+        assert len(info.state) == 2
+        assert len(info.timeline.events) == 1
+        assert info.timeline.limited
+        assert info.summary.joined_member_count == 2
+        assert info.summary.heroes == ["@bob:example.org"]
+        assert info.unread_notifications.highlight_count == 1
+        assert len(info.ephemeral) == 1
+        assert len(info.account_data) == 1
+        assert len(response.rooms.join["!quiet:localhost"].ephemeral) == 1
+
+        assert response.room_info[room_id].name == "Test room"
+        assert response.room_info[room_id].initial
+        assert response.room_info[room_id].bump_stamp == 42
+        assert "!quiet:localhost" not in response.room_info
+
+    def test_sliding_sync_fail(self):
+        response = SlidingSyncResponse.from_dict({}, "@example:localhost")
+        assert isinstance(response, SlidingSyncError)
+
+        response = SlidingSyncResponse.from_dict(
+            {"errcode": "M_UNKNOWN_POS", "error": "Unknown position"},
+            "@example:localhost",
+        )
+        assert isinstance(response, SlidingSyncError)
+        assert response.status_code == "M_UNKNOWN_POS"
+
     def test_keyshare_request(self):
         parsed_dict = {
             "errcode": "M_LIMIT_EXCEEDED",
@@ -613,6 +613,39 @@ class TestClass:
         assert room.remove_member(mx_id)
         assert not room.remove_member(mx_id)
 
+    def test_member_string_interning(self):
+        def fresh(string):
+            # Build an equal string object that isn't the interned one.
+            return "".join(list(string))
+
+        rooms = [
+            MatrixRoom(f"!room{i}:example.org", BOB_ID, intern_strings=True)
+            for i in range(2)
+        ]
+
+        for room in rooms:
+            room.add_member(fresh(ALICE_ID), fresh("Alice"), None)
+
+        first, second = (room.users[ALICE_ID] for room in rooms)
+        assert first.user_id is second.user_id
+        assert first.display_name is second.display_name
+        assert not hasattr(first, "__dict__")
+
+        for room in rooms:
+            event = RoomMemberEvent(
+                {"event_id": "event1", "sender": ALICE_ID, "origin_server_ts": 1},
+                ALICE_ID,
+                "join",
+                None,
+                {"membership": "join", "displayname": fresh("Alice Margatroid")},
+            )
+            room.handle_membership(event)
+
+        first, second = (room.users[ALICE_ID] for room in rooms)
+        assert first.display_name == "Alice Margatroid"
+        assert first.display_name is second.display_name
+        assert rooms[0].names["Alice Margatroid"] == [ALICE_ID]
+
     def test_user_membership_changes(self):
         invited_event = RoomMemberEvent(
             {"event_id": "event1", "sender": BOB_ID, "origin_server_ts": 1},
@@ -0,0 +1,130 @@
+import copy
+import json
+from pathlib import Path
+
+import pytest
+from jsonschema.exceptions import SchemaError, ValidationError
+
+from nio.schemas import (
+    Schemas,
+    get_compiled_validator,
+    get_validator,
+    use_compiled_validators,
+    validate_json,
+)
+
+DATA_DIR = Path(__file__).parent / "data"
+
+SCHEMAS = {
+    name: schema
+    for name, schema in vars(Schemas).items()
+    if not name.startswith("_") and isinstance(schema, dict)
+}
+
+
+def _collect_instances():
+    instances = []
+
+    def walk(value):
+        if isinstance(value, dict):
+            instances.append(value)
+            for child in value.values():
+                walk(child)
+        elif isinstance(value, list):
+            for child in value:
+                walk(child)
+
+    for path in sorted(DATA_DIR.glob("**/*.json")):
+        with open(path) as f:
+            walk(json.load(f))
+
+    return instances
+
+
+INSTANCES = _collect_instances()
+
+
+def _mutations(instance):
+    yield instance
+
+    for key in instance:
+        removed = copy.deepcopy(instance)
+        del removed[key]
+        yield removed
+
+        for replacement in (None, 1, True, "string", [], {}, -1.5):
+            replaced = copy.deepcopy(instance)
+            replaced[key] = replacement
+            yield replaced
+
+
+def _jsonschema_result(instance, schema):
+    try:
+        get_validator(schema).validate(instance)
+    except (ValidationError, SchemaError):
+        return False
+    except Exception as e:
+        return type(e)
+
+    return True
+
+
+def _compiled_result(instance, schema):
+    try:
+        if get_compiled_validator(schema)(instance):
+            return True
+        get_validator(schema).validate(instance)
+    except (ValidationError, SchemaError):
+        return False
+    except Exception as e:
+        return type(e)
+
+    return True
+
+
+class TestClass:
+    def test_validator_cache(self):
+        assert get_validator(Schemas.sync) is get_validator(Schemas.sync)
+        assert get_compiled_validator(Schemas.sync) is get_compiled_validator(
+            Schemas.sync
+        )
+
+        schema = copy.deepcopy(Schemas.sync)
+        assert get_validator(schema) is not get_validator(Schemas.sync)
+
+    def test_compiled_validate_json(self):
+        event = {
+            "content": {"body": "hello", "msgtype": "m.text"},
+            "event_id": "$event:example.org",
+            "origin_server_ts": 0,
+            "sender": "@alice:example.org",
+            "type": "m.room.message",
+        }
+
+        use_compiled_validators()
+        try:
+            validate_json(copy.deepcopy(event), Schemas.room_event)
+
+            del event["sender"]
+            with pytest.raises(ValidationError, match="'sender' is a required"):
+                validate_json(event, Schemas.room_event)
+        finally:
+            use_compiled_validators(False)
+
+    @pytest.mark.parametrize("name", sorted(SCHEMAS))
+    def test_compiled_equivalence(self, name):
+        schema = SCHEMAS[name]
+
+        for original in INSTANCES:
+            valid = _jsonschema_result(copy.deepcopy(original), schema) is True
+            candidates = _mutations(original) if valid else [original]
+
+            for candidate in candidates:
+                expected_instance = copy.deepcopy(candidate)
+                compiled_instance = copy.deepcopy(candidate)
+
+                expected = _jsonschema_result(expected_instance, schema)
+                result = _compiled_result(compiled_instance, schema)
+
+                assert result == expected, candidate
+                assert compiled_instance == expected_instance, candidate
@@ -1,3 +1,5 @@
+from threading import Thread
+
 import pytest
 
 from nio import EncryptionError
@@ -80,6 +82,30 @@ class TestClass:
         assert unpickled.use_time >= use_time
         assert decrypted_plaintext == plaintext
 
+    def test_olm_session_lock(self):
+        alice = OlmAccount()
+        bob = OlmAccount()
+
+        bob.generate_one_time_keys(1)
+        bob_onetime = list(bob.one_time_keys["curve25519"].values())[0]
+
+        session = OutboundSession(alice, bob.identity_keys["curve25519"], bob_onetime)
+        unpickled = Session.from_pickle(session.pickle(), session.creation_time)
+        assert unpickled.lock is not session.lock
+
+        # A session that is in use on another thread can't be encrypted with.
+        messages = []
+        thread = Thread(target=lambda: messages.append(session.encrypt("hello")))
+
+        with session.lock:
+            thread.start()
+            thread.join(0.1)
+            assert thread.is_alive()
+            assert not messages
+
+        thread.join()
+        assert InboundSession(bob, messages[0]).decrypt(messages[0]) == "hello"
+
     def test_outbound_group_session(self):
         session = OutboundGroupSession()
         assert not session.expired
@@ -1,6 +1,8 @@
 import copy
 import os
+import threading
 from collections import defaultdict
+from functools import partial
 
 import pytest
 from helpers import ephemeral, ephemeral_dir, faker
@@ -15,7 +17,10 @@ from nio.crypto import (
     TrustState,
 )
 from nio.exceptions import OlmTrustError
+from nio.rooms import MatrixRoom
 from nio.store import (
+    AsyncMatrixStore,
+    DatabaseProfile,
     DefaultStore,
     Ed25519Key,
     Key,
@@ -35,6 +40,13 @@ TEST_ROOM_2 = "!test2:example.org"
 TEST_FORWARDING_CHAIN = [BOB_CURVE, BOB_ONETIME]
 
 
+PROFILES = {
+    "default": DatabaseProfile(),
+    "performance": DatabaseProfile.performance(),
+    "queue": DatabaseProfile.performance(queue=True),
+}
+
+
 @pytest.fixture
 def matrix_store(tempdir):
     return MatrixStore("ephemeral", "DEVICEID", tempdir)
@@ -64,6 +76,21 @@ def sqlmemorystore():
     return store
 
 
+@pytest.fixture(scope="module")
+def group_sessions():
+    account = OlmAccount()
+    return [
+        InboundGroupSession(
+            OutboundGroupSession().session_key,
+            account.identity_keys["ed25519"],
+            account.identity_keys["curve25519"],
+            TEST_ROOM,
+            TEST_FORWARDING_CHAIN,
+        )
+        for _ in range(200)
+    ]
+
+
 class TestClass:
     @property
     def ephemeral_store(self):
@@ -388,6 +415,67 @@ class TestClass:
         assert in_group.id == loaded_session.id
         assert sorted(loaded_session.forwarding_chain) == sorted(TEST_FORWARDING_CHAIN)
 
+    def test_lazy_store_group_sessions(self, store):
+        account = store.load_account()
+        curve_key = account.identity_keys["curve25519"]
+
+        sessions = []
+        for room_id in (TEST_ROOM, TEST_ROOM, TEST_ROOM_2):
+            session = InboundGroupSession(
+                OutboundGroupSession().session_key,
+                account.identity_keys["ed25519"],
+                curve_key,
+                room_id,
+                TEST_FORWARDING_CHAIN if room_id == TEST_ROOM else [],
+            )
+            store.save_inbound_group_session(session)
+            sessions.append(session)
+
+        session_store = store.load_inbound_group_sessions(lazy=True, max_sessions=2)
+
+        assert session_store.get(TEST_ROOM_2, curve_key, sessions[0].id) is None
+
+        loaded = [session_store.get(s.room_id, curve_key, s.id) for s in sessions]
+        assert [s.id for s in loaded] == [s.id for s in sessions]
+        assert loaded[0].forwarding_chain == TEST_FORWARDING_CHAIN
+        assert loaded[2].forwarding_chain == []
+
+        # The least recently used session was evicted and gets loaded again.
+        assert session_store.get(TEST_ROOM_2, curve_key, sessions[2].id) is loaded[2]
+        assert session_store.get(TEST_ROOM, curve_key, sessions[0].id) is not loaded[0]
+
+        assert not session_store.add(loaded[2])
+        assert session_store.add(sessions[1])
+
+        assert sorted(s.id for s in session_store) == sorted(s.id for s in sessions)
+        assert set(session_store[TEST_ROOM][curve_key]) == {
+            sessions[0].id,
+            sessions[1].id,
+        }
+
+    def test_message_index_saving(self, store):
+        assert store.load_message_indices(BOB_CURVE, "session") is None
+
+        store.save_message_indices(
+            {(BOB_CURVE, "session"): b"indices", (BOB_CURVE, "other"): b"other"}
+        )
+        store.save_message_indices({(BOB_CURVE, "session"): b"updated"})
+
+        assert store.load_message_indices(BOB_CURVE, "session") == b"updated"
+        assert store.load_message_indices(BOB_CURVE, "other") == b"other"
+
+    def test_lazy_store_sessions(self, store):
+        account = store.load_account()
+
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+        store.save_session(BOB_CURVE, session)
+
+        session_store = store.load_sessions(lazy=True)
+
+        assert session_store.get(BOB_CURVE).id == session.id
+        assert session_store.get(BOB_ONETIME) is None
+        assert [s.id for s in session_store] == [session.id]
+
     def test_new_store_device_keys(self, store):
         store.load_account()
 
@@ -410,6 +498,73 @@ class TestClass:
         assert not bob_device.deleted
         assert len(device_store.users) == 11
 
+    def test_write_behind(self, store):
+        account = store.load_account()
+        store.write_behind = True
+
+        session = OutboundSession(account, BOB_CURVE, BOB_ONETIME)
+        store.save_session(BOB_CURVE, session)
+        store.save_session(BOB_CURVE, session)
+        store.save_sync_token("token1")
+        store.save_sync_token("token2")
+        store.save_device_keys(self.example_devices)
+
+        # Writes of the same object are coalesced.
+        assert len(store._queued_writes) == 2
+
+        # The queued writes hold a pickle instead of the live session.
+        assert not any(
+            arg is session
+            for write in store._queued_writes.values()
+            for arg in write.args
+        )
+
+        store2 = self.copy_store(store)
+        assert not store2.load_sessions().get(BOB_CURVE)
+        assert store2.load_sync_token() is None
+        assert not store2.load_device_keys().users
+
+        store.flush()
+        assert not store._queued_writes
+        assert store2.load_sessions().get(BOB_CURVE).id == session.id
+        assert store2.load_sync_token() == "token2"
+        assert len(store2.load_device_keys().users) == 11
+
+        # Reading from the store writes the queued changes first.
+        store.save_sync_token("token3")
+        assert store.load_sync_token() == "token3"
+        assert not store._queued_writes
+
+        store.max_queued_writes = 2
+        store.save_sync_token("token4")
+        assert store._queued_writes
+        store.save_session(BOB_CURVE, session)
+        assert not store._queued_writes
+
+        store.save_sync_token("token5")
+        store.close()
+        assert store2.load_sync_token() == "token5"
+
+    @pytest.mark.asyncio()
+    async def test_async_store(self, tempdir):
+        async_store = AsyncMatrixStore(
+            partial(DefaultStore, "ephemeral", "DEVICEID", tempdir)
+        )
+        assert await async_store.run(threading.get_ident) != threading.get_ident()
+        assert async_store.database_name == "ephemeral_DEVICEID.db"
+
+        await async_store.save_account(OlmAccount())
+        await async_store.save_sync_token("token")
+        assert async_store.blocking.load_sync_token() == "token"
+
+        # Calls made on the database thread don't wait for the queue.
+        assert await async_store.run(async_store.blocking.load_sync_token) == "token"
+
+        await async_store.close()
+
+        store = DefaultStore("ephemeral", "DEVICEID", tempdir)
+        assert store.load_sync_token() == "token"
+
     def test_new_saving_account_twice(self, store):
         account = store.load_account()
 
@@ -725,3 +880,108 @@ class TestClass:
         sqlstore.save_sync_token(token)
         loaded_token = sqlstore.load_sync_token()
         assert token == loaded_token
+
+    def test_room_state_saving(self, store):
+        room = MatrixRoom(TEST_ROOM, "ephemeral")
+        room.topic = "Test topic"
+        room.encrypted = True
+        room.power_levels.users[BOB_ID] = 100
+        room.add_member(BOB_ID, "Bob", None)
+        room.add_member("@carol:example.org", None, "mxc://example.org/carol", True)
+
+        store.save_rooms([room], {TEST_ROOM: set(room.users)})
+
+        loaded = store.load_rooms()
+        assert loaded.keys() == {TEST_ROOM}
+        loaded_room = loaded[TEST_ROOM]
+        assert loaded_room.topic == "Test topic"
+        assert loaded_room.encrypted
+        assert loaded_room.users[BOB_ID].power_level == 100
+        assert loaded_room.users[BOB_ID].display_name == "Bob"
+        assert loaded_room.invited_users.keys() == {"@carol:example.org"}
+        assert loaded_room.avatar_url("@carol:example.org") == "mxc://example.org/carol"
+
+        # Only the changed members are touched.
+        room.remove_member("@carol:example.org")
+        room.name = "Test room"
+        store.save_rooms([room], {TEST_ROOM: {"@carol:example.org"}})
+
+        loaded_room = store.load_rooms()[TEST_ROOM]
+        assert loaded_room.name == "Test room"
+        assert loaded_room.users.keys() == {BOB_ID}
+
+        store.delete_room(TEST_ROOM)
+        assert store.load_rooms() == {}
+
+    def test_database_profile(self, tempdir):
+        store = DefaultStore("ephemeral", "DEVICEID", tempdir)
+        assert store.database.execute_sql("PRAGMA secure_delete").fetchone() == (1,)
+        store.close()
+
+        for profile in (PROFILES["performance"], PROFILES["queue"]):
+            store = DefaultStore("ephemeral", "DEVICEID", tempdir, profile=profile)
+            pragmas = {
+                pragma: store.database.execute_sql(f"PRAGMA {pragma}").fetchone()[0]
+                for pragma in ("journal_mode", "synchronous", "secure_delete")
+            }
+            assert pragmas == {
+                "journal_mode": "wal",
+                "synchronous": 1,
+                "secure_delete": 0,
+            }
+
+            account = OlmAccount()
+            store.save_account(account)
+            store.save_sync_token(profile.queue and "queue" or "performance")
+            assert store.load_account().identity_keys == account.identity_keys
+            store.close()
+
+        store = DefaultStore("ephemeral", "DEVICEID", tempdir)
+        assert store.load_sync_token() == "queue"
+
+    @staticmethod
+    def _sessions_per_second(benchmark, count):
+        # There are no stats if the benchmarks are disabled.
+        if benchmark.stats is not None:
+            benchmark.extra_info["sessions/s"] = count / benchmark.stats.stats.min
+
+    @staticmethod
+    def _benchmark_store(tempdir, profile, sessions=()):
+        path = os.path.join(tempdir, str(len(os.listdir(tempdir))))
+        os.mkdir(path)
+
+        store = DefaultStore("ephemeral", "DEVICEID", path, profile=PROFILES[profile])
+        store.save_account(OlmAccount())
+
+        for session in sessions:
+            store.save_inbound_group_session(session)
+
+        return store
+
+    @pytest.mark.parametrize("profile", sorted(PROFILES))
+    def test_session_save_benchmark(self, benchmark, tempdir, group_sessions, profile):
+        stores = []
+
+        def setup():
+            stores.append(self._benchmark_store(tempdir, profile))
+            return (stores[-1],), {}
+
+        def save(store):
+            for session in group_sessions:
+                store.save_inbound_group_session(session)
+
+        benchmark.pedantic(save, setup=setup, rounds=5)
+        self._sessions_per_second(benchmark, len(group_sessions))
+
+        for store in stores:
+            store.close()
+
+    @pytest.mark.parametrize("profile", sorted(PROFILES))
+    def test_session_load_benchmark(self, benchmark, tempdir, group_sessions, profile):
+        store = self._benchmark_store(tempdir, profile, group_sessions)
+
+        loaded = benchmark.pedantic(store.load_inbound_group_sessions, rounds=5)
+        self._sessions_per_second(benchmark, len(group_sessions))
+        store.close()
+
+        assert sorted(s.id for s in loaded) == sorted(s.id for s in group_sessions)